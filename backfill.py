@@ -0,0 +1,93 @@
+from date_sorting import season_of, seasons_span
+from extract_data import is_file_existing, extract_team_name_from_url
+from manage_date import format_timestamp
+from manage_links import generate_links_game
+from save_data import save_odds_data
+from test_get_competition_match_history import get_competition_match_history
+from test_get_match_history import load_listing_urls
+from test_get_team_match_history import get_team_match_history
+from event_model import intern_text
+
+
+def consecutive_runs(seasons):
+    """Splits sorted seasons into runs of consecutive seasons, eg. 2015/2016, 2016/2017 | 2018/2019."""
+    runs = []
+    for season in seasons:
+        if runs and int(runs[-1][-1].split("/")[1]) == int(season.split("/")[0]):
+            runs[-1].append(season)
+        else:
+            runs.append([season])
+    return runs
+
+
+def split_by_season(events, seasons):
+    """Events by season of `seasons`, using their kickoff and the same boundary as the scraping."""
+    by_season = {season: [] for season in seasons}
+    for event in events:
+        season = season_of(format_timestamp(event.date_time), seasons)
+        if season is not None:
+            by_season[season].append(event)
+    return by_season
+
+
+async def backfill_history(p, browser, context, page, base_data, seasons, competition=None, team_link=None, spread=None,
+                           workers=4, matches_per_context=100):
+    """
+    Scrapes several seasons of a competition and/or a team in one run, skipping the seasons already saved.
+
+    Competition listings are per season, so each missing season of the competition
+    is listed and scraped in turn. The results listing of a team covers every season:
+    it is walked once for each run of consecutive missing seasons (see seasons_span),
+    every match is scraped once, and the matches are then sorted into their season
+    and saved in one file per season, as a single-season run would.
+    """
+    links_teams = []
+    if competition is not None:
+        region, competition_name = competition
+        for season in seasons:
+            if is_file_existing(region=region, competition=competition_name, season=season):
+                print(f"Competition '{competition_name}' data ({region}, {season}) already exists. Skipping this season.")
+                continue
+            season_url = generate_links_game([(region, competition_name)], season)[0]
+            game_urls = await load_listing_urls(page, season_url, season)
+            print(f"Found {len(game_urls or [])} game URLs for competition '{competition_name}' in season '{season}'.")
+            if not game_urls:
+                continue
+            odds_data = {
+                "sport": base_data["sport"],
+                "region": intern_text(region),
+                "competition": intern_text(competition_name),
+                "season": season,
+                "market": "1X2 and Fulltime result",
+                "bookmaker": base_data["bookmaker"],
+                "events": []
+            }
+            odds_data, links_teams = await get_competition_match_history(
+                browser, workers, game_urls, matches_per_context, odds_data, links_teams)
+            if odds_data["events"]:
+                save_odds_data(odds_data)
+        if spread != "team":
+            links_teams = []
+
+    if team_link is not None:
+        links_teams.append(team_link)
+
+    # teams missing the same seasons are scraped together
+    teams_by_runs = {}
+    for url_team in dict.fromkeys(links_teams):
+        team_name = extract_team_name_from_url(url_team)
+        missing = [season for season in seasons if not is_file_existing(type_historical="team", team=team_name, season=season)]
+        for run in consecutive_runs(missing):
+            teams_by_runs.setdefault(tuple(run), []).append(url_team)
+
+    for run, urls_teams in teams_by_runs.items():
+        span = seasons_span(list(run))
+        print(f"Walking the history of {len(urls_teams)} teams once for seasons {run[0]} to {run[-1]}")
+        odds_data_teams = {"sport": base_data["sport"], "season": span, "bookmaker": base_data["bookmaker"], "events": []}
+        list_data_teams, _, browser, context = await get_team_match_history(
+            context, browser, p, workers, urls_teams, matches_per_context, odds_data_teams, [], span)
+        for data_team in list_data_teams:
+            for season, events in split_by_season(data_team["events"], list(run)).items():
+                if events:
+                    save_odds_data(dict(data_team, season=season, events=events), type_historical="team")
+    return browser, context
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse, urlsplit
+
+# One Chromium per machine that the scraping processes connect to over CDP, instead of
+# launching their own. The leases endpoint, on the CDP port + 1, caps the number of
+# contexts opened at the same time by all the processes.
+#
+#   python browser_server.py --port 9222 --max-contexts 16
+#   pytest test_oddsportal.py --browser-server http://127.0.0.1:9222 ...
+
+LEASE_POLL_INTERVAL = 1
+DEFAULT_PORTS = {"http": 80, "https": 443}
+HTTP_SCHEMES = {"ws": "http", "wss": "https"}
+
+_server_url = None
+
+
+def configure_browser_server(url):
+    """Connects the browsers of this process to the server at `url` (eg. http://127.0.0.1:9222), None launches them locally."""
+    global _server_url
+    _server_url = url.rstrip("/") if url else None
+
+
+def lease_url(server_url):
+    """
+    The leases endpoint sits next to the CDP endpoint, on the following port (the
+    default port of the scheme when the URL has none, eg. behind a proxy).
+    """
+    parsed = urlsplit(server_url if "://" in server_url else f"http://{server_url}")
+    scheme = HTTP_SCHEMES.get(parsed.scheme, parsed.scheme)
+    port = parsed.port or DEFAULT_PORTS.get(scheme, 80)
+    host = f"[{parsed.hostname}]" if ":" in parsed.hostname else parsed.hostname
+    return f"{scheme}://{host}:{port + 1}"
+
+
+async def launch_browser(p, **kwargs):
+    """Connects to the shared browser server when configured, otherwise launches a local Chromium."""
+    if _server_url:
+        print(f"Connecting to the browser server at {_server_url}")
+        return await p.chromium.connect_over_cdp(_server_url)
+    return await p.chromium.launch(**kwargs)
+
+
+async def new_context(browser, **kwargs):
+    """
+    Creates an isolated context in `browser`.
+
+    With a browser server, a lease is taken first (waiting while the machine-wide
+    limit is reached) and given back when the context closes.
+    """
+    if not _server_url:
+        return await browser.new_context(**kwargs)
+
+    lease = await acquire_lease(_server_url)
+    try:
+        context = await browser.new_context(**kwargs)
+    except Exception:
+        await asyncio.to_thread(release_lease, _server_url, lease)
+        raise
+
+    async def release_on_close(_):
+        # the blocking request runs in a thread, not in the loop shared by every worker
+        await asyncio.to_thread(release_lease, _server_url, lease)
+
+    context.on("close", release_on_close)
+    return context
+
+
+def _lease_request(server_url, action, **params):
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    with urllib.request.urlopen(f"{lease_url(server_url)}/{action}?{query}", timeout=10) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+async def acquire_lease(server_url):
+    """Waits for a free context slot on the server and returns its lease id."""
+    waiting_since = None
+    while True:
+        try:
+            return (await asyncio.to_thread(_lease_request, server_url, "acquire", pid=os.getpid()))["lease"]
+        except urllib.error.HTTPError as e:
+            if e.code != 429:
+                raise
+        if waiting_since is None:
+            waiting_since = time.monotonic()
+            print("Context limit of the browser server reached, waiting for a free slot...")
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+
+def release_lease(server_url, lease):
+    try:
+        _lease_request(server_url, "release", lease=lease)
+    except Exception as e:
+        print(f"Failed to release context lease {lease}: {e}")
+
+
+def pid_alive(pid):
+    """Whether the process holding a lease is still running, so that crashed workers do not keep their slots."""
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ContextLeases:
+    """Machine-wide count of open contexts, one lease per context."""
+
+    def __init__(self, max_contexts):
+        self.max_contexts = max_contexts
+        self.leases = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, pid):
+        with self.lock:
+            if len(self.leases) >= self.max_contexts:
+                self.leases = {lease: holder for lease, holder in self.leases.items() if pid_alive(holder)}
+            if len(self.leases) >= self.max_contexts:
+                return None
+            lease = uuid.uuid4().hex
+            self.leases[lease] = pid
+            return lease
+
+    def release(self, lease):
+        with self.lock:
+            self.leases.pop(lease, None)
+
+    def status(self):
+        with self.lock:
+            return {"max_contexts": self.max_contexts, "open_contexts": len(self.leases)}
+
+
+def make_lease_handler(leases):
+    class LeaseHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            if parsed.path == "/acquire":
+                lease = leases.acquire(int(params.get("pid", 0)))
+                if lease is None:
+                    self._reply(429, {"error": "context limit reached"})
+                else:
+                    self._reply(200, {"lease": lease})
+            elif parsed.path == "/release":
+                leases.release(params.get("lease"))
+                self._reply(200, {"released": params.get("lease")})
+            elif parsed.path == "/status":
+                self._reply(200, leases.status())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return LeaseHandler
+
+
+async def serve(port, max_contexts, host="127.0.0.1", headless=True):
+    """Runs Chromium with its CDP endpoint on `port` and the leases endpoint on `port + 1` until interrupted."""
+    from playwright.async_api import async_playwright
+
+    leases = ContextLeases(max_contexts)
+    lease_server = ThreadingHTTPServer((host, port + 1), make_lease_handler(leases))
+    lease_server.daemon_threads = True
+    threading.Thread(target=lease_server.serve_forever, name="browser-leases", daemon=True).start()
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=headless,
+            args=[f"--remote-debugging-port={port}", f"--remote-debugging-address={host}"],
+        )
+        print(f"Browser server ready: --browser-server http://{host}:{port} (at most {max_contexts} contexts)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            lease_server.shutdown()
+            lease_server.server_close()
+            await browser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one shared Chromium for all the scraping processes of this machine")
+    parser.add_argument("--port", type=int, default=9222, help="CDP port, leases are served on the next port (default: 9222)")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--max-contexts", type=int, default=16, help="maximum number of contexts open at the same time (default: 16)")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.port, args.max_contexts, host=args.host, headless=not args.headed))
+    except KeyboardInterrupt:
+        print("Browser server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,19 @@ def pytest_addoption(parser):
     parser.addoption("--team", action="store", default=None, help="team name (eg. Machester United, PSG, Real madrid)")
     parser.addoption("--teamid", action="store", default=None, help="team id (eg. nVp0wiqd)")
     parser.addoption("--spread", action="store", default=None, help="data spread type (eg. completly, team)")
+    parser.addoption("--seasons", action="store", default=None, help="range of historical seasons scraped in one run, instead of --season (eg. 2015/2016-2024/2025)")
+    parser.addoption("--crawl-depth", action="store", default=2, help="maximum depth of the completly spread crawl (eg. 2: competition -> teams -> their competitions)")
     parser.addoption("--typegame", action="store", default="historcal", help="type of game links (eg. historical, upcoming)")
+    parser.addoption("--tracefile", action="store", default=None, help="write per-stage tracing spans to this JSON lines file (eg. logs/traces/run.jsonl)")
+    parser.addoption("--metrics-port", action="store", default=None, help="serve live metrics on 127.0.0.1:<port>/metrics (eg. 9100)")
+    parser.addoption("--compression", action="store", default=None, help="compress the saved datasets (eg. gzip, xz, bz2)")
+    parser.addoption("--browser-server", action="store", default=None, help="connect to the shared browser server instead of launching Chromium (eg. http://127.0.0.1:9222)")
+    parser.addoption("--base-url", action="store", default=None, help="site root of every link (eg. a local stand-in server, default https://www.oddsportal.com)")
+    parser.addoption("--profile-dir", action="store", default=None, help="write Playwright traces and sampled coroutine stacks of the sampled, slow and failed matches to this directory (eg. logs/profiles/run)")
+    parser.addoption("--profile-rate", action="store", default=0.0, help="fraction of the matches profiled whatever their duration (eg. 0.01)")
+    parser.addoption("--profile-slow", action="store", default=90, help="matches slower than this many seconds are always profiled (eg. 60)")
+    parser.addoption("--profile-snapshots", action="store_true", default=False, help="also record DOM snapshots in the Playwright traces of the profiled matches (heavy)")
+    parser.addoption("--listing-cache-ttl", action="store", default=6 * 3600, help="seconds a listing page is served from scraped_data/.cache/listings/, 0 to always walk the listings (eg. 86400)")
+    parser.addoption("--job-log", action="store", default=None, help="write every printed line as a structured JSON record to this rotating file (eg. logs/jobs/run.jsonl)")
+    parser.addoption("--job-log-max-bytes", action="store", default=20 * 1024 * 1024, help="size at which the job log is rotated, 5 older files being kept (eg. 52428800)")
+    parser.addoption("--metrics-file", action="store", default=None, help="periodically write live metrics to this JSON file (eg. logs/metrics/run.json)")
@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+
+# Lower values are popped first: finishing the matches of a dataset frees memory
+# and lets it be saved, listings are only opened when the workers need more work.
+PRIORITIES = {"match": 0, "team": 10, "competition": 20}
+
+
+class BloomFilter:
+    """
+    Memory-bounded seen-set.
+
+    Uses a fixed bit array sized for `capacity` keys at `error_rate` false
+    positives (1 million keys at 0.1% is about 1.8 MB), whatever the number of
+    keys actually added. A false positive only means a node is not crawled.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, bits=None, hashes=None):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.size = len(self.bits) * 8
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Adds a key, returns False if it was (probably) already present."""
+        added = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+    def to_dict(self):
+        return {"hashes": self.hashes, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(bits=bytearray(base64.b64decode(data["bits"])), hashes=data["hashes"])
+
+
+class CrawlFrontier:
+    """
+    Persistent prioritized frontier over the team/competition/match graph.
+
+    Nodes are dicts {"kind", "key", "depth", "payload"}. `push` ignores nodes
+    already seen or deeper than `max_depth`; `pop` returns the node with the
+    lowest (priority, insertion order). A popped node stays "in flight" until
+    `done` is called, so that nodes interrupted by a crash are queued again
+    when the frontier is reloaded from `path`.
+    """
+
+    def __init__(self, path=None, max_depth=2, seen_capacity=1_000_000, save_interval=30):
+        self.path = path
+        self.max_depth = max_depth
+        self.save_interval = save_interval
+        self.heap = []
+        self.in_flight = {}
+        self.owners = {}
+        self.seen = BloomFilter(seen_capacity)
+        self.counter = itertools.count()
+        self.last_save = time.time()
+        if path and os.path.exists(path):
+            self._load()
+
+    def push(self, kind, key, depth, payload=None, priority=None):
+        """Queues a node, returns False if it was already seen or is too deep."""
+        if depth > self.max_depth:
+            return False
+        if not self.seen.add(f"{kind}|{key}"):
+            return False
+        if priority is None:
+            priority = PRIORITIES[kind] + depth
+        node = {"kind": kind, "key": key, "depth": depth, "payload": payload or {}}
+        heapq.heappush(self.heap, (priority, next(self.counter), node))
+        return True
+
+    def pop(self):
+        """Returns the next node to process, or None if the queue is empty."""
+        if not self.heap:
+            return None
+        priority, order, node = heapq.heappop(self.heap)
+        self.in_flight[order] = (priority, node)
+        node["_order"] = order
+        return node
+
+    def done(self, node):
+        """Marks a popped node as processed."""
+        self.in_flight.pop(node.get("_order"), None)
+        if time.time() - self.last_save >= self.save_interval:
+            self.save()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def save(self):
+        """Writes the queue, the in-flight nodes, the owners and the seen-set to `path`."""
+        self.last_save = time.time()
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        queued = [(priority, node) for priority, _, node in self.heap]
+        queued += list(self.in_flight.values())
+        state = {
+            "queue": [{"priority": priority, "node": _public(node)} for priority, node in queued],
+            "owners": self.owners,
+            "seen": self.seen.to_dict(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.seen = BloomFilter.from_dict(state["seen"])
+        self.owners = state.get("owners", {})
+        for item in state["queue"]:
+            heapq.heappush(self.heap, (item["priority"], next(self.counter), item["node"]))
+        print(f"Crawl resumed from {self.path}: {len(self.heap)} nodes queued, {len(self.owners)} datasets in progress")
+
+
+def _public(node):
+    return {key: value for key, value in node.items() if not key.startswith("_")}
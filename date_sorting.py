@@ -48,3 +48,43 @@ def season_to_date(season: str) -> str | None:
         return date.strftime("%Y-%m-%d 00:00")
     except (ValueError, IndexError):
         return None
+
+
+def season_range(text: str) -> list[str]:
+    """
+    Expands a range of seasons, eg. "2015/2016-2017/2018" -> ["2015/2016", "2016/2017", "2017/2018"].
+    A single season is returned alone.
+    """
+    first, _, last = text.partition("-")
+    first_year = int(first.split("/")[0])
+    last_year = int((last or first).split("/")[0])
+    if last_year < first_year:
+        raise ValueError(f"Invalid season range: {text}")
+    return [f"{year}/{year + 1}" for year in range(first_year, last_year + 1)]
+
+
+def seasons_span(seasons: list[str]) -> str:
+    """
+    One season covering consecutive seasons, eg. ["2015/2016", "2016/2017"] -> "2015/2017":
+    check_season_position with it keeps the matches of all of them.
+    """
+    return f"{seasons[0].split('/')[0]}/{seasons[-1].split('/')[1]}"
+
+
+def season_of(date_str: str, seasons: list[str], season_boundary: str = "08-01") -> str | None:
+    """Season of `seasons` a date ("YYYY-MM-DD HH:MM") belongs to, or None."""
+    for season in seasons:
+        if check_season_position(season, date_str, season_boundary) == 2:
+            return season
+    return None
+
+
+def span_seasons(season: str) -> list[str]:
+    """Seasons covered by a span (see seasons_span), eg. "2015/2017" -> ["2015/2016", "2016/2017"], a season alone otherwise."""
+    try:
+        start_year, end_year = map(int, season.split('/'))
+    except (ValueError, AttributeError):
+        return [season]
+    if end_year - start_year <= 1:
+        return [season]
+    return [f"{year}/{year + 1}" for year in range(start_year, end_year)]
@@ -0,0 +1,154 @@
+import contextvars
+import json
+import logging
+import os
+from datetime import datetime
+import job_log
+
+# Failed or partially extracted matches, appended as JSON lines:
+# {"at", "url", "stage", "error", "dataset"} for a failure, {"at", "url", "resolved": true}
+# once the match was scraped completely. `load_dead_letters` folds them by URL.
+DEAD_LETTERS_FILE = ".dead_letters.jsonl"
+DATASET_FIELDS = ("type", "sport", "region", "competition", "team", "season", "market", "bookmaker")
+
+_base_dir = None
+_open_urls_cache = {}
+# matches scraped completely in this process, resolved once their dataset is written (see resolve_saved)
+_complete_urls = set()
+# Dataset (see dataset_header) the match being scraped belongs to
+current_dataset = contextvars.ContextVar("current_dataset", default=None)
+
+
+def configure_dead_letters(base_dir):
+    """
+    Enables the dead-letter store of the current process in `base_dir` (eg. scraped_data).
+    When it is not configured (eg. upcoming matches, which are polled again anyway),
+    failures are not recorded.
+    """
+    global _base_dir
+    _base_dir = base_dir
+
+
+def dead_letters_path(base_dir=None):
+    return os.path.join(base_dir or _base_dir or "scraped_data", DEAD_LETTERS_FILE)
+
+
+def dataset_header(odds_data, type_historical="competition"):
+    """The fields identifying the dataset a match is saved in, eg. to merge it back after a re-scrape."""
+    header = {field: odds_data.get(field) for field in DATASET_FIELDS if odds_data.get(field) is not None}
+    header["type"] = type_historical
+    if type_historical == "team":
+        header.pop("region", None)
+        header.pop("competition", None)
+    return header
+
+
+def _append(record, base_dir=None):
+    path = dead_letters_path(base_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def record(url, stage, error=None):
+    """
+    Records a failed (or partially extracted) match of the current dataset.
+    This is where a failed match is logged, once: the scraping code only
+    prints its retries and calls this when it gives the match up.
+    """
+    # partially extracted matches are saved anyway
+    job_log.report(logging.WARNING if stage == "odds_partial" else logging.ERROR,
+                   f"Match failed at {stage}: {url}: {str(error)[:300] if error else stage}",
+                   exc_info=error if isinstance(error, BaseException) else None,
+                   url=url, stage=stage, dataset=current_dataset.get())
+    if _base_dir is None:
+        return
+    try:
+        _append({
+            "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "url": url,
+            "stage": stage,
+            "error": str(error)[:300] if error else None,
+            "dataset": current_dataset.get(),
+        })
+    except OSError as e:
+        print(f"Failed to record dead letter for {url}: {e}")
+        return
+    if dead_letters_path() in _open_urls_cache:
+        _open_urls_cache[dead_letters_path()].add(url)
+
+
+def resolve(url, base_dir=None):
+    """Marks a match as scraped completely, if it was recorded as failed before."""
+    if (base_dir or _base_dir) is None or url not in _open_urls(base_dir):
+        return
+    try:
+        _append({"at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "url": url, "resolved": True}, base_dir)
+    except OSError as e:
+        print(f"Failed to resolve dead letter for {url}: {e}")
+    _open_urls_cache.get(dead_letters_path(base_dir), set()).discard(url)
+
+
+def mark_complete(url):
+    """The match was scraped completely: its dead letter is resolved once it is saved (see resolve_saved)."""
+    if _base_dir is not None and url in _open_urls():
+        _complete_urls.add(url)
+
+
+def resolve_saved(urls, base_dir=None):
+    """
+    Resolves the dead letters of the matches just written to disk that were
+    scraped completely, so that a run stopped before saving retries them.
+    """
+    for url in urls:
+        if url in _complete_urls:
+            _complete_urls.discard(url)
+            resolve(url, base_dir)
+
+
+def _open_urls(base_dir=None):
+    """URLs of the open dead letters, read once per process (a resolved match is never recorded twice)."""
+    path = dead_letters_path(base_dir)
+    if path not in _open_urls_cache:
+        _open_urls_cache[path] = set(load_dead_letters(base_dir))
+    return _open_urls_cache[path]
+
+
+def load_dead_letters(base_dir=None):
+    """
+    Returns the open dead letters by URL: the last failure of each match not
+    resolved since, with the number of failures recorded for it ("attempts").
+    """
+    path = dead_letters_path(base_dir)
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # interrupted write
+                continue
+            url = entry.get("url")
+            if entry.get("resolved"):
+                entries.pop(url, None)
+                continue
+            attempts = (entries[url]["attempts"] if url in entries else 0) + entry.get("attempts", 1)
+            if entry.get("dataset") is None and url in entries:
+                entry["dataset"] = entries[url]["dataset"]
+            entries[url] = dict(entry, attempts=attempts)
+    return entries
+
+
+def compact_dead_letters(base_dir=None):
+    """Rewrites the store with the open dead letters only."""
+    entries = load_dead_letters(base_dir)
+    path = dead_letters_path(base_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries.values():
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    _open_urls_cache.pop(path, None)
+    return entries
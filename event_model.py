@@ -0,0 +1,80 @@
+import sys
+from array import array
+from manage_date import format_odds_points, format_timestamp
+
+ODDS_KEYS = ("home_win_odds", "draw_odds", "away_win_odds")
+
+
+def intern_text(text):
+    """Interns team, competition, region and bookmaker names so that every event shares one string."""
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class EventRecord:
+    """
+    Compact in-memory representation of a scraped match.
+
+    The odds movements of the three outcomes are stored back to back in one
+    array('q') of timestamps and one array('d') of values; `odds_ends` holds the
+    end index of each outcome. Dates are timestamps (see manage_date) and are
+    only formatted by `to_dict`, which returns the JSON output format.
+    """
+
+    __slots__ = ("url", "home_team", "away_team", "date_time", "score",
+                 "region", "competition", "timestamps", "values", "odds_ends")
+
+    def __init__(self, url, home_team, away_team, date_time, score, region=None, competition=None):
+        self.url = url
+        self.home_team = intern_text(home_team)
+        self.away_team = intern_text(away_team)
+        self.date_time = date_time
+        self.score = intern_text(score)
+        self.region = intern_text(region)
+        self.competition = intern_text(competition)
+        self.timestamps = array('q')
+        self.values = array('d')
+        self.odds_ends = (0,) * len(ODDS_KEYS)
+
+    def set_odds(self, series_by_key):
+        """
+        Stores the odds movements of the match.
+
+        Args:
+            series_by_key (dict): {"home_win_odds": (timestamps, values), ...}, missing keys are empty
+        """
+        timestamps = array('q')
+        values = array('d')
+        ends = []
+        for key in ODDS_KEYS:
+            series = series_by_key.get(key)
+            if series:
+                timestamps.extend(series[0])
+                values.extend(series[1])
+            ends.append(len(timestamps))
+        self.timestamps = timestamps
+        self.values = values
+        self.odds_ends = tuple(ends)
+
+    def odds_series(self, key):
+        """Returns the (timestamps, values) arrays of one outcome, eg. "draw_odds"."""
+        index = ODDS_KEYS.index(key)
+        start = self.odds_ends[index - 1] if index else 0
+        end = self.odds_ends[index]
+        return self.timestamps[start:end], self.values[start:end]
+
+    def to_dict(self):
+        """Serializes the event to the JSON output format."""
+        event = {
+            "home_team": self.home_team,
+            "away_team": self.away_team,
+            "date_time": format_timestamp(self.date_time),
+            "score": self.score,
+            "odds": {key: format_odds_points(*self.odds_series(key)) for key in ODDS_KEYS},
+        }
+        if self.region is not None:
+            event["region"] = self.region
+        if self.competition is not None:
+            event["competition"] = self.competition
+        if self.url:
+            event["url"] = self.url
+        return event
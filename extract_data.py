@@ -1,6 +1,8 @@
 from urllib.parse import urlparse 
 import re
 import os
+from save_data import is_data_file
+from manage_links import site_url
 
 def extract_region_competition(url: str):
     """
@@ -47,6 +49,20 @@ def extract_id_from_url(url: str) -> str | None:
     parts = [seg for seg in p.path.split('/') if seg]
     return parts[-1] if parts else None
 
+def extract_match_id(url: str) -> str | None:
+    """
+    Returns the OddsPortal id of a match from its URL,
+    or None if the URL has no id.
+    Example: '.../premier-league-2023-2024/arsenal-chelsea-xYz12AbC/' -> 'xYz12AbC'
+    """
+
+    if not url:
+        return None
+    last_segment = extract_id_from_url(url)
+    if not last_segment or '-' not in last_segment:
+        return None
+    return last_segment.rsplit('-', 1)[1] or None
+
 def extract_team_name_from_url(url: str) -> str | None:
     """
     Returns the team name from a team URL.
@@ -104,7 +120,7 @@ def is_file_existing(base_dir="scraped_data", type_historical="competition", reg
 
     files_lower = [f.lower() for f in os.listdir(base_dir)]
     for filename in files_lower:
-        if not filename.endswith(".json"):
+        if not is_data_file(filename):
             continue
 
         # Filter by region/competition/team
@@ -143,5 +159,5 @@ def build_team_url(sport: str, team_name: str, team_id: str) -> str:
     """
 
     formatted_team_name = team_name.strip().lower().replace(" ", "-")
-    url = f"https://www.oddsportal.com/{sport}/team/{formatted_team_name}/{team_id}/"
+    url = site_url(f"/{sport}/team/{formatted_team_name}/{team_id}/")
     return url
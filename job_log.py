@@ -0,0 +1,209 @@
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import sys
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Structured log of a job: one JSON record {"at", "level", "message", "url",
+# "stage", ...} per line in a rotating file, with the match URL and the stage of
+# the coroutine that logged it (see log_context and tracing.span), so that the
+# errors of a multi-hour run can be filtered by match or stage without reading
+# the whole output. Failures are logged with their level once, by the code that
+# gives up on them (see warning and error; a failed match by dead_letters.record),
+# the other printed lines are kept as INFO records.
+
+JOB_LOG_MAX_BYTES = 20 * 1024 * 1024
+JOB_LOG_BACKUPS = 5
+MAX_LINE_LENGTH = 10000
+
+_fields = contextvars.ContextVar("log_fields", default={})
+_logger = logging.getLogger("oddsportal.job")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_handler = None
+_capture = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "at": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class PrintCapture:
+    """Writes through to `stream` and logs every complete line written to it as INFO."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = ""
+
+    def write(self, text):
+        written = self.stream.write(text)
+        if "\n" in text:
+            *lines, self.pending = (self.pending + text).split("\n")
+            for line in lines:
+                if line.strip():
+                    log(logging.INFO, line.rstrip())
+        else:
+            self.pending += text
+            if len(self.pending) > MAX_LINE_LENGTH:
+                log(logging.INFO, self.pending)
+                self.pending = ""
+        return written
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def configure_job_log(path, max_bytes=JOB_LOG_MAX_BYTES, backups=JOB_LOG_BACKUPS):
+    """
+    Enables the structured log of the current process in `path`, rotated once it
+    reaches `max_bytes` (`backups` older files are kept as path.1, path.2, ...).
+    The lines printed to stdout are still printed, and logged as INFO. When it
+    is not configured, `log` does nothing.
+    """
+    global _handler, _capture
+    close_job_log()
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    _handler.setFormatter(JsonFormatter())
+    _logger.addHandler(_handler)
+    _capture = PrintCapture(sys.stdout)
+    sys.stdout = _capture
+
+
+def close_job_log():
+    global _handler, _capture
+    if _capture is not None:
+        if sys.stdout is _capture:
+            sys.stdout = _capture.stream
+        _capture = None
+    if _handler is not None:
+        _logger.removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+
+def log(level, message, exc_info=None, **fields):
+    """Writes a record with the fields of the current log context, eg. log(logging.ERROR, "...", stage="tooltip")."""
+    if _handler is None:
+        return
+    _logger.log(level, message, exc_info=exc_info, extra={"fields": {**_fields.get(), **fields}})
+
+
+def report(level, message, exc_info=None, **fields):
+    """Prints `message` and logs it with `level`, the printed line not being logged a second time as INFO."""
+    print(message, file=_capture.stream if _capture is not None else sys.stdout)
+    log(level, message, exc_info, **fields)
+
+
+def info(message, **fields):
+    """Same as print, with `fields` added to the INFO record."""
+    report(logging.INFO, message, **fields)
+
+
+def warning(message, **fields):
+    report(logging.WARNING, message, **fields)
+
+
+def error(message, exc_info=None, **fields):
+    """Same as warning, `exc_info` (the exception) adding its traceback to the record."""
+    report(logging.ERROR, message, exc_info, **fields)
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Adds `fields` to the records logged in the block, by this coroutine and the
+    tasks it starts, eg. `with log_context(url=game_url): ...`.
+    """
+    token = bind(**fields)
+    try:
+        yield
+    finally:
+        unbind(token)
+
+
+def bind(**fields):
+    """Same as log_context, for code that cannot be indented in a block: returns the token of `unbind`."""
+    return _fields.set({**_fields.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+
+def unbind(token):
+    _fields.reset(token)
+
+
+def log_files(path):
+    """The rotated files of a log and the log itself, oldest first."""
+    backups = [p for p in glob.glob(f"{glob.escape(path)}.*") if p.rsplit(".", 1)[1].isdigit()]
+    backups.sort(key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    return backups + ([path] if os.path.exists(path) else [])
+
+
+def iter_records(path):
+    """Every record of a log and its rotated files, oldest first."""
+    for file_path in log_files(path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of a log still being written
+                    continue
+
+
+def matches(record, level=None, url=None, stage=None, text=None):
+    if level and logging.getLevelName(record.get("level", "INFO")) < logging.getLevelName(level):
+        return False
+    if url and url not in (record.get("url") or ""):
+        return False
+    if stage and record.get("stage") != stage:
+        return False
+    return not text or text.lower() in record.get("message", "").lower()
+
+
+def last_records(path, count=5, **filters):
+    """The last `count` records of a log matching the filters (see matches), read without keeping the rest."""
+    return list(deque((record for record in iter_records(path) if matches(record, **filters)), maxlen=count))
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Filter the structured log of a job (logs/jobs/*.jsonl)')
+    parser.add_argument('path', help='Log file of a job, its rotated files are read too')
+    parser.add_argument('--level', default=None, choices=['INFO', 'WARNING', 'ERROR'],
+                       help='Minimum level of the records')
+    parser.add_argument('--url', default=None, help='Part of the match URL (eg. the match id)')
+    parser.add_argument('--stage', default=None, help='Stage of the records (eg. tooltip_wait, goto, listing)')
+    parser.add_argument('--grep', default=None, help='Text of the message')
+    parser.add_argument('--last', type=int, default=None, help='Only the last N records')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    filters = {"level": args.level, "url": args.url, "stage": args.stage, "text": args.grep}
+    records = (record for record in iter_records(args.path) if matches(record, **filters))
+    if args.last:
+        records = deque(records, maxlen=args.last)
+    for record in records:
+        context = " ".join(f"{key}={record[key]}" for key in ("stage", "url") if record.get(key))
+        print(f"{record['at']} {record['level']:<7} {record['message']}" + (f"  [{context}]" if context else ""))
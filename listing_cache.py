@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import time
+
+# Rows of the listing pages already walked ({"href", "date", "time"} as read by
+# LISTING_ROWS_SCRIPT), one file per listing URL and page number, so that the
+# listings of a team or a competition are not paginated again for every season
+# or configuration. Files are replaced atomically and shared by every worker and job.
+
+LISTING_CACHE_DIR = os.path.join("scraped_data", ".cache", "listings")
+LISTING_CACHE_TTL = 6 * 3600
+
+_directory = None
+_ttl = LISTING_CACHE_TTL
+
+
+def configure_listing_cache(directory=LISTING_CACHE_DIR, ttl=LISTING_CACHE_TTL):
+    """
+    Enables the listing cache of the current process in `directory`, a page
+    being read again from the site once it is older than `ttl` seconds.
+    When it is not configured (None), every listing is walked on the site.
+    """
+    global _directory, _ttl
+    _directory = directory
+    _ttl = ttl
+
+
+def listing_cache_enabled():
+    return _directory is not None
+
+
+def listing_key(url):
+    """Listings are the same page whatever the fragment of their URL."""
+    return url.split("#")[0].rstrip("/")
+
+
+def cache_path(url, page_number):
+    name = hashlib.sha1(f"{listing_key(url)}|{page_number}".encode("utf-8")).hexdigest()
+    return os.path.join(_directory, name[:2], f"{name}.json")
+
+
+def get_listing_page(url, page_number):
+    """Cached page of a listing ({"rows", "has_next_page", "at"}), or None if missing or expired."""
+    if _directory is None:
+        return None
+    try:
+        with open(cache_path(url, page_number), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("at", 0) > _ttl:
+        return None
+    return entry
+
+
+def put_listing_page(url, page_number, rows, has_next_page=True):
+    if _directory is None:
+        return
+    path = cache_path(url, page_number)
+    entry = {"url": listing_key(url), "page": page_number, "at": time.time(), "has_next_page": has_next_page, "rows": rows}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to cache page {page_number} of {url}: {e}")
+
+
+def mark_last_page(url, page_number):
+    """The listing has no page after `page_number`."""
+    entry = get_listing_page(url, page_number)
+    if entry is not None and entry["has_next_page"]:
+        put_listing_page(url, page_number, entry["rows"], has_next_page=False)
+
+
+def cached_listing_pages(url):
+    """Fresh cached pages of a listing from the first one, as (page_number, entry), until one is missing."""
+    page_number = 1
+    while True:
+        entry = get_listing_page(url, page_number)
+        if entry is None:
+            return
+        yield page_number, entry
+        if not entry["has_next_page"]:
+            return
+        page_number += 1
+
@@ -1,6 +1,24 @@
-from datetime import datetime
+from array import array
+from datetime import datetime, timedelta
 import re
 
+# Mapping months
+MONTH_MAP = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# unical regex pattern to capture date components
+DATE_PATTERN = re.compile(r'(?:(\w+),)?\s*(\d{1,2})\s+(\w+)(?:\s+(\d{4}))?[,\s]*(\d{1,2}):(\d{2})', re.IGNORECASE)
+
+# one odds movement point as displayed in the tooltip, e.g. "16 Aug, 20:451.85"
+ODDS_MOVEMENT_PATTERN = re.compile(r"(\d{1,2}) (\w{3,}), (\d{2}):(\d{2})([0-9]+\.[0-9]+)")
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECONDS_PER_DAY = 86400
+
+
 def parse_oddsportal_date_to_datetime(date_str, reference_date=None):
     """
     Parses OddsPortal dates into datetime objects.
@@ -22,16 +40,7 @@ def parse_oddsportal_date_to_datetime(date_str, reference_date=None):
     
     date_str = date_str.strip().lower()
     
-    # Mapping months
-    month_map = {
-        'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-        'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
-    }
-    
-    # unical regex pattern to capture date components
-    pattern = r'(?:(\w+),)?\s*(\d{1,2})\s+(\w+)(?:\s+(\d{4}))?[,\s]*(\d{1,2}):(\d{2})'
-    
-    match = re.search(pattern, date_str, re.IGNORECASE)
+    match = DATE_PATTERN.search(date_str)
     if not match:
         return None
     
@@ -41,7 +50,7 @@ def parse_oddsportal_date_to_datetime(date_str, reference_date=None):
     try:
         # Convert components to integers
         day = int(day_str)
-        month = month_map.get(month_str.lower()[:3])
+        month = MONTH_MAP.get(month_str.lower()[:3])
         if not month:
             return None
         
@@ -75,4 +84,99 @@ def add_missing_year(odds_date_input, match_datetime):
     if dt is None:
         print(f"Failed to parse date: {odds_date_input} with reference {match_datetime}")
         return None
-    return dt.strftime("%Y-%m-%d %H:%M")
\ No newline at end of file
+    return dt.strftime("%Y-%m-%d %H:%M")
+
+
+def parse_odds_movement(odds_text, match_datetime, _ordinals=None):
+    """
+    Parses every odds movement point of one odds cell tooltip in a single pass.
+
+    The year of each point is resolved against the match datetime the same way
+    as `add_missing_year`, but the reference date is parsed only once and the
+    day ordinals are cached per (year, month, day).
+
+    Args:
+        odds_text (str): Text content of the "Odds movement" block
+        match_datetime (str | datetime): Match date in the format "YYYY-MM-DD HH:MM"
+
+    Returns:
+        tuple: (array('q') of timestamps in seconds since 1970-01-01, array('d') of odds values)
+    """
+    timestamps = array('q')
+    values = array('d')
+    if not odds_text:
+        return timestamps, values
+
+    if isinstance(match_datetime, str):
+        match_datetime = datetime.strptime(match_datetime, "%Y-%m-%d %H:%M")
+    reference_year = match_datetime.year
+    reference_ts = datetime_to_timestamp(match_datetime)
+    ordinals = {} if _ordinals is None else _ordinals
+
+    for day_str, month_str, hour_str, minute_str, value in ODDS_MOVEMENT_PATTERN.findall(odds_text):
+        month = MONTH_MAP.get(month_str[:3].lower())
+        if not month:
+            print(f"Failed to parse date: {day_str} {month_str}, {hour_str}:{minute_str} with reference {match_datetime}")
+            continue
+        day = int(day_str)
+        seconds_in_day = int(hour_str) * 3600 + int(minute_str) * 60
+        try:
+            ts = _day_seconds(ordinals, reference_year, month, day) + seconds_in_day
+
+            # Adjust year if the date is more than 6 months away
+            days_diff = (ts - reference_ts) // SECONDS_PER_DAY
+            if days_diff > 180:
+                ts = _day_seconds(ordinals, reference_year - 1, month, day) + seconds_in_day
+            elif days_diff < -180:
+                ts = _day_seconds(ordinals, reference_year + 1, month, day) + seconds_in_day
+        except ValueError:
+            print(f"Failed to parse date: {day_str} {month_str}, {hour_str}:{minute_str} with reference {match_datetime}")
+            continue
+
+        timestamps.append(ts)
+        values.append(float(value))
+
+    return timestamps, values
+
+
+def parse_odds_movements(odds_texts, match_datetime):
+    """
+    Batch version of `parse_odds_movement` for several odds cells of the same match.
+
+    Returns:
+        list: one (timestamps, values) tuple per tooltip text, in the same order
+    """
+    if isinstance(match_datetime, str):
+        match_datetime = datetime.strptime(match_datetime, "%Y-%m-%d %H:%M")
+    ordinals = {}
+    return [parse_odds_movement(text, match_datetime, ordinals) for text in odds_texts]
+
+
+def format_odds_points(timestamps, values):
+    """
+    Converts typed odds movement arrays back to the JSON output format.
+    Example: ([1723841100], [1.85]) -> [{"value": 1.85, "date_time": "2024-08-16 20:45"}]
+    """
+    return [
+        {"value": value, "date_time": format_timestamp(ts)}
+        for ts, value in zip(timestamps, values)
+    ]
+
+
+def format_timestamp(ts):
+    """Formats a timestamp produced by `parse_odds_movement` as "YYYY-MM-DD HH:MM"."""
+    return (EPOCH + timedelta(seconds=ts)).strftime("%Y-%m-%d %H:%M")
+
+
+def datetime_to_timestamp(dt):
+    """Converts a naive datetime to seconds since 1970-01-01, the unit used by the odds arrays."""
+    return (dt.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY + dt.hour * 3600 + dt.minute * 60
+
+
+def _day_seconds(ordinals, year, month, day):
+    key = (year, month, day)
+    seconds = ordinals.get(key)
+    if seconds is None:
+        seconds = (datetime(year, month, day).toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+        ordinals[key] = seconds
+    return seconds
@@ -1,5 +1,21 @@
 import re
 
+# Site root of every generated link, can point to a local stand-in server for testing
+BASE_URL = "https://www.oddsportal.com"
+
+def configure_base_url(url):
+    """Sets the site root used for every link (eg. http://127.0.0.1:8000), None restores oddsportal.com."""
+    global BASE_URL
+    BASE_URL = url.rstrip("/") if url else "https://www.oddsportal.com"
+
+def site_url(path=""):
+    """Absolute URL of a site path, eg. site_url("/football/") -> "https://www.oddsportal.com/football/"."""
+    return BASE_URL + path
+
+def absolute_url(href):
+    """Links of the listings are relative to the site root."""
+    return href if href.startswith("http") else site_url(href)
+
 async def get_team_links(page):
     """Retrieves team links from the match page"""
     home_team_link = await page.get_attribute("[data-testid='game-host'] a", "href")
@@ -10,7 +26,7 @@ async def get_competition_link(page):
     """Retrieves competition link from the match page"""
     await page.wait_for_selector("a[data-testid='3']", timeout=10000)
     competition_link = await page.get_attribute("a[data-testid='3']", "href")
-    return "https://www.oddsportal.com" + competition_link
+    return site_url(competition_link)
 
 def generate_links_game(data, season=None, type_game="historcal"):
     """
@@ -34,7 +50,7 @@ def generate_links_game(data, season=None, type_game="historcal"):
     if season is None and type_game == "historcal":
         raise ValueError("Season must be provided for historical game links.")
     
-    base_url = "https://www.oddsportal.com/football"
+    base_url = site_url("/football")
     links = []
     for country, competition in data:
         country_slug = country.lower()
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+import metrics
+
+# Sampled debugging artifacts of single matches: a Playwright trace chunk of the
+# match's browser context and the stacks of the coroutine scraping it, sampled by
+# a task of the event loop. This is not a CPU profile: it shows where the
+# coroutine is suspended, mostly on Playwright, not what the interpreter runs.
+# Every match is recorded while profiling is enabled, but the artifacts are only
+# written for the sampled matches, the slow ones and the failed ones. The trace
+# keeps the actions and the network only; DOM snapshots on every navigation are
+# too heavy to record for every match, so they are opt-in.
+
+SAMPLE_INTERVAL = 0.1
+SLOW_MATCH_SECONDS = 90
+
+_directory = None
+_sample_rate = 0.0
+_slow_seconds = SLOW_MATCH_SECONDS
+_snapshots = False
+# contexts whose tracing was started, and the ones recording a chunk: one chunk at a time per context
+_tracing_contexts = set()
+_busy_contexts = set()
+
+
+def configure_profiling(directory, sample_rate=0.0, slow_seconds=SLOW_MATCH_SECONDS, snapshots=False):
+    """
+    Enables match profiling for the current process: the artifacts of a
+    `sample_rate` fraction of the matches, and of every match slower than
+    `slow_seconds` or failed, are written to `directory`. The traces only
+    record DOM snapshots with `snapshots`. When it is not configured,
+    `profile_match` does nothing.
+    """
+    global _directory, _sample_rate, _slow_seconds, _snapshots
+    _directory = directory
+    _sample_rate = float(sample_rate or 0.0)
+    _slow_seconds = float(slow_seconds if slow_seconds is not None else SLOW_MATCH_SECONDS)
+    _snapshots = bool(snapshots)
+    _tracing_contexts.clear()
+    _busy_contexts.clear()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def profiling_enabled():
+    return _directory is not None
+
+
+def artifact_name(url):
+    """File name prefix of the artifacts of a match: time and URL path, eg. 20250101_120000_football_england_..._AbCd1234."""
+    path = re.sub(r"^https?://[^/]+", "", url or "")
+    slug = re.sub(r"[^A-Za-z0-9-]+", "_", path).strip("_")[-120:] or "match"
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{slug}"
+
+
+def coroutine_stack(coro):
+    """Frames of a coroutine chain, outermost first, down to the awaitable it is suspended on."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+class StackSampler:
+    """
+    Samples the coroutine stack of an asyncio task every `interval` seconds,
+    from a task of the same loop: it shows where a match spends its wall-clock
+    time, which is mostly waiting on Playwright, for a few frames walked per sample.
+    """
+
+    def __init__(self, task, interval=SAMPLE_INTERVAL):
+        self.task = task
+        self.interval = interval
+        self.samples = Counter()
+        self.sampler = None
+
+    def start(self):
+        self.sampler = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.sampler is not None:
+            self.sampler.cancel()
+            await asyncio.gather(self.sampler, return_exceptions=True)
+            self.sampler = None
+
+    async def _run(self):
+        while not self.task.done():
+            await asyncio.sleep(self.interval)
+            stack = coroutine_stack(self.task.get_coro())
+            if stack:
+                self.samples[";".join(stack)] += 1
+
+    def write(self, path, header=""):
+        """Collapsed stacks (`frame;frame;frame count`, the flame graph format), most frequent first."""
+        with open(path, "w", encoding="utf-8") as f:
+            if header:
+                f.write(f"# {header}\n")
+            f.write(f"# {sum(self.samples.values())} samples every {self.interval} s\n")
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+async def _start_trace_chunk(context):
+    if context is None or id(context) in _busy_contexts:
+        # another match of this context is already recorded, this one only gets its stack samples
+        return False
+    try:
+        if id(context) not in _tracing_contexts:
+            await context.tracing.start(snapshots=_snapshots, screenshots=False, sources=False)
+            _tracing_contexts.add(id(context))
+            context.on("close", lambda _: _tracing_contexts.discard(id(context)))
+        await context.tracing.start_chunk()
+    except Exception as e:
+        print(f"Failed to start the Playwright trace: {e}")
+        return False
+    _busy_contexts.add(id(context))
+    return True
+
+
+async def _stop_trace_chunk(context, path):
+    _busy_contexts.discard(id(context))
+    try:
+        if path:
+            await context.tracing.stop_chunk(path=path)
+        else:
+            await context.tracing.stop_chunk()
+    except Exception as e:
+        print(f"Failed to stop the Playwright trace: {e}")
+
+
+@asynccontextmanager
+async def profile_match(context, url):
+    """
+    Records the match scraped in the block. The caller sets `capture["outcome"]`
+    ("ok", "before_season", ...): anything else, or an exception, is a failure.
+
+    Example:
+        async with profile_match(context, url) as capture:
+            ...
+            capture["outcome"] = "ok"
+    """
+    capture = {"outcome": None}
+    if _directory is None:
+        yield capture
+        return
+
+    sampled = random.random() < _sample_rate
+    traced = await _start_trace_chunk(context)
+    sampler = StackSampler(asyncio.current_task())
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield capture
+    except asyncio.CancelledError:
+        # dropped by its pool (see MatchPool.cancel_after), not a failure
+        capture["outcome"] = "cancelled"
+        raise
+    except BaseException:
+        capture["outcome"] = capture["outcome"] or "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        await sampler.stop()
+        if capture["outcome"] not in ("ok", "before_season", "cancelled"):
+            reason = "failed"
+        elif duration >= _slow_seconds:
+            reason = "slow"
+        elif sampled:
+            reason = "sampled"
+        else:
+            reason = None
+
+        prefix = os.path.join(_directory, f"{artifact_name(url)}_{reason}") if reason else None
+        if traced:
+            await _stop_trace_chunk(context, f"{prefix}.trace.zip" if prefix else None)
+        if prefix:
+            try:
+                sampler.write(f"{prefix}.profile.txt", f"{url} {reason} in {duration:.1f} s, outcome {capture['outcome']}")
+            except OSError as e:
+                print(f"Failed to write the stack samples of {url}: {e}")
+            print(f"Profile of {url} ({reason}, {duration:.1f} s) written to {prefix}.*")
+            metrics.inc("match_profiles_total", reason=reason)
@@ -0,0 +1,271 @@
+import asyncio
+import re
+from test_website_navigation import goto_with_retry, remove_overlays, handle_cookie_consent
+from manage_date import parse_odds_movements, parse_oddsportal_date_to_datetime, datetime_to_timestamp
+from manage_links import get_team_links, get_competition_link
+from extract_data import extract_region_competition
+from date_sorting import check_season_position
+from tracing import span, traced, span_attrs
+import metrics
+from event_model import EventRecord, ODDS_KEYS
+from retry_policy import with_match_budget, current_budget, backoff
+import dead_letters
+import job_log
+from match_profiler import profile_match
+
+# Scraping of one match page (header, odds movements), shared by the scrapers of
+# competitions, teams and upcoming matches and by the worker pools.
+
+@traced("match_details", url=lambda args: args["game_url"])
+@with_match_budget
+async def get_match_details(game_page, game_url, bookmaker_name, season): 
+    """
+    Asynchronously retrieves detailed information for a single match.
+    Handles odds extraction that appears on hover.
+
+    Every retry of the match (navigation, main elements, odds cells, tooltips)
+    takes from one RetryBudget, so the time spent on a bad match is bounded.
+    """
+
+    match_attrs = span_attrs()
+    budget = current_budget()
+    try:
+        print(f"Navigating to match URL: {game_url}")
+        success = await goto_with_retry(game_page, game_url)
+        if not success:
+            match_attrs["outcome"] = "load_failed"
+            dead_letters.record(game_url, "load", "navigation failed")
+            return None
+
+        # ✅ GESTION DES POPUPS BLOQUANTES
+        try:
+            # Bannière cookies (OneTrust), les overlays sont masqués par le script de démarrage du contexte
+            await handle_cookie_consent(game_page)
+        except Exception as e:
+            print(f"Popup handling failed: {e}")
+
+        # Attendre la fin du chargement
+        with span("loader_wait", url=game_url) as attrs:
+            try:
+                await game_page.wait_for_selector("div[class*='Loader']", state="detached", timeout=budget.timeout(15000))
+            except Exception:
+                print("Loader not detected or already gone.")
+                attrs["outcome"] = "not_detected"
+
+        await remove_overlays(game_page)
+        await asyncio.sleep(2)
+
+        # Attendre les éléments principaux
+        for _ in range(3):
+            try:
+                with span("main_elements_wait", url=game_url, attempt=_ + 1):
+                    await game_page.wait_for_selector("[data-testid='game-host']", timeout=budget.timeout(10000))
+                break
+            except Exception as e:
+                print(f"Retrying to find main elements due to: {e}")
+                if _ == 2 or not budget.take("main_elements") or not await goto_with_retry(game_page, game_url):
+                    match_attrs["outcome"] = "main_elements_missing"
+                    dead_letters.record(game_url, "main_elements", e)
+                    return None
+
+        # Extraction des infos du match
+        home_team = await game_page.text_content("[data-testid='game-host']")
+        home_point_element = await game_page.query_selector('[data-testid="game-host"] + div')
+        home_point = await home_point_element.text_content() if home_point_element else "N/A"
+
+        away_team = await game_page.text_content("[data-testid='game-guest']")
+        away_point_element = await game_page.query_selector('//div[@data-testid="game-guest"]/preceding-sibling::div[1]')
+        away_point = await away_point_element.text_content() if away_point_element else "N/A"
+
+        # Date du match
+        game_time = await game_page.text_content("[data-testid='game-time-item']")
+        game_datetime_obj = parse_oddsportal_date_to_datetime(game_time)
+        game_datetime = game_datetime_obj.strftime("%Y-%m-%d %H:%M")
+
+        game_temporal_position = check_season_position(season, game_datetime, season_boundary="08-01")
+        if game_temporal_position == 1:
+            print(f"Skipping match before season start date: {game_datetime} for season {season}")
+            match_attrs["outcome"] = "before_season"
+            return 1
+        if game_temporal_position == 3:
+            print(f"Skipping match after season end date: {game_datetime} for season {season}")
+            match_attrs["outcome"] = "after_season"
+            return None
+
+        event_data = EventRecord(
+            url=game_url,
+            home_team=home_team.strip() if home_team else "N/A",
+            away_team=away_team.strip() if away_team else "N/A",
+            date_time=datetime_to_timestamp(game_datetime_obj),
+            score=f"{home_point}-{away_point}",
+        )
+
+        # Trouver la section du bookmaker
+        pattern_bookmaker = rf"^{bookmaker_name}(?:\.[a-z]+)?$"
+        link_bookmaker = game_page.locator('a > p', has_text=re.compile(pattern_bookmaker, re.IGNORECASE))
+
+        # Extraire région et compétition
+        competition_link = await get_competition_link(game_page)
+        region_name, competition_name = extract_region_competition(competition_link)
+    
+        if await link_bookmaker.count() > 0:
+            bookmaker_block = link_bookmaker.locator("xpath=../../..")
+            await bookmaker_block.wait_for(state="visible")
+            odds_cells = bookmaker_block.locator('[data-testid="odd-container"]')
+            odds_texts = []
+
+            cell_count = await odds_cells.count()
+            for i in range(cell_count):
+                cell_visible = False
+                for _ in range(3):
+                    try:
+                        with span("odds_cell_wait", url=game_url, cell=i, attempt=_ + 1):
+                            await odds_cells.nth(i).wait_for(state="visible", timeout=budget.timeout(10000))
+                        cell_visible = True
+                        break
+                    except Exception as e:
+                        print(f"Retrying to find odds cell due to: {e}")
+                        if _ == 2 or not budget.take("odds_cell"):
+                            print(f"Skipping odds cell {i} due to persistent load issues: {game_url}")
+                            break
+                        # Only this cell is retried, the page is not reloaded
+                        await game_page.mouse.move(0, 0)
+                        try:
+                            await odds_cells.nth(i).scroll_into_view_if_needed(timeout=budget.timeout(5000))
+                        except Exception:
+                            pass
+                        await backoff(_ + 1, game_url)
+                if not cell_visible:
+                    continue
+
+                # ✅ Survoler la cote
+                # the overlays are kept from rendering by the bootstrap script of the context
+                try:
+                    with span("hover", url=game_url, cell=i):
+                        await odds_cells.nth(i).hover()
+                        await asyncio.sleep(0.3)
+                except Exception as e:
+                    print(f"Hover failed: {e}")
+                    continue
+
+                # Extraire les cotes affichées
+                try:
+                    odds_block = None
+                    odds_text = None
+                    for _ in range(3):
+                        try:
+                            with span("tooltip_wait", url=game_url, cell=i, attempt=_ + 1):
+                                await game_page.wait_for_selector("h3:has-text('Odds movement')", timeout=budget.timeout(12000))
+                            odds_headers = game_page.locator("h3", has_text="Odds movement")
+                            if await odds_headers.count() > 0:
+                                odds_block = odds_headers.locator("..")
+                                await odds_block.wait_for(state="attached", timeout=10000)
+                                odds_text = await odds_block.text_content()
+                                break
+                        except Exception as e:
+                            print(f"Retry {_+1}/3: Error while trying to find odds movement: {e}")
+                            if _ == 2 or not budget.take("tooltip"):
+                                break
+                            await backoff(_ + 1, game_url)
+                            await odds_cells.nth(i).hover()
+
+                    if not odds_block or not odds_text:
+                        print(f"No odds block found for {game_url}")
+                        continue
+
+                    if i < len(ODDS_KEYS):
+                        odds_texts.append((ODDS_KEYS[i], odds_text))
+
+                except Exception as e:
+                    print(f"Failed to extract odds: {e}")
+
+                await game_page.mouse.move(0, 0)
+
+            # Parse all odds movements of the match at once, dates are formatted when saving
+            with span("parse_odds", url=game_url, cells=len(odds_texts)):
+                series = parse_odds_movements([text for _, text in odds_texts], game_datetime_obj)
+            event_data.set_odds({key: points for (key, _), points in zip(odds_texts, series)})
+
+            missing_keys = [key for key in ODDS_KEYS[:cell_count] if key not in dict(odds_texts)]
+            if missing_keys:
+                match_attrs["outcome"] = "odds_partial"
+                dead_letters.record(game_url, "odds_partial", f"missing odds: {', '.join(missing_keys)}")
+                return event_data, (region_name, competition_name)
+
+        dead_letters.mark_complete(game_url)
+        return event_data, (region_name, competition_name)
+    
+    except Exception as e:
+        match_attrs["outcome"] = "error"
+        match_attrs["error"] = str(e)[:300]
+        dead_letters.record(game_url, "error", e)
+        return None
+
+
+async def process_game(context, game_url, bookmaker_name, season, type_historical="competition", dataset=None, worker_page=None):
+    """
+    Asynchronously processes a single game.
+
+    `dataset` (see dead_letters.dataset_header) is the dataset the match is
+    saved in, recorded with the match in the dead-letter store if it fails.
+    With a `worker_page` (see WorkerPage), the match is scraped in the
+    long-lived page of the worker, reset afterwards, instead of a new tab.
+    The match is recorded when profiling is enabled (see match_profiler).
+    """
+    dataset_token = dead_letters.current_dataset.set(dataset)
+    log_token = job_log.bind(url=game_url)
+    game_page = await worker_page.acquire() if worker_page else await context.new_page()
+    metrics.add_gauge("pages_in_flight", 1)
+    outcome = "failed"
+    async with profile_match(context, game_url) as capture:
+        try:
+            result = await get_match_details(game_page, game_url, bookmaker_name, season)
+            if result == 1:
+                # season boundary crossed, the caller cancels the older matches
+                outcome = "before_season"
+                return 1
+            if not result:
+                # a failure was recorded by get_match_details, a match after the season is not one
+                print(f"Skipping match: {game_url}")
+                return None
+            outcome = "ok"
+
+            event_data, region_competion_names = result
+            home_team_link, away_team_link = await get_team_links(game_page)
+            return event_data, (home_team_link, away_team_link), game_page, region_competion_names
+        except Exception as e:
+            dead_letters.record(game_url, "process_game", e)
+            return None
+        finally:
+            capture["outcome"] = outcome
+            dead_letters.current_dataset.reset(dataset_token)
+            job_log.unbind(log_token)
+            metrics.add_gauge("pages_in_flight", -1)
+            metrics.match_completed(outcome)
+            if worker_page:
+                await worker_page.reset()
+            elif not game_page.is_closed():
+                await game_page.close()
+
+
+async def limited_process_game(semaphore, ctx, url, bookmaker_name, season, type_historical="competition", idle_pages=None):
+    """
+    Processes a single game with concurrency control. With `idle_pages`, a
+    queue of WorkerPage (one per semaphore slot), the game borrows one of them.
+    """
+    metrics.add_gauge("queue_depth", 1)
+    try:
+        with span("semaphore_wait", url=url):
+            await semaphore.acquire()
+    finally:
+        metrics.add_gauge("queue_depth", -1)
+    try:
+        if idle_pages is None:
+            return await process_game(ctx, url, bookmaker_name, season, type_historical)
+        worker_page = idle_pages.get_nowait()
+        try:
+            return await process_game(ctx, url, bookmaker_name, season, type_historical, worker_page=worker_page)
+        finally:
+            idle_pages.put_nowait(worker_page)
+    finally:
+        semaphore.release()
@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the navigation latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 100, float("inf"))
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_completed_at = deque()
+_started_at = time.time()
+_server = None
+_flusher = None
+_stop_flush = threading.Event()
+
+
+def inc(name, value=1, **labels):
+    """Increments a counter, eg. inc("retries_total", reason="timeout")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def add_gauge(name, delta, **labels):
+    """Adds `delta` (which may be negative) to a gauge, eg. pages in flight."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def set_gauge(name, value, **labels):
+    """Sets a gauge to an absolute value."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, value, **labels):
+    """Records `value` (seconds) in a histogram using LATENCY_BUCKETS."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def match_completed(outcome="ok"):
+    """
+    Counts a finished match, the timestamps feed the matches-per-minute rates.
+    A failed match is only counted in matches_failed_total, out of the rates.
+    """
+    if outcome == "failed":
+        inc("matches_failed_total")
+        return
+    inc("matches_completed_total", outcome=outcome)
+    now = time.time()
+    with _lock:
+        _completed_at.append(now)
+        # keep only what the 5 minutes rate needs
+        while _completed_at and _completed_at[0] < now - 300:
+            _completed_at.popleft()
+
+
+def track_context(context):
+    """
+    Counts the responses received by a browser context and their bytes: headers and
+    body as received (compressed or chunked), from the sizes measured by the browser.
+    """
+    def on_response(response):
+        try:
+            inc("responses_total", status=response.status // 100 * 100)
+        except Exception:
+            pass
+
+    async def on_request_finished(request):
+        try:
+            sizes = await request.sizes()
+            inc("bytes_transferred_total", sizes["responseHeadersSize"] + sizes["responseBodySize"])
+        except Exception:
+            # page or context closed before the sizes were read
+            pass
+
+    context.on("response", on_response)
+    context.on("requestfinished", on_request_finished)
+    return context
+
+
+def snapshot():
+    """Returns every metric as a JSON serializable dict."""
+    now = time.time()
+    with _lock:
+        last_minute = sum(1 for t in _completed_at if t >= now - 60)
+        last_5_minutes = sum(1 for t in _completed_at if t >= now - 300)
+        data = {
+            "timestamp": round(now, 3),
+            "uptime_seconds": round(now - _started_at, 1),
+            "pid": os.getpid(),
+            "matches_per_minute_1m": last_minute,
+            "matches_per_minute_5m": round(last_5_minutes / 5, 2),
+            "counters": [_labelled(key, value) for key, value in sorted(_counters.items())],
+            "gauges": [_labelled(key, value) for key, value in sorted(_gauges.items())],
+            "histograms": [
+                _labelled(key, {
+                    "buckets": dict(zip(map(str, LATENCY_BUCKETS), histogram["buckets"])),
+                    "sum": round(histogram["sum"], 3),
+                    "count": histogram["count"],
+                })
+                for key, histogram in sorted(_histograms.items())
+            ],
+        }
+    rss = _process_rss_bytes()
+    if rss is not None:
+        data["process_rss_bytes"] = rss
+    return data
+
+
+def to_prometheus(data):
+    """Formats a snapshot in the Prometheus text exposition format."""
+    lines = [
+        f"oddsportal_matches_per_minute_1m {data['matches_per_minute_1m']}",
+        f"oddsportal_matches_per_minute_5m {data['matches_per_minute_5m']}",
+        f"oddsportal_uptime_seconds {data['uptime_seconds']}",
+    ]
+    if "process_rss_bytes" in data:
+        lines.append(f"oddsportal_process_rss_bytes {data['process_rss_bytes']}")
+    for metric in data["counters"] + data["gauges"]:
+        lines.append(f"oddsportal_{metric['name']}{_prometheus_labels(metric['labels'])} {metric['value']}")
+    for metric in data["histograms"]:
+        cumulative = 0
+        for bound, count in metric["value"]["buckets"].items():
+            cumulative += count
+            le = "+Inf" if bound == "inf" else bound
+            labels = _prometheus_labels(dict(metric["labels"], le=le))
+            lines.append(f"oddsportal_{metric['name']}_bucket{labels} {cumulative}")
+        labels = _prometheus_labels(metric["labels"])
+        lines.append(f"oddsportal_{metric['name']}_sum{labels} {metric['value']['sum']}")
+        lines.append(f"oddsportal_{metric['name']}_count{labels} {metric['value']['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics(port=None, path=None, interval=15):
+    """
+    Exposes the metrics of the running scrape.
+
+    Args:
+        port (int): serve /metrics (Prometheus text) and /metrics.json on 127.0.0.1:port
+        path (str): JSON file rewritten with a snapshot every `interval` seconds
+    """
+    global _server, _flusher
+    stop_metrics()
+    if port:
+        _server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics available at http://127.0.0.1:{port}/metrics")
+    if path:
+        _stop_flush.clear()
+        _flusher = threading.Thread(target=_flush_loop, args=(path, interval), name="metrics-flush", daemon=True)
+        _flusher.start()
+
+
+def stop_metrics(path=None):
+    """Stops the endpoint and the flush thread, writing a last snapshot to `path`."""
+    global _server, _flusher
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    if _flusher is not None:
+        _stop_flush.set()
+        _flusher.join(timeout=5)
+        _flusher = None
+    if path:
+        write_snapshot(path)
+
+
+def write_snapshot(path):
+    """Atomically rewrites `path` with the current metrics."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop(path, interval):
+    while not _stop_flush.is_set():
+        try:
+            write_snapshot(path)
+        except OSError as e:
+            print(f"Failed to write metrics to {path}: {e}")
+        _stop_flush.wait(interval)
+    write_snapshot(path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = snapshot()
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(data, indent=2).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = to_prometheus(data).encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the scraper output clean
+        pass
+
+
+def _labelled(key, value):
+    name, labels = key
+    return {"name": name, "labels": dict(labels), "value": value}
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _process_rss_bytes():
+    # Linux only, other platforms simply do not report it
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
@@ -0,0 +1,242 @@
+import argparse
+import csv
+import os
+import numpy as np
+from event_model import ODDS_KEYS
+from extract_data import extract_match_id
+from read_data import is_upcoming_file, iter_data_files, iter_events, read_header
+
+OUTCOMES = ("home", "draw", "away")
+MATCH_FIELDS = ("match_id", "date_time", "sport", "region", "competition", "season", "home_team", "away_team", "score", "bookmaker")
+
+
+class OddsTable:
+    """
+    Odds movements of many matches as numpy arrays, to compute features of
+    every match at once: one row per match, one column per outcome (in the
+    ODDS_KEYS order).
+
+    The points of every match and outcome are kept sorted by (match, outcome,
+    time) in flat arrays, so that the odds at any moment of every match are
+    found with one `searchsorted` instead of a loop over the events. Times are
+    seconds since 1970-01-01, like the odds arrays of event_model.
+
+    Example:
+        table = OddsTable.build("scraped_data")
+        closing = table.odds_at("closing")             # (matches, 3), NaN when missing
+        table.margin(closing)                           # bookmaker margin at kickoff
+        table.movement(24, "closing")["prob_change"]    # from 24 h before kickoff
+    """
+
+    def __init__(self, matches, kickoff, group, time, value):
+        self.matches = matches
+        self.kickoff = kickoff
+        count = len(kickoff) * len(ODDS_KEYS)
+        order = np.lexsort((time, group))
+        self.group = group[order]
+        self.time = time[order]
+        self.value = value[order]
+        groups = np.arange(count)
+        self.start = np.searchsorted(self.group, groups, side="left")
+        self.end = np.searchsorted(self.group, groups, side="right")
+        # one sorted key per point: the points of a group are after those of the previous groups
+        self.origin = int(self.time.min()) - 1 if len(self.time) else 0
+        self.stride = (int(self.time.max()) - self.origin + 2) if len(self.time) else 1
+        self.keys = self.group * self.stride + (self.time - self.origin)
+
+    def __len__(self):
+        return len(self.kickoff)
+
+    @classmethod
+    def build(cls, base_dir="scraped_data", paths=None):
+        """
+        Reads the saved datasets (or `paths`) with the streaming reader, the
+        upcoming scrapes of `base_dir` being left out. A match saved in several
+        datasets (competition and teams, or rescraped) is read once, from the
+        newest one.
+        """
+        matches = {field: [] for field in MATCH_FIELDS}
+        seen = set()
+        group, times, values = [], [], []
+        paths = paths or [path for path in iter_data_files(base_dir) if not is_upcoming_file(path)]
+        # file names start with their save time, the newest file of a match is read first
+        for path in sorted(paths, key=os.path.basename, reverse=True):
+            header = read_header(path)
+            for event in iter_events(path):
+                match_id = extract_match_id(event.get("url"))
+                key = match_id or f"{event.get('home_team')}|{event.get('away_team')}|{event.get('date_time')}"
+                if key in seen:
+                    continue
+                row = len(seen)
+                seen.add(key)
+                matches["match_id"].append(match_id)
+                for field in MATCH_FIELDS[1:]:
+                    matches[field].append(event.get(field) or header.get(field))
+                odds = event.get("odds", {})
+                for outcome, odds_key in enumerate(ODDS_KEYS):
+                    points = [point for point in odds.get(odds_key) or [] if point.get("date_time") and point.get("value") is not None]
+                    group.extend([row * len(ODDS_KEYS) + outcome] * len(points))
+                    times.extend(point["date_time"] for point in points)
+                    values.extend(point["value"] for point in points)
+
+        # "YYYY-MM-DD HH:MM" strings are parsed by numpy, missing dates being NaT
+        kickoff = np.array([date or "NaT" for date in matches["date_time"]], dtype="datetime64[m]")
+        return cls(
+            matches,
+            kickoff.astype("datetime64[s]").astype(np.int64),
+            np.array(group, dtype=np.int64),
+            np.array(times, dtype="datetime64[m]").astype("datetime64[s]").astype(np.int64),
+            np.array(values, dtype=np.float64),
+        )
+
+    def kickoff_known(self):
+        return self.kickoff != np.iinfo(np.int64).min
+
+    def moment_times(self, moment):
+        """
+        Time of `moment` for every match: "closing" (kickoff), a number of hours
+        before kickoff, or a "YYYY-MM-DD HH:MM" date (the kickoff if it is later).
+        Returns (times, valid), hours before an unknown kickoff not being valid.
+        """
+        known = self.kickoff_known()
+        if moment == "closing":
+            # without kickoff, the last point
+            return np.where(known, self.kickoff, np.iinfo(np.int64).max), np.ones(len(self), dtype=bool)
+        if isinstance(moment, str):
+            at = np.datetime64(moment, "m").astype("datetime64[s]").astype(np.int64)
+            return np.where(known, np.minimum(self.kickoff, at), at), np.ones(len(self), dtype=bool)
+        return np.where(known, self.kickoff - int(float(moment) * 3600), self.origin), known
+
+    def odds_at(self, moment="closing"):
+        """
+        Odds of every match and outcome at `moment` (see moment_times), "opening"
+        being the first point: the last point at or before that time, NaN when
+        the outcome has no point yet.
+        """
+        shape = (len(self), len(ODDS_KEYS))
+        has_points = self.end > self.start
+        if moment == "opening":
+            odds = np.where(has_points, self.value[np.minimum(self.start, len(self.value) - 1)] if len(self.value) else np.nan, np.nan)
+            return odds.reshape(shape)
+
+        times, valid = self.moment_times(moment)
+        times = np.repeat(times, len(ODDS_KEYS))
+        valid = np.repeat(valid, len(ODDS_KEYS))
+        offsets = np.clip(times - self.origin, 0, self.stride - 1) if times.size else times
+        groups = np.arange(len(times))
+        index = np.searchsorted(self.keys, groups * self.stride + offsets, side="right") - 1
+        found = valid & (index >= self.start)
+        odds = np.where(found, self.value[np.clip(index, 0, max(len(self.value) - 1, 0))] if len(self.value) else np.nan, np.nan)
+        return odds.reshape(shape)
+
+    def moves(self):
+        """Number of odds points of every match and outcome."""
+        return (self.end - self.start).reshape(len(self), len(ODDS_KEYS))
+
+    @staticmethod
+    def implied_probabilities(odds):
+        """1 / odds, NaN for missing or invalid odds."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(odds > 0, 1.0 / odds, np.nan)
+
+    @staticmethod
+    def outcomes_known(odds):
+        # two-way markets (eg. tennis) have no draw, a match needs at least two priced outcomes
+        known = np.sum(~np.isnan(odds), axis=1)
+        return known >= 2
+
+    @classmethod
+    def margin(cls, odds):
+        """Bookmaker margin (overround) of every match: sum of the implied probabilities of its priced outcomes - 1."""
+        probabilities = cls.implied_probabilities(odds)
+        return np.where(cls.outcomes_known(odds), np.nansum(probabilities, axis=1) - 1.0, np.nan)
+
+    @classmethod
+    def fair_probabilities(cls, odds):
+        """Implied probabilities without the margin (normalized to 1 over the priced outcomes)."""
+        probabilities = cls.implied_probabilities(odds)
+        total = np.nansum(probabilities, axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(cls.outcomes_known(odds)[:, None], probabilities / total, np.nan)
+
+    def movement(self, start="opening", end="closing"):
+        """
+        Line movement of every match and outcome between two moments (see odds_at):
+        change of the fair probability and log ratio of the odds (negative when the odds shortened).
+        """
+        odds_start = self.odds_at(start)
+        odds_end = self.odds_at(end)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_ratio = np.log(odds_end / odds_start)
+        return {
+            "prob_change": self.fair_probabilities(odds_end) - self.fair_probabilities(odds_start),
+            "log_ratio": log_ratio,
+        }
+
+    def features(self, moments=()):
+        """
+        Columns of the match table: the match fields, the opening and closing odds,
+        fair closing probabilities, number of points of each outcome, the margin at
+        the opening and at kickoff, the movement from the opening to kickoff, and
+        the odds and movement to kickoff from each of `moments` (hours before kickoff).
+        """
+        columns = {field: np.array(values, dtype=object) for field, values in self.matches.items()}
+        opening = self.odds_at("opening")
+        closing = self.odds_at("closing")
+        per_outcome = {
+            "opening": opening,
+            "closing": closing,
+            "prob_closing": self.fair_probabilities(closing),
+            "moves": self.moves(),
+            "move": self.movement("opening", "closing")["prob_change"],
+        }
+        for moment in moments:
+            label = f"{moment:g}h" if not isinstance(moment, str) else moment
+            per_outcome[f"odds_{label}"] = self.odds_at(moment)
+            per_outcome[f"move_{label}"] = self.movement(moment, "closing")["prob_change"]
+        for name, values in per_outcome.items():
+            for outcome, label in enumerate(OUTCOMES):
+                columns[f"{name}_{label}"] = values[:, outcome]
+        columns["margin_opening"] = self.margin(opening)
+        columns["margin_closing"] = self.margin(closing)
+        return columns
+
+
+def write_table(columns, path):
+    """Writes the columns as CSV, or as a compressed numpy archive for a .npz path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **{name: values.astype(str) if values.dtype == object else values for name, values in columns.items()})
+        return
+    names = list(columns)
+    cells = []
+    for name in names:
+        values = columns[name]
+        if values.dtype.kind == "f":
+            cells.append(["" if np.isnan(value) else f"{value:.6g}" for value in values.tolist()])
+        else:
+            cells.append(["" if value is None else value for value in values.tolist()])
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*cells))
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Build the closing line and margin table of the saved datasets, one row per match')
+    parser.add_argument("files", nargs="*", help="Datasets to read (default: every dataset in base-dir)")
+    parser.add_argument("--base-dir", default="scraped_data")
+    parser.add_argument("--output", default=os.path.join("scraped_data", "odds_features.csv"),
+                        help="CSV file, or .npz for a numpy archive (default: scraped_data/odds_features.csv)")
+    parser.add_argument("--at", type=float, action="append", default=[],
+                        help="Also the odds and movement to kickoff from this many hours before kickoff (repeatable, eg. --at 24 --at 1)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    table = OddsTable.build(args.base_dir, args.files or None)
+    columns = table.features(args.at)
+    write_table(columns, args.output)
+    print(f"{len(table)} matches ({len(table.value)} odds points) written to {args.output}")
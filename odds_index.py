@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+from bisect import bisect_left, bisect_right
+from event_model import ODDS_KEYS, intern_text
+from extract_data import extract_match_id
+from read_data import is_upcoming_file, iter_data_files, iter_events, read_header
+
+INDEX_DIR = ".index"
+INDEX_FILE = "odds_index.json"
+INDEX_VERSION = 1
+
+
+class IndexedMatch:
+    """
+    One match of the index: its header and the opening and closing odds of
+    each outcome (in the ODDS_KEYS order, None when the outcome has no odds).
+    """
+
+    __slots__ = ("key", "match_id", "home_team", "away_team", "date_time", "score",
+                 "region", "competition", "season", "opening", "closing")
+
+    FIELDS = __slots__
+
+    def __init__(self, key, match_id, home_team, away_team, date_time, score,
+                 region, competition, season, opening, closing):
+        self.key = key
+        self.match_id = match_id
+        self.home_team = intern_text(home_team)
+        self.away_team = intern_text(away_team)
+        self.date_time = date_time
+        self.score = intern_text(score)
+        self.region = intern_text(region)
+        self.competition = intern_text(competition)
+        self.season = intern_text(season)
+        self.opening = tuple(opening)
+        self.closing = tuple(closing)
+
+    @classmethod
+    def from_event(cls, event, header):
+        """Builds the index entry of a saved event, `header` being the dataset fields (season, competition...)."""
+        match_id = extract_match_id(event.get("url"))
+        key = match_id or f"{event.get('home_team')}|{event.get('away_team')}|{event.get('date_time')}"
+        opening, closing = [], []
+        for odds_key in ODDS_KEYS:
+            points = [point for point in event.get("odds", {}).get(odds_key, []) if point.get("date_time")]
+            if points:
+                opening.append(min(points, key=lambda point: point["date_time"])["value"])
+                closing.append(max(points, key=lambda point: point["date_time"])["value"])
+            else:
+                opening.append(None)
+                closing.append(None)
+        return cls(
+            key, match_id, event.get("home_team"), event.get("away_team"), event.get("date_time"), event.get("score"),
+            event.get("region") or header.get("region"), event.get("competition") or header.get("competition"),
+            header.get("season"), opening, closing,
+        )
+
+    def to_row(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def odds(self, which="closing"):
+        """Returns {"home_win_odds": 1.85, ...} for the "opening" or "closing" odds."""
+        return dict(zip(ODDS_KEYS, getattr(self, which)))
+
+    def to_dict(self):
+        match = {field: getattr(self, field) for field in self.FIELDS if field not in ("opening", "closing")}
+        match["opening_odds"] = self.odds("opening")
+        match["closing_odds"] = self.odds("closing")
+        return match
+
+
+class OddsIndex:
+    """
+    Persisted index of the matches saved in `base_dir`.
+
+    `refresh()` only reads the datasets that appeared or changed since the
+    last refresh (by size and modification time), with the streaming reader,
+    and forgets the removed ones; the index is kept in
+    `<base_dir>/.index/odds_index.json`. Lookups are answered from in-memory
+    dictionaries. A match saved in several datasets (competition and teams)
+    is indexed once, from the newest one; upcoming datasets are not indexed.
+
+    Example:
+        index = OddsIndex.open("scraped_data")
+        index.get("xYz12AbC").odds("closing")
+        index.query(team="Arsenal", season="2023/2024", start="2023-09-01")
+    """
+
+    def __init__(self, base_dir="scraped_data"):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, INDEX_DIR, INDEX_FILE)
+        self.files = {}
+        self.matches = {}
+        self._lookups = None
+
+    @classmethod
+    def open(cls, base_dir="scraped_data", refresh=True):
+        """Loads the persisted index and brings it up to date with the files of `base_dir`."""
+        index = cls(base_dir)
+        index.load()
+        if refresh and index.refresh():
+            index.save()
+        return index
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Failed to load the odds index, rebuilding it: {e}")
+            return
+        if state.get("version") != INDEX_VERSION:
+            return
+        self.files = {
+            path: dict(entry, matches=[IndexedMatch.from_row(row) for row in entry["matches"]])
+            for path, entry in state["files"].items()
+        }
+        self._rebuild()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {
+            "version": INDEX_VERSION,
+            "files": {
+                path: dict(entry, matches=[match.to_row() for match in entry["matches"]])
+                for path, entry in self.files.items()
+            },
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """Indexes the new and changed datasets and drops the removed ones. Returns whether anything changed."""
+        current = {}
+        for path in iter_data_files(self.base_dir):
+            if is_upcoming_file(path):
+                continue
+            stat = os.stat(path)
+            current[os.path.basename(path)] = (path, stat.st_size, stat.st_mtime)
+
+        changed = False
+        for name in list(self.files):
+            if name not in current:
+                del self.files[name]
+                changed = True
+        for name, (path, size, mtime) in current.items():
+            entry = self.files.get(name)
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                continue
+            try:
+                self.files[name] = {"size": size, "mtime": mtime, "matches": list(self._index_file(path))}
+            except Exception as e:
+                print(f"Failed to index {path}: {e}")
+                continue
+            print(f"Indexed {path} ({len(self.files[name]['matches'])} matches)")
+            changed = True
+
+        if changed or self._lookups is None:
+            self._rebuild()
+        return changed
+
+    def _index_file(self, path):
+        header = read_header(path)
+        for event in iter_events(path):
+            yield IndexedMatch.from_event(event, header)
+
+    def _rebuild(self):
+        """Deduplicates the matches of every file and rebuilds the lookup dictionaries."""
+        self.matches = {}
+        # file names start with their save time: a match saved again (eg. rescraped) comes from the newest file
+        for name in sorted(self.files):
+            for match in self.files[name]["matches"]:
+                self.matches[match.key] = match
+
+        by_team, by_competition, by_season = {}, {}, {}
+        for match in self.matches.values():
+            for team in (match.home_team, match.away_team):
+                if team:
+                    by_team.setdefault(team.lower(), []).append(match)
+            if match.competition:
+                by_competition.setdefault(match.competition.lower(), []).append(match)
+            if match.season:
+                by_season.setdefault(match.season, []).append(match)
+        by_date = sorted((match for match in self.matches.values() if match.date_time), key=lambda match: match.date_time)
+        self._lookups = {
+            "team": by_team,
+            "competition": by_competition,
+            "season": by_season,
+            "date": by_date,
+            "dates": [match.date_time for match in by_date],
+        }
+
+    def get(self, match_id):
+        """Returns the IndexedMatch of an OddsPortal match id, or None."""
+        return self.matches.get(match_id)
+
+    def query(self, team=None, competition=None, season=None, start=None, end=None):
+        """
+        Returns the matches matching every given criterion, ordered by date.
+
+        Args:
+            team (str): home or away team, case insensitive
+            competition (str): competition name, case insensitive
+            season (str): eg. "2023/2024"
+            start, end (str): inclusive date range, "YYYY-MM-DD" or "YYYY-MM-DD HH:MM"
+        """
+        candidates = []
+        if team:
+            candidates.append(self._lookups["team"].get(team.lower(), []))
+        if competition:
+            candidates.append(self._lookups["competition"].get(competition.lower(), []))
+        if season:
+            candidates.append(self._lookups["season"].get(season, []))
+        if start or end:
+            dates = self._lookups["dates"]
+            low = bisect_left(dates, start) if start else 0
+            # "2024-05-19" also includes the matches of that day
+            high = bisect_right(dates, f"{end}~") if end else len(dates)
+            candidates.append(self._lookups["date"][low:high])
+        if not candidates:
+            return sorted(self.matches.values(), key=lambda match: match.date_time or "")
+
+        candidates.sort(key=len)
+        selected = candidates[0]
+        for other in candidates[1:]:
+            keys = {match.key for match in other}
+            selected = [match for match in selected if match.key in keys]
+        return sorted(selected, key=lambda match: match.date_time or "")
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Build and query the odds index of the saved datasets')
+    parser.add_argument("--base-dir", default="scraped_data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Index the new and changed datasets")
+    query = subparsers.add_parser("query", help="Print the opening and closing odds of matching matches")
+    query.add_argument("--match-id")
+    query.add_argument("--team")
+    query.add_argument("--competition")
+    query.add_argument("--season")
+    query.add_argument("--start", help="eg. 2024-08-01")
+    query.add_argument("--end", help="eg. 2024-12-31")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    index = OddsIndex.open(args.base_dir)
+    if args.command == "build":
+        print(f"{len(index.matches)} matches indexed from {len(index.files)} files")
+    elif args.command == "query":
+        if args.match_id:
+            match = index.get(args.match_id)
+            matches = [match] if match else []
+        else:
+            matches = index.query(args.team, args.competition, args.season, args.start, args.end)
+        for match in matches:
+            print(json.dumps(match.to_dict(), ensure_ascii=False))
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import re
+from save_data import COMPRESSIONS, DATA_FILE_SUFFIXES, is_data_file, open_data_file, write_data_file
+
+EVENTS_START = re.compile(r'"events"\s*:\s*\[')
+CHUNK_SIZE = 1 << 16
+
+
+def iter_data_files(base_dir="scraped_data"):
+    """Yields the paths of the datasets saved in `base_dir`, compressed or not."""
+    if not os.path.isdir(base_dir):
+        return
+    for filename in sorted(os.listdir(base_dir)):
+        if is_data_file(filename):
+            yield os.path.join(base_dir, filename)
+
+
+def is_upcoming_file(path):
+    """Whether a dataset is an upcoming scrape, taken before kickoff and superseded by the historical datasets."""
+    return "_upcoming" in os.path.basename(path)
+
+
+def load_odds_data(path):
+    """Loads a whole dataset."""
+    with open_data_file(path) as f:
+        return json.load(f)
+
+
+def read_header(path, chunk_size=4096):
+    """Returns the dataset fields (sport, season, competition...) without reading the events."""
+    with open_data_file(path) as f:
+        text = ""
+        while not EVENTS_START.search(text):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            text += chunk
+    match = EVENTS_START.search(text)
+    prefix = text[:match.start()] if match else text
+    try:
+        return json.loads(prefix.rstrip().rstrip(",") + "}")
+    except json.JSONDecodeError:
+        return {}
+
+
+def iter_events(path, chunk_size=CHUNK_SIZE):
+    """
+    Yields the events of a dataset one by one, decompressing it on the fly.
+
+    Only the event being decoded is kept in memory, whatever the size of the
+    file and the way it was formatted.
+    """
+    decoder = json.JSONDecoder()
+    with open_data_file(path) as f:
+        buffer = ""
+        while True:
+            match = EVENTS_START.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # keep the end of the buffer, the key may be split between two chunks
+            buffer = buffer[-32:] + chunk
+
+        position = 0
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position >= len(buffer):
+                    raise ValueError("empty buffer")
+                event, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"Truncated events list in {path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            # an object can be complete at the end of the buffer while its value is not (eg. a number)
+            if end == len(buffer) and not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield event
+            position = end
+
+
+def migrate_file(path, compression=None, keep=False):
+    """
+    Rewrites a dataset with another compression (None for plain JSON) and
+    removes the original once the new file was read back.
+    """
+    stem = path
+    for suffix in sorted(DATA_FILE_SUFFIXES, key=len, reverse=True):
+        if stem.lower().endswith(suffix):
+            stem = stem[:-len(suffix)]
+            break
+    target = stem + ".json" + (COMPRESSIONS[compression][0] if compression else "")
+    if target == path:
+        return None
+
+    data = load_odds_data(path)
+    write_data_file(target, data, compression)
+    if sum(1 for _ in iter_events(target)) != len(data.get("events", [])):
+        os.remove(target)
+        raise ValueError(f"Migrated file {target} does not match {path}")
+    if not keep:
+        os.remove(path)
+    print(f"Migrated {path} -> {target} ({os.path.getsize(target)} bytes)")
+    return target
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Read or migrate the saved datasets')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Compress (or decompress) existing datasets")
+    migrate.add_argument("files", nargs="*", help="Datasets to migrate (default: every dataset in base-dir)")
+    migrate.add_argument("--base-dir", default="scraped_data")
+    migrate.add_argument("--compression", default="gzip", choices=["none"] + list(COMPRESSIONS),
+                         help="Target compression (default: gzip)")
+    migrate.add_argument("--keep", action="store_true", help="Keep the original files")
+    count = subparsers.add_parser("count", help="Count the events of datasets without loading them")
+    count.add_argument("files", nargs="*", help="Datasets to read (default: every dataset in base-dir)")
+    count.add_argument("--base-dir", default="scraped_data")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    files = args.files or list(iter_data_files(args.base_dir))
+    if args.command == "migrate":
+        compression = None if args.compression == "none" else args.compression
+        for path in files:
+            try:
+                migrate_file(path, compression, keep=args.keep)
+            except Exception as e:
+                print(f"Failed to migrate {path}: {e}")
+    elif args.command == "count":
+        for path in files:
+            print(f"{path}: {sum(1 for _ in iter_events(path))} events")
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import os
+from playwright.async_api import async_playwright
+from worker_pool import MatchPool
+from browser_server import configure_browser_server, launch_browser
+from dead_letters import configure_dead_letters, load_dead_letters, resolve, resolve_saved
+from extract_data import is_file_existing
+from read_data import load_odds_data
+from save_data import compression_of, save_odds_data, serialize_event, write_data_file
+from event_model import intern_text
+from backfill import split_by_season
+from date_sorting import span_seasons
+import metrics
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Scrape again the failed matches of the dead-letter store and merge them into their datasets')
+    parser.add_argument('--base-dir', default="scraped_data")
+    parser.add_argument('--stage', action='append', default=None,
+                       help='Only the matches that failed at this stage (eg. load, main_elements, odds_partial, error), can be repeated')
+    parser.add_argument('--max-attempts', type=int, default=5,
+                       help='Skip the matches that already failed this many times (default: 5)')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Number of matches scraped at the same time (default: 4)')
+    parser.add_argument('--list', action='store_true',
+                       help='Only show the failed matches, by dataset and stage')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                       help='Expose live metrics on 127.0.0.1:<port>/metrics')
+    parser.add_argument('--browser-server', default=None,
+                       help='Connect to the shared browser server (eg. http://127.0.0.1:9222, see browser_server.py)')
+    return parser.parse_args()
+
+
+def dataset_key(dataset):
+    return json.dumps(dataset, sort_keys=True, ensure_ascii=False)
+
+
+def select_dead_letters(base_dir, stages=None, max_attempts=5):
+    """Open dead letters to scrape again, grouped by dataset."""
+    groups = {}
+    for url, entry in load_dead_letters(base_dir).items():
+        if not entry.get("dataset"):
+            continue
+        if stages and entry["stage"] not in stages:
+            continue
+        if entry["attempts"] >= max_attempts:
+            continue
+        groups.setdefault(dataset_key(entry["dataset"]), []).append(entry)
+    return groups
+
+
+def find_dataset_file(dataset, base_dir="scraped_data"):
+    """Latest saved file of a dataset, or None."""
+    if not os.path.isdir(base_dir):
+        return None
+    # is_file_existing returns lower-cased names
+    names = {name.lower(): name for name in os.listdir(base_dir)}
+    matching = is_file_existing(base_dir=base_dir, type_historical=dataset["type"], region=dataset.get("region"),
+                                competition=dataset.get("competition"), team=dataset.get("team"), season=dataset.get("season"))
+    candidates = []
+    for path in matching:
+        name = names.get(os.path.basename(path))
+        if name is None or "_upcoming" in name:
+            continue
+        if ("_team_" in name) != (dataset["type"] == "team"):
+            continue
+        candidates.append(name)
+    return os.path.join(base_dir, sorted(candidates)[-1]) if candidates else None
+
+
+def merge_events(odds_data, events):
+    """Replaces the events of odds_data scraped again (same URL, or same teams and kickoff), appends the others."""
+    def header_key(event):
+        return event.get("home_team"), event.get("away_team"), event.get("date_time")
+
+    by_url = {event["url"]: index for index, event in enumerate(odds_data["events"]) if event.get("url")}
+    by_header = {header_key(event): index for index, event in enumerate(odds_data["events"])}
+    replaced = 0
+    for event in events:
+        event = serialize_event(event)
+        index = by_url.get(event.get("url"), by_header.get(header_key(event)))
+        if index is None:
+            odds_data["events"].append(event)
+        else:
+            odds_data["events"][index] = event
+            replaced += 1
+    return replaced
+
+
+def save_rescraped(dataset, events, base_dir="scraped_data"):
+    """Merges the events scraped again into the saved file of their dataset, or saves a new one."""
+    seasons = span_seasons(dataset.get("season"))
+    if len(seasons) > 1:
+        # matches of a multi-season run (see backfill_history) go back to the file of their season
+        return [save_rescraped(dict(dataset, season=season), season_events, base_dir)
+                for season, season_events in split_by_season(events, seasons).items() if season_events]
+
+    path = find_dataset_file(dataset, base_dir)
+    if path is None:
+        odds_data = {key: value for key, value in dataset.items() if key != "type"}
+        odds_data["events"] = events
+        return save_odds_data(odds_data, base_dir=base_dir, type_historical=dataset["type"])
+
+    odds_data = load_odds_data(path)
+    replaced = merge_events(odds_data, events)
+    write_data_file(path, odds_data, compression_of(path))
+    print(f"Merged {len(events)} matches into {path} ({replaced} replaced, {len(events) - replaced} added)")
+    resolve_saved(event.url for event in events)
+    return path
+
+
+async def rescrape(groups, base_dir="scraped_data", workers=4):
+    """
+    Scrapes the dead letters again, one MatchPool per bookmaker and season,
+    and merges the matches recovered into their datasets. Matches that fail
+    again are recorded again with one more attempt.
+    """
+    datasets = {key: entries[0]["dataset"] for key, entries in groups.items()}
+    pools = {}
+    for key, entries in groups.items():
+        pools.setdefault((datasets[key]["bookmaker"], datasets[key]["season"]), []).append(key)
+
+    recovered = {key: [] for key in groups}
+    async with async_playwright() as p:
+        browser = await launch_browser(p)
+        try:
+            for (bookmaker, season), keys in pools.items():
+                async with MatchPool(browser, bookmaker, season, workers) as pool:
+                    for key in keys:
+                        for entry in groups[key]:
+                            # one tag per match: the failed matches are not in date order, one before
+                            # the season start must not cancel the others (see MatchPool.cancel_after)
+                            pool.submit(entry["url"], tag=(key, entry["url"]), type_historical=datasets[key]["type"], dataset=datasets[key])
+                    pool.close()
+
+                    async for url, (key, _), result in pool:
+                        if result is None:
+                            continue
+                        if result == 1:
+                            # not part of the season, nothing to recover
+                            resolve(url, base_dir)
+                            continue
+                        event_data, _, _, region_competion_names = result
+                        if datasets[key]["type"] == "team":
+                            event_data.region = intern_text(region_competion_names[0])
+                            event_data.competition = intern_text(region_competion_names[1])
+                        recovered[key].append(event_data)
+
+                # saved as soon as the pool is done, the dead letters are resolved once on disk
+                for key in keys:
+                    if recovered[key]:
+                        save_rescraped(datasets[key], recovered[key], base_dir)
+        finally:
+            await browser.close()
+
+    total = sum(len(events) for events in recovered.values())
+    print(f"Recovered {total} of {sum(len(entries) for entries in groups.values())} failed matches")
+    return total
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    configure_dead_letters(args.base_dir)
+    configure_browser_server(args.browser_server)
+    groups = select_dead_letters(args.base_dir, args.stage, args.max_attempts)
+    if args.list or not groups:
+        for key, entries in groups.items():
+            stages = {}
+            for entry in entries:
+                stages[entry["stage"]] = stages.get(entry["stage"], 0) + 1
+            print(f"{key}: {len(entries)} matches {stages}")
+        if not groups:
+            print("No failed match to scrape again.")
+    else:
+        metrics.start_metrics(port=args.metrics_port)
+        try:
+            asyncio.run(rescrape(groups, args.base_dir, args.workers))
+        finally:
+            metrics.stop_metrics()
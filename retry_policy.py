@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+import metrics
+import job_log
+from tracing import span
+
+# Budget of one match, shared by every retry made while scraping it (navigation,
+# main elements, odds cells, tooltips), so that a bad match cannot hold a worker for minutes
+MATCH_TIME_BUDGET = 120
+MATCH_RETRY_BUDGET = 6
+
+# Jittered exponential backoff between two attempts, in seconds
+BACKOFF_BASE = 1.5
+BACKOFF_CAP = 15
+
+_current_budget = contextvars.ContextVar("current_budget", default=None)
+
+
+class RetryBudget:
+    """Attempts and time left for the retries of one match."""
+
+    def __init__(self, max_retries=MATCH_RETRY_BUDGET, max_seconds=MATCH_TIME_BUDGET):
+        self.max_retries = max_retries
+        self.retries = 0
+        self.deadline = time.monotonic() + max_seconds
+
+    def remaining(self):
+        """Seconds left before the deadline."""
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def exhausted(self):
+        return self.retries >= self.max_retries or self.remaining() <= 0
+
+    def timeout(self, timeout_ms):
+        """Caps a Playwright timeout (ms) to the time left, with a 1 s floor."""
+        return int(max(1000, min(timeout_ms, self.remaining() * 1000)))
+
+    def take(self, reason):
+        """Consumes one retry; returns False when the match has no retry left."""
+        if self.exhausted:
+            metrics.inc("retry_budget_exhausted_total", reason=reason)
+            return False
+        self.retries += 1
+        metrics.inc("retries_total", reason=reason)
+        return True
+
+
+@contextmanager
+def match_budget(max_retries=MATCH_RETRY_BUDGET, max_seconds=MATCH_TIME_BUDGET):
+    """Makes a new RetryBudget the budget of the code run in the block (see current_budget)."""
+    budget = RetryBudget(max_retries, max_seconds)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def with_match_budget(func):
+    """Runs every call of a coroutine function with a new RetryBudget, like match_budget around its body."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with match_budget():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def current_budget():
+    """Budget of the match being scraped, or an unlimited one outside of a match."""
+    return _current_budget.get() or RetryBudget(max_retries=float("inf"), max_seconds=float("inf"))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full jitter exponential backoff: uniform between 0 and min(cap, base * 2^attempt)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def backoff(attempt, url=None):
+    """Sleeps before the next attempt, without going past the deadline of the current match."""
+    delay = min(backoff_delay(attempt), current_budget().remaining())
+    with span("retry_backoff", url=url, attempt=attempt):
+        await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Pauses every worker of the process when the site fails everywhere.
+
+    Navigation outcomes are recorded in a sliding window. When at least
+    `min_samples` are known and `failure_ratio` of them failed, the circuit
+    opens: `wait()` blocks every caller for `cooldown` seconds. Then one probe
+    is let through (half open); if it succeeds the circuit closes, otherwise
+    it opens again for twice as long, up to `max_cooldown`. A probe that ends
+    without an outcome (eg. cancelled) is released so that another caller probes.
+    """
+
+    def __init__(self, window=20, min_samples=10, failure_ratio=0.8, cooldown=30, max_cooldown=300):
+        self.outcomes = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.failure_ratio = failure_ratio
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.open_until = 0
+        self.probe = None
+
+    def record(self, success):
+        if self.state == "half_open":
+            self.probe = None
+            if success:
+                print("Circuit closed, the site answers again")
+                self.state = "closed"
+                self.cooldown = self.base_cooldown
+                self.outcomes.clear()
+            else:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if self.state == "closed" and len(self.outcomes) >= self.min_samples and failures >= self.failure_ratio * len(self.outcomes):
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.open_until = time.monotonic() + self.cooldown
+        self.outcomes.clear()
+        job_log.warning(f"Circuit open: the site fails everywhere, pausing every worker for {self.cooldown} s")
+        metrics.inc("circuit_open_total")
+        metrics.set_gauge("circuit_open", 1)
+
+    async def wait(self):
+        """
+        Returns once the caller may hit the site: None, or the token of the half
+        open probe, which the caller passes to `release` once its navigation ends.
+        """
+        if self.state == "closed":
+            return None
+        with span("circuit_wait"):
+            while True:
+                if self.state == "closed":
+                    return None
+                now = time.monotonic()
+                if self.state == "open" and now >= self.open_until:
+                    self.state = "half_open"
+                    metrics.set_gauge("circuit_open", 0)
+                if self.state == "half_open" and self.probe is None:
+                    self.probe = object()
+                    return self.probe
+                await asyncio.sleep(max(0.5, min(5, self.open_until - now)))
+
+    def release(self, probe):
+        """Lets another caller probe if `probe` ended without recording an outcome."""
+        if probe is not None and self.probe is probe:
+            self.probe = None
+
+
+breaker = CircuitBreaker()
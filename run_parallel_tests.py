@@ -2,17 +2,55 @@ import json
 import asyncio
 import sys
 import argparse
+import codecs
+import logging
+import logging.handlers
+from collections import deque
 from pathlib import Path
 from datetime import datetime
 import ctypes 
+from run_planner import log_stem, plan_configs, print_plan
+from job_log import JOB_LOG_MAX_BYTES, JOB_LOG_BACKUPS, last_records
 
-ctypes.windll.kernel32.SetThreadExecutionState(0x00000001 |0x00000002)
+# Lines of the output of each job kept in memory for the summary, the whole output being in its log file
+TAIL_LINES = 200
+MAX_LINE_LENGTH = 10000
+
+def keep_awake(enabled):
+    """Keeps Windows from sleeping while the tests run (ES_CONTINUOUS | ES_SYSTEM_REQUIRED | ES_DISPLAY_REQUIRED)"""
+    if not hasattr(ctypes, "windll"):
+        return
+    ctypes.windll.kernel32.SetThreadExecutionState(0x80000000 | 0x00000001 | 0x00000002 if enabled else 0x80000000)
 
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Run tests in parallel')
     parser.add_argument('--verbose', '-v', action='store_true', 
                        help='Display test output in real time')
+    parser.add_argument('--trace', action='store_true',
+                       help='Write per-stage tracing spans to logs/traces/ (see trace_summary.py)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                       help='Expose live metrics of each job on consecutive ports starting at this one')
+    parser.add_argument('--compression', default=None, choices=['gzip', 'xz', 'bz2'],
+                       help='Compress the saved datasets (see read_data.py to read or migrate them)')
+    parser.add_argument('--browser-server', default=None,
+                       help='Connect every job to the shared browser server (eg. http://127.0.0.1:9222, see browser_server.py)')
+    parser.add_argument('--base-url', default=None,
+                       help='Site root of every link (eg. a local stand-in server, default https://www.oddsportal.com)')
+    parser.add_argument('--listing-cache-ttl', type=int, default=None,
+                       help='Seconds a listing page stays in scraped_data/.cache/listings/ (default: 6 h, 0 to always walk the listings)')
+    parser.add_argument('--profile', action='store_true',
+                       help='Write Playwright traces and asyncio stack samples (not a CPU profile) of the slow and failed matches to logs/profiles/')
+    parser.add_argument('--profile-rate', type=float, default=0.0,
+                       help='With --profile, fraction of the matches also profiled whatever their duration (eg. 0.01)')
+    parser.add_argument('--profile-slow', type=float, default=90,
+                       help='With --profile, matches slower than this many seconds are profiled (default: 90)')
+    parser.add_argument('--profile-snapshots', action='store_true',
+                       help='With --profile, also record DOM snapshots in the traces (heavy, off by default)')
+    parser.add_argument('--order', default='longest-first', choices=['longest-first', 'file'],
+                       help='Start the configurations with the longest estimated run time first (default), or in file order')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Only show the estimated run time of each configuration and the planned order')
     return parser.parse_args()
 
 def ensure_logs_dir():
@@ -23,24 +61,16 @@ def ensure_logs_dir():
 
 def generate_log_filename(config, timestamp):
     """Generate a log filename based on configuration and timestamp"""
-    # Create a filesystem-safe name
-    safe_sport = "".join(c for c in config['sport'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    safe_region = "".join(c for c in config['region'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    try:
-        safe_competition = "".join(c for c in config['competition'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{timestamp}_{safe_sport}_{safe_region}_{safe_competition}.log"
-    except KeyError:
-        safe_team = "".join(c for c in config['team'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{timestamp}_{safe_sport}_{safe_region}_{safe_team}.log"
-    # Replace spaces with underscores and limit length
-    filename = filename.replace(' ', '_')[:100]
-    return filename
-
-async def run_test(config, verbose=False, logs_dir=None):
+    # Filesystem-safe name, the same for every run of the configuration, its length limited before
+    # the extension so that the other files of the run (metrics, traces...) share the same stem
+    return f"{log_stem(config, timestamp)}.log"
+
+async def run_test(config, verbose=False, logs_dir=None, trace=False, metrics_port=None, browser_server=None, compression=None, base_url=None, profile=None, listing_cache_ttl=None):
     """Execute a test with a specific configuration"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_filename = generate_log_filename(config, timestamp)
     log_filepath = logs_dir / log_filename
+    stem = log_filepath.stem
 
     # Extract parameters
     competition = config.get("competition")
@@ -61,7 +91,8 @@ async def run_test(config, verbose=False, logs_dir=None):
         "test_oddsportal.py",
         f"--sport={config['sport']}",
         f"--region={config['region']}",
-        f"--season={config['season']}",
+        # with a range of seasons, --season is only a default
+        f"--season={config.get('season') or config['seasons'].split('-')[-1]}",
         f"--bookmaker={config['bookmaker']}"
     ]
 
@@ -75,128 +106,175 @@ async def run_test(config, verbose=False, logs_dir=None):
         cmd.append(f"--spread={config['spread']}")
     if typegame:
         cmd.append(f"--typegame={typegame}")
+    if config.get("crawl_depth") is not None:
+        cmd.append(f"--crawl-depth={config['crawl_depth']}")
+    if config.get("seasons"):
+        cmd.append(f"--seasons={config['seasons']}")
 
     # general pytest options
     cmd += ["-v", "--tb=short"]
 
-    # JUnit XML logging
+    # JUnit XML logging, next to the log of the job
+    if logs_dir:
+        cmd += [f"--junitxml={log_filepath.with_suffix('.xml')}"]
+
+    # Structured log of the scraper, rotated like the log of the job
+    job_log_filepath = None
+    if logs_dir:
+        job_log_filepath = logs_dir / "jobs" / f"{stem}.jsonl"
+        cmd += [f"--job-log={job_log_filepath}", f"--job-log-max-bytes={JOB_LOG_MAX_BYTES}"]
+
+    # Tracing spans, one file per configuration
+    if trace and logs_dir:
+        trace_filepath = logs_dir / "traces" / f"{stem}.jsonl"
+        cmd.append(f"--tracefile={trace_filepath}")
+
+    # Live metrics, always mirrored in logs/metrics/ and optionally served on a local port
     if logs_dir:
-        cmd += [f"--junitxml={log_filepath}"]
+        metrics_filepath = logs_dir / "metrics" / f"{stem}.json"
+        cmd.append(f"--metrics-file={metrics_filepath}")
+    if metrics_port:
+        cmd.append(f"--metrics-port={metrics_port}")
+    if browser_server:
+        cmd.append(f"--browser-server={browser_server}")
+    if compression:
+        cmd.append(f"--compression={compression}")
+    if base_url:
+        cmd.append(f"--base-url={base_url}")
+
+    if listing_cache_ttl is not None:
+        cmd.append(f"--listing-cache-ttl={listing_cache_ttl}")
+
+    # Traces and profiles of the sampled, slow and failed matches, one directory per configuration
+    if profile and logs_dir:
+        profile_dir = logs_dir / "profiles" / f"{stem}"
+        cmd += [f"--profile-dir={profile_dir}", f"--profile-rate={profile['rate']}", f"--profile-slow={profile['slow']}"]
+        if profile.get("snapshots"):
+            cmd.append("--profile-snapshots")
 
 
     
-    if verbose:
-        cmd.append("-s")  # Add -s option for pytest in verbose mode
+    # pytest does not hold the output until the end: it is streamed to the log of the job (and to the console in verbose mode)
+    cmd.append("-s")
     
     print(f"Starting test with configuration: {config}")
+    if metrics_port:
+        print(f"Live metrics: http://127.0.0.1:{metrics_port}/metrics")
     
     if verbose:
         print(f"Command executed: {' '.join(cmd)}")
         print(f"Log file: {log_filepath}")
     
+    log = open_job_log(log_filepath)
+    stdout_tail = deque(maxlen=TAIL_LINES)
+    stderr_tail = deque(maxlen=TAIL_LINES)
     try:
-        # Open log file for writing
-        with open(log_filepath, 'w', encoding='utf-8') as log_file:
-            log_file.write(f"Test execution started at: {datetime.now().isoformat()}\n")
-            log_file.write(f"Configuration: {config}\n")
-            log_file.write(f"Command: {' '.join(cmd)}\n")
-            log_file.write("-" * 80 + "\n\n")
-            
-            # Create process
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout_text = ""
-            stderr_text = ""
-            
-            if verbose:
-                # Verbose mode: display output in real time and write to file
-                async def read_stream(stream, stream_name):
-                    nonlocal stdout_text, stderr_text
-                    while True:
-                        chunk = await stream.read(4096)  # lit 4 Ko à la fois
-                        if not chunk:
-                            break
-                        try:
-                            decoded = chunk.decode('utf-8', errors='replace')
-                        except UnicodeDecodeError:
-                            decoded = chunk.decode('latin-1', errors='replace')
-
-                        # Affiche et écrit en temps réel
-                        if decoded.strip():
-                            print(f"[{stream_name}] {decoded}", end="")
-                            log_file.write(f"[{stream_name}] {decoded}")
-                            log_file.flush()
-
-                        # Stocke pour retour final
-                        if stream_name == "stdout":
-                            stdout_text += decoded
-                        else:
-                            stderr_text += decoded
-
-                
-                # Read stdout and stderr in parallel
-                await asyncio.gather(
-                    read_stream(process.stdout, "stdout"),
-                    read_stream(process.stderr, "stderr")
-                )
-            else:
-                # Silent mode: wait without displaying, but write to file
-                stdout, stderr = await process.communicate()
-                
-                # Decode outputs
-                try:
-                    stdout_text = stdout.decode('utf-8') if stdout else ""
-                except UnicodeDecodeError:
-                    stdout_text = stdout.decode('latin-1', errors='replace') if stdout else ""
-                
-                try:
-                    stderr_text = stderr.decode('utf-8') if stderr else ""
-                except UnicodeDecodeError:
-                    stderr_text = stderr.decode('latin-1', errors='replace') if stderr else ""
-                
-                # Write to log file
-                log_file.write("STDOUT:\n")
-                log_file.write(stdout_text)
-                log_file.write("\n\nSTDERR:\n")
-                log_file.write(stderr_text)
-            
-            # Wait for process to finish
-            returncode = await process.wait()
-            
-            # Write return code to log file
-            log_file.write(f"\n\nProcess finished with return code: {returncode}\n")
-            log_file.write(f"Test execution finished at: {datetime.now().isoformat()}\n")
+        log.info(f"Test execution started at: {datetime.now().isoformat()}")
+        log.info(f"Configuration: {config}")
+        log.info(f"Command: {' '.join(cmd)}")
+        log.info("-" * 80 + "\n")
+
+        # Create process
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        # Read stdout and stderr in parallel, line by line: written to the log file, displayed
+        # in real time in verbose mode, and only the last lines are kept for the summary
+        await asyncio.gather(
+            read_stream(process.stdout, "stdout", log, stdout_tail, verbose),
+            read_stream(process.stderr, "stderr", log, stderr_tail, verbose)
+        )
+
+        # Wait for process to finish
+        returncode = await process.wait()
+
+        # Write return code to log file
+        log.info(f"\n\nProcess finished with return code: {returncode}")
+        log.info(f"Test execution finished at: {datetime.now().isoformat()}")
         
         return {
             "config": config,
             "returncode": returncode,
-            "stdout": stdout_text,
-            "stderr": stderr_text,
-            "log_file": str(log_filepath)
+            "stdout": "\n".join(stdout_tail),
+            "stderr": "\n".join(stderr_tail),
+            "log_file": str(log_filepath),
+            "job_log": str(job_log_filepath) if job_log_filepath else None
         }
     except Exception as e:
         error_msg = f"Error while executing test {config}: {e}"
         print(error_msg)
         
         # Write error to log file
-        with open(log_filepath, 'a', encoding='utf-8') as log_file:
-            log_file.write(f"\n\nERROR: {error_msg}\n")
-            import traceback
-            traceback.print_exc(file=log_file)
+        log.exception(f"\n\nERROR: {error_msg}")
         
         return {
             "config": config,
             "returncode": -1,
             "stdout": "",
             "stderr": error_msg,
-            "log_file": str(log_filepath)
+            "log_file": str(log_filepath),
+            "job_log": str(job_log_filepath) if job_log_filepath else None
         }
+    finally:
+        close_job_log(log)
+
+def open_job_log(log_filepath):
+    """Logger writing the output of a job to its log file, rotated once it reaches JOB_LOG_MAX_BYTES"""
+    log = logging.getLogger(f"run_parallel_tests.{log_filepath.stem}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(log_filepath, maxBytes=JOB_LOG_MAX_BYTES, backupCount=JOB_LOG_BACKUPS, encoding='utf-8')
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    return log
 
-async def main(verbose=False):
+def close_job_log(log):
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+
+async def read_stream(stream, stream_name, log, tail, verbose=False):
+    """Writes the lines of a job output to its log as they come, keeping the last ones in `tail`"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ""
+    while True:
+        chunk = await stream.read(4096)  # lit 4 Ko à la fois
+        if not chunk:
+            break
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+        if len(pending) > MAX_LINE_LENGTH:
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            write_line(line, stream_name, log, tail, verbose)
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        write_line(pending, stream_name, log, tail, verbose)
+
+def write_line(line, stream_name, log, tail, verbose):
+    line = line.rstrip("\r")
+    if not line.strip():
+        return
+    # Affiche et écrit en temps réel
+    if verbose:
+        print(f"[{stream_name}] {line}")
+    log.info(f"[{stream_name}] {line}")
+    tail.append(line)
+
+def last_job_errors(result, count=5):
+    """Last error records of the structured log of a job"""
+    if not result.get('job_log'):
+        return []
+    try:
+        return last_records(result['job_log'], count, level="ERROR")
+    except OSError:
+        return []
+
+async def main(verbose=False, trace=False, metrics_port=None, browser_server=None, compression=None, base_url=None, profile=None, listing_cache_ttl=None,
+               order="longest-first", dry_run=False):
     # Create logs directory
     logs_dir = ensure_logs_dir()
     
@@ -212,14 +290,26 @@ async def main(verbose=False):
         return
     
     # Limit number of concurrent tests
-    semaphore = asyncio.Semaphore(3)
+    slots = 3
+    semaphore = asyncio.Semaphore(slots)
+
+    # Start the longest configurations first, so that none of them starts once the short ones are done
+    try:
+        indexes, estimates = plan_configs(configs, slots, order)
+        print_plan(configs, indexes, estimates, slots)
+    except Exception as e:
+        print(f"Failed to estimate the configurations, running them in file order: {e}")
+        indexes = list(range(len(configs)))
+    if dry_run:
+        return
     
-    async def run_with_semaphore(config):
+    async def run_with_semaphore(config, index):
         async with semaphore:
-            return await run_test(config, verbose, logs_dir)
+            port = metrics_port + index if metrics_port else None
+            return await run_test(config, verbose, logs_dir, trace, port, browser_server, compression, base_url, profile, listing_cache_ttl)
     
-    # Run all tests in parallel
-    tasks = [run_with_semaphore(config) for config in configs]
+    # Run all tests in parallel, the semaphore lets them start in the planned order
+    tasks = [run_with_semaphore(configs[index], index) for index in indexes]
     logs = await asyncio.gather(*tasks)
     
     # Display logs
@@ -253,6 +343,9 @@ async def main(verbose=False):
                     error_msg = error_lines[-1]
                     
             print(f"   Error: {error_msg}")
+            # Last errors of the scraper, with their match and stage
+            for record in last_job_errors(result):
+                print(f"   {record['at']} {record.get('stage', '-')} {record.get('url', '-')}: {record['message'][:150]}")
             all_passed = False
     
     # Create a summary report
@@ -273,9 +366,13 @@ async def main(verbose=False):
                 f.write(f"{status}: {result['config']['sport']} - {result['config']['region']} - {result['config']['team']}\n")
 
             f.write(f"  Log file: {result.get('log_file', 'N/A')}\n")
+            if result.get('job_log'):
+                f.write(f"  Structured log: {result['job_log']} (see job_log.py)\n")
             if result['returncode'] != 0:
                 error_msg = result['stderr'] or result['stdout'] or "Unknown error"
-                f.write(f"  Error: {error_msg[:200]}...\n")
+                f.write(f"  Error: {error_msg[-200:]}\n")
+                for record in last_job_errors(result):
+                    f.write(f"  {record['at']} {record.get('stage', '-')} {record.get('url', '-')}: {record['message'][:300]}\n")
             f.write("\n")
     
     print("="*60)
@@ -291,5 +388,11 @@ async def main(verbose=False):
 
 if __name__ == "__main__":
     args = parse_arguments()
-    asyncio.run(main(verbose=args.verbose))
-    ctypes.windll.kernel32.SetThreadExecutionState(0x00000001)
\ No newline at end of file
+    keep_awake(True)
+    try:
+        asyncio.run(main(verbose=args.verbose, trace=args.trace, metrics_port=args.metrics_port, browser_server=args.browser_server, compression=args.compression,
+                         base_url=args.base_url,
+                         profile={"rate": args.profile_rate, "slow": args.profile_slow, "snapshots": args.profile_snapshots} if args.profile else None,
+                         listing_cache_ttl=args.listing_cache_ttl, order=args.order, dry_run=args.dry_run))
+    finally:
+        keep_awake(False)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import glob
+import heapq
+import json
+import os
+from collections import Counter
+from date_sorting import season_range
+from extract_data import is_file_existing
+from odds_index import OddsIndex
+
+# Fallbacks when no past run or saved dataset tells better
+DEFAULT_SECONDS_PER_MATCH = 6.0  # wall-clock seconds of a job per match, its 4 workers included
+DEFAULT_MATCHES = {"competition": 380, "team": 50}
+TEAMS_PER_COMPETITION = 20
+# competitions reached per team at each extra depth of a "completly" crawl
+COMPETITIONS_PER_TEAM = 0.2
+# cost of a job with nothing to scrape (browser start, listings of existing data)
+JOB_OVERHEAD_SECONDS = 30
+
+
+# Log files are named <timestamp>_<configuration name>, cut to this length before their extension
+LOG_STEM_LENGTH = 96
+TIMESTAMP_FORMAT_WIDTH = len("YYYYmmdd_HHMMSS")
+
+
+def log_stem(config, timestamp):
+    """Name of the log files of a run of a configuration, without extension (see run_parallel_tests.generate_log_filename)."""
+    return f"{timestamp}_{config_name(config)}"[:LOG_STEM_LENGTH]
+
+
+def config_name(config):
+    """Name of a configuration in the logs, without the timestamp (see run_parallel_tests.generate_log_filename)."""
+    subject = config.get("competition") or config.get("team") or ""
+    name = "_".join("".join(c for c in part if c.isalnum() or c in (" ", "-", "_")).rstrip()
+                    for part in (config["sport"], config["region"], subject))
+    return name.replace(" ", "_")
+
+
+def job_seconds_per_match(logs_dir="logs"):
+    """
+    Seconds per match of the past jobs, from their metrics in logs/metrics/: by configuration
+    name, and over all of them (None without history).
+    """
+    by_name = {}
+    total_seconds = total_matches = 0
+    # timestamp order, so that the latest run of a configuration wins
+    for path in sorted(glob.glob(os.path.join(logs_dir, "metrics", "*.json")), key=os.path.basename):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # failed matches took time too
+        matches = sum(counter["value"] for counter in data.get("counters", []) if counter["name"] in ("matches_completed_total", "matches_failed_total"))
+        if not matches:
+            continue
+        # <timestamp>_<name>.json, the name being cut like in log_stem
+        name = os.path.basename(path)[TIMESTAMP_FORMAT_WIDTH + 1:-len(".json")]
+        by_name[name] = data["uptime_seconds"] / matches
+        total_seconds += data["uptime_seconds"]
+        total_matches += matches
+    return by_name, (total_seconds / total_matches if total_matches else None)
+
+
+def matches_per_season(index, competition=None, team=None):
+    """Largest number of matches saved for one season of a competition or a team, or None."""
+    counts = Counter(match.season for match in index.query(team=team, competition=competition))
+    return max(counts.values()) if counts else None
+
+
+def config_seasons(config):
+    return season_range(config["seasons"]) if config.get("seasons") else [config["season"]]
+
+
+def estimate_config(config, index, seconds_per_match, base_dir="scraped_data"):
+    """
+    Estimated run time of a configuration: its missing seasons times the matches of
+    one season (from the saved datasets of the same competition or team, in other
+    seasons), extended by its spread, times the seconds per match of past runs.
+    """
+    competition, team = config.get("competition"), config.get("team")
+    if config.get("typegame") == "upcoming":
+        seasons = [config["season"]]
+    elif competition:
+        seasons = [s for s in config_seasons(config) if not is_file_existing(base_dir, region=config["region"], competition=competition, season=s)]
+    else:
+        seasons = [s for s in config_seasons(config) if not is_file_existing(base_dir, type_historical="team", team=team, season=s)]
+
+    sources = []
+    known_matches = matches_per_season(index, competition=competition, team=None if competition else team)
+    kind = "competition" if competition else "team"
+    matches_one_season = known_matches or DEFAULT_MATCHES[kind]
+    sources.append("saved data" if known_matches else "default")
+    if config.get("typegame") == "upcoming":
+        # only the fixtures of the next rounds are listed
+        matches_one_season = max(10, matches_one_season // 10)
+
+    spread = config.get("spread")
+    if competition and spread in ("team", "completly"):
+        teams = TEAMS_PER_COMPETITION * DEFAULT_MATCHES["team"]
+        matches_one_season += teams
+        if spread == "completly":
+            depth = int(config.get("crawl_depth", 2))
+            extra_competitions = TEAMS_PER_COMPETITION * COMPETITIONS_PER_TEAM * max(0, depth - 1)
+            matches_one_season += extra_competitions * (DEFAULT_MATCHES["competition"] + teams)
+
+    rate = seconds_per_match["by_name"].get(log_stem(config, "0" * TIMESTAMP_FORMAT_WIDTH)[TIMESTAMP_FORMAT_WIDTH + 1:])
+    if rate is not None:
+        sources.append("past runs of this config")
+    elif seconds_per_match["overall"] is not None:
+        rate = seconds_per_match["overall"]
+        sources.append("past runs")
+    else:
+        rate = DEFAULT_SECONDS_PER_MATCH
+    matches = matches_one_season * len(seasons)
+    return {
+        "matches": matches,
+        "seconds_per_match": rate,
+        "seconds": JOB_OVERHEAD_SECONDS + matches * rate,
+        "seasons": len(seasons),
+        "sources": sources,
+    }
+
+
+def schedule(durations, slots):
+    """
+    Simulates the runner: each job starts on the first free slot, in the given order.
+    Returns (slot of each job, time at which the last job ends).
+    """
+    free_at = [(0.0, slot) for slot in range(slots)]
+    assignment = []
+    for duration in durations:
+        start, slot = heapq.heappop(free_at)
+        assignment.append(slot)
+        heapq.heappush(free_at, (start + duration, slot))
+    return assignment, max(end for end, _ in free_at)
+
+
+def plan_configs(configs, slots=3, order="longest-first", logs_dir="logs", base_dir="scraped_data"):
+    """
+    Estimates every configuration and returns (order of the configuration indexes, estimates).
+    With "longest-first", the most expensive configurations start first, so that a long
+    job listed last does not start once the short ones are done (greedy LPT scheduling).
+    """
+    index = OddsIndex.open(base_dir)
+    by_name, overall = job_seconds_per_match(logs_dir)
+    seconds_per_match = {"by_name": by_name, "overall": overall}
+    estimates = [estimate_config(config, index, seconds_per_match, base_dir) for config in configs]
+    indexes = list(range(len(configs)))
+    if order == "longest-first":
+        indexes.sort(key=lambda i: estimates[i]["seconds"], reverse=True)
+    return indexes, estimates
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}" if hours else f"{rest // 60}m{rest % 60:02d}"
+
+
+def print_plan(configs, indexes, estimates, slots=3):
+    """Dry-run report: estimates in the planned order, and the run time against the file order."""
+    assignment, planned = schedule([estimates[i]["seconds"] for i in indexes], slots)
+    _, file_order = schedule([estimate["seconds"] for estimate in estimates], slots)
+    print(f"{'#':>3} {'configuration':<45} {'seasons':>7} {'matches':>8} {'s/match':>8} {'estimate':>9} {'slot':>4}  source")
+    for position, i in enumerate(indexes):
+        estimate = estimates[i]
+        name = f"{config_name(configs[i])} {configs[i].get('seasons') or configs[i].get('season', '')}"
+        print(f"{i:>3} {name[:45]:<45} {estimate['seasons']:>7} {int(estimate['matches']):>8} "
+              f"{estimate['seconds_per_match']:>8.1f} {format_duration(estimate['seconds']):>9} {assignment[position]:>4}  "
+              f"{', '.join(estimate['sources'])}")
+    print(f"Estimated total run time: {format_duration(planned)} (file order: {format_duration(file_order)}) on {slots} slots")
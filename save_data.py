@@ -1,14 +1,132 @@
+import bz2
+import gzip
 import json
+import lzma
 import os
 from datetime import datetime
+from event_model import EventRecord
+import dead_letters
 
-def save_odds_data(odds_data, base_dir="scraped_data", type_historical="competition", type_game="historcal"):
+# Compression of the saved datasets, chosen per run with configure_compression()
+COMPRESSIONS = {
+    "gzip": (".gz", gzip.open),
+    "xz": (".xz", lzma.open),
+    "bz2": (".bz2", bz2.open),
+}
+DATA_FILE_SUFFIXES = (".json",) + tuple(f".json{suffix}" for suffix, _ in COMPRESSIONS.values())
+
+_compression = None
+
+
+def configure_compression(compression):
+    """Selects the compression of the files written by save_odds_data ("gzip", "xz", "bz2" or None)."""
+    global _compression
+    if compression in (None, "", "none"):
+        _compression = None
+    elif compression in COMPRESSIONS:
+        _compression = compression
+    else:
+        raise ValueError(f"Unknown compression '{compression}', expected one of: none, {', '.join(COMPRESSIONS)}")
+
+
+def is_data_file(filename):
+    """Whether `filename` is a dataset, compressed or not."""
+    return filename.lower().endswith(DATA_FILE_SUFFIXES)
+
+
+def compression_of(path):
+    """Compression of a dataset according to its extension, None for plain JSON."""
+    for name, (suffix, _) in COMPRESSIONS.items():
+        if path.lower().endswith(f".json{suffix}"):
+            return name
+    return None
+
+
+def open_data_file(path, mode="r"):
+    """Opens a dataset in text mode, decompressing or compressing it according to its extension."""
+    for suffix, opener in COMPRESSIONS.values():
+        if path.lower().endswith(f".json{suffix}"):
+            return opener(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_data_file(filepath, odds_data, compression=None):
+    """
+    Writes a dataset, atomically. Plain files are pretty-printed, compressed
+    ones are compact with one event per line.
+    """
+    if compression:
+        write_data_text(filepath, dumps_odds_data_lines(odds_data), compression)
+        return
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(odds_data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+
+
+def dumps_data_file(odds_data, compression=None):
+    """Text of a dataset, as written by write_data_file."""
+    if compression:
+        return dumps_odds_data_lines(odds_data)
+    return json.dumps(odds_data, indent=2, ensure_ascii=False)
+
+
+def write_data_text(filepath, text, compression=None):
+    """Writes the text of a dataset (see dumps_data_file) atomically, compressed if asked."""
+    tmp_path = f"{filepath}.tmp"
+    opener = COMPRESSIONS[compression][1] if compression else open
+    with opener(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, filepath)
+
+
+def dumps_odds_data_lines(odds_data):
+    """Compact JSON of a dataset with each event on its own line."""
+    header = {key: value for key, value in odds_data.items() if key != "events"}
+    header_json = json.dumps(header, ensure_ascii=False, separators=(",", ":"))
+    events = ",\n".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) for event in odds_data.get("events", []))
+    return f'{header_json[:-1]}{"," if header else ""}"events":[\n{events}\n]}}\n'
+
+
+def serialize_event(event):
+    """Converts an EventRecord to the JSON output format, plain dicts are kept as they are."""
+    if isinstance(event, EventRecord):
+        return event.to_dict()
+    return event
+
+
+def serialize_odds_data(odds_data):
+    """Returns a JSON serializable copy of odds_data, odds dates are formatted here only."""
+    odds_data = dict(odds_data)
+    odds_data["events"] = [serialize_event(event) for event in odds_data.get("events", [])]
+    return odds_data
+
+
+def clean_filename(text):
+    """Clean names for filesystem safety"""
+    # Replace problematic characters
+    text = text.replace('/', '-')  # Replace slashes with hyphens
+    text = text.replace('\\', '-')  # Replace backslashes with hyphens
+    text = text.replace(':', '-')   # Replace colons with hyphens
+    text = text.replace('*', '-')   # Replace asterisks with hyphens
+    text = text.replace('?', '-')   # Replace question marks with hyphens
+    text = text.replace('"', '-')   # Replace double quotes with hyphens
+    text = text.replace('<', '-')   # Replace less than with hyphens
+    text = text.replace('>', '-')   # Replace greater than with hyphens
+    text = text.replace('|', '-')   # Replace pipes with hyphens
+    
+    # Keep only alphanumeric characters, spaces, hyphens, and underscores
+    return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_')).rstrip().replace(' ', '_')
+
+
+def save_odds_data(odds_data, base_dir="scraped_data", type_historical="competition", type_game="historcal", compression=None):
     """
     Save odds data to a JSON file with an descriptive filename.
     
     Args:
         odds_data (dict): The data to be saved
         base_dir (str): The base directory where files will be saved
+        compression (str): "gzip", "xz" or "bz2", defaults to the one of the run (see configure_compression)
     Returns:
         str: The file path where data was saved
     """
@@ -22,22 +140,6 @@ def save_odds_data(odds_data, base_dir="scraped_data", type_historical="competit
     season = odds_data.get("season", "unknown_season")
     bookmaker = odds_data.get("bookmaker", "unknown_bookmaker")
     
-    # Clean names for filesystem safety
-    def clean_filename(text):
-        # Replace problematic characters
-        text = text.replace('/', '-')  # Replace slashes with hyphens
-        text = text.replace('\\', '-')  # Replace backslashes with hyphens
-        text = text.replace(':', '-')   # Replace colons with hyphens
-        text = text.replace('*', '-')   # Replace asterisks with hyphens
-        text = text.replace('?', '-')   # Replace question marks with hyphens
-        text = text.replace('"', '-')   # Replace double quotes with hyphens
-        text = text.replace('<', '-')   # Replace less than with hyphens
-        text = text.replace('>', '-')   # Replace greater than with hyphens
-        text = text.replace('|', '-')   # Replace pipes with hyphens
-        
-        # Keep only alphanumeric characters, spaces, hyphens, and underscores
-        return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_')).rstrip().replace(' ', '_')
-    
     # Create filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     if type_historical == "competition":
@@ -48,20 +150,29 @@ def save_odds_data(odds_data, base_dir="scraped_data", type_historical="competit
     elif type_historical == "team":
         filename = f"{timestamp}_{clean_filename(sport)}_{clean_filename(odds_data['team'])}_team_{clean_filename(season)}_{clean_filename(bookmaker)}.json"
     
+    compression = compression or _compression
+    if compression:
+        filename += COMPRESSIONS[compression][0]
+
     # Full file path
     filepath = os.path.join(base_dir, filename)
     
-    # Save data as formatted JSON
-    json_str = json.dumps(odds_data, indent=2, ensure_ascii=False)
+    # Serialized once, in the format of the file (compact lines when compressed)
+    data = serialize_odds_data(odds_data)
+    json_str = dumps_data_file(data, compression)
 
-    # Calculer la taille en octets
+    # Calculer la taille en octets du JSON écrit
     size_bytes = len(json_str.encode("utf-8"))
 
     # Vérifier si la taille dépasse 1 Ko
     if size_bytes > 1024:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(json_str)
-        print(f"Data successfully saved to: {filepath} ({size_bytes} bytes)")
+        write_data_text(filepath, json_str, compression)
+        if compression:
+            print(f"Data successfully saved to: {filepath} ({size_bytes} bytes, {os.path.getsize(filepath)} compressed)")
+        else:
+            print(f"Data successfully saved to: {filepath} ({size_bytes} bytes)")
+        # the failed matches scraped again are only resolved once on disk
+        dead_letters.resolve_saved(event.get("url") for event in data.get("events", []))
     else:
         print(f"Data not saved due to small size ({size_bytes} octets)")
         
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+from datetime import datetime
+from save_data import COMPRESSIONS, clean_filename, configure_compression, save_odds_data, serialize_event
+from event_model import EventRecord, ODDS_KEYS
+from manage_date import format_timestamp, datetime_to_timestamp
+
+SNAPSHOTS_DIR = "snapshots"
+HEADER_FIELDS = ("home_team", "away_team", "date_time", "score")
+# key of base.json recording the deltas folded into it
+COMPACTED_KEY = "compacted_deltas"
+
+
+def snapshot_dir(odds_data, base_dir="scraped_data"):
+    """Directory holding the deltas of one upcoming competition/bookmaker."""
+    name = "_".join(clean_filename(odds_data.get(key, f"unknown_{key}")) for key in ("sport", "region", "competition", "bookmaker"))
+    return os.path.join(base_dir, SNAPSHOTS_DIR, name)
+
+
+def save_upcoming_snapshot(odds_data, base_dir="scraped_data", listed_urls=None):
+    """
+    Stores an upcoming scrape as a delta against the last stored state.
+
+    Instead of writing every fixture with its full odds history, only the
+    changes since the previous run are appended to `deltas.jsonl`:
+    - "add": a fixture seen for the first time, with its full event
+    - "update": header fields (date, score, teams) that changed
+    - "points": odds movement points newer than the last stored ones
+    - "remove": a fixture that is no longer listed
+
+    A batch may hold only some of the fixtures (the matches polled this round,
+    a failed poll, a match that just kicked off): a fixture missing from it is
+    only removed when `listed_urls`, every URL of a full refresh of the
+    listing, does not list it either. An empty batch stores nothing.
+
+    `state.json` keeps, per fixture, the header fields and the last timestamp
+    of each outcome (with the values seen at that time), and the size of
+    `deltas.jsonl` once its deltas were taken into account: deltas appended by a
+    run stopped before writing the state are cut off by the next run, so that
+    they are not stored twice. Use `python snapshot_store.py compact` to fold
+    the deltas into a dataset in the usual JSON format.
+
+    Returns:
+        str: The path of the deltas file, None for an empty batch
+    """
+    if not odds_data["events"]:
+        print("Snapshot not saved, no upcoming match in the batch")
+        return None
+    directory = snapshot_dir(odds_data, base_dir)
+    os.makedirs(directory, exist_ok=True)
+    state_path = os.path.join(directory, "state.json")
+    deltas_path = os.path.join(directory, "deltas.jsonl")
+    state = _load_json(state_path, {"meta": {}, "fixtures": {}})
+    fixtures = state["fixtures"]
+    deltas_state = _deltas_state(state, deltas_path)
+    _truncate(deltas_path, deltas_state["offset"])
+
+    at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    deltas = []
+    seen = set()
+    new_points = 0
+    for event in odds_data["events"]:
+        url = event.url if isinstance(event, EventRecord) else event.get("url")
+        if not url:
+            continue
+        seen.add(url)
+        header, last_timestamps, points = _event_state(event)
+        stored = fixtures.get(url)
+        if stored is None:
+            deltas.append({"at": at, "type": "add", "url": url, "event": serialize_event(event)})
+            new_points += sum(len(p) for p in points.values())
+        else:
+            changed = {field: value for field, value in header.items() if stored["header"].get(field) != value}
+            if changed:
+                deltas.append({"at": at, "type": "update", "url": url, "fields": changed})
+            odds = {}
+            stored_values = stored.get("last_values") or [[] for _ in ODDS_KEYS]
+            for index, key in enumerate(ODDS_KEYS):
+                # a point at the last stored minute is new if its value was not seen at that minute
+                last, seen_values = stored["last"][index], stored_values[index]
+                fresh = [point for point in points[key] if point[0] > last or (point[0] == last and point[1] not in seen_values)]
+                if fresh:
+                    odds[key] = [{"value": value, "date_time": format_timestamp(ts)} for ts, value in fresh]
+                    new_points += len(fresh)
+                    points[key] = [(ts, value) for ts, value in points[key] if ts >= last] + [(last, value) for value in seen_values]
+                else:
+                    points[key] = [(last, value) for value in seen_values]
+            if odds:
+                deltas.append({"at": at, "type": "points", "url": url, "odds": odds})
+            last_timestamps = [max(old, new) for old, new in zip(stored["last"], last_timestamps)]
+        fixtures[url] = {"header": header, "last": last_timestamps, "last_values": _last_values(points, last_timestamps)}
+
+    # without a full listing, a fixture missing from the batch may still be listed
+    listed = set(listed_urls) if listed_urls is not None else None
+    removed = [url for url in fixtures if url not in seen and listed is not None and url not in listed]
+    for url in removed:
+        deltas.append({"at": at, "type": "remove", "url": url})
+        del fixtures[url]
+
+    state["meta"] = {key: value for key, value in odds_data.items() if key != "events"}
+    if deltas:
+        with open(deltas_path, "a", encoding="utf-8") as f:
+            for delta in deltas:
+                f.write(json.dumps(delta, ensure_ascii=False) + "\n")
+    # the deltas only count once the state says so
+    state["deltas"] = dict(deltas_state, offset=os.path.getsize(deltas_path) if os.path.exists(deltas_path) else 0)
+    _write_json(state_path, state)
+
+    added = sum(1 for delta in deltas if delta["type"] == "add")
+    print(f"Snapshot saved to: {deltas_path} ({added} new fixtures, {len(removed)} removed, {new_points} new odds points)")
+    return deltas_path
+
+
+def compact_snapshot(directory, export=False, base_dir="scraped_data"):
+    """
+    Folds `deltas.jsonl` into `base.json` and empties the deltas.
+
+    `base.json` has the usual dataset format and keeps every fixture ever seen;
+    fixtures that were removed from the listing carry "removed_at".
+    With `export`, the consolidated dataset is also saved in `base_dir` like
+    a regular upcoming scrape.
+
+    Each step can be interrupted: `base.json` records the generation and the
+    size of the deltas folded into it, then the state starts a new generation
+    of deltas, then the deltas file is emptied. A compaction run again after a
+    crash skips the deltas already in `base.json`.
+    """
+    base_path = os.path.join(directory, "base.json")
+    deltas_path = os.path.join(directory, "deltas.jsonl")
+    state_path = os.path.join(directory, "state.json")
+    state = _load_json(state_path, {"meta": {}, "fixtures": {}})
+    deltas_state = _deltas_state(state, deltas_path)
+    base = _load_json(base_path, dict(state["meta"], events=[]))
+    compacted = base.pop(COMPACTED_KEY, None) or {}
+    events = {event.get("url"): event for event in base["events"]}
+
+    # deltas of this generation already folded into base.json by an interrupted compaction
+    start = compacted.get("offset", 0) if compacted.get("generation") == deltas_state["generation"] else 0
+    applied = 0
+    if os.path.exists(deltas_path):
+        with open(deltas_path, "rb") as f:
+            f.seek(start)
+            # deltas appended after the last state write are not committed yet
+            for line in f.read(max(0, deltas_state["offset"] - start)).decode("utf-8").splitlines():
+                try:
+                    delta = json.loads(line)
+                except json.JSONDecodeError:
+                    # interrupted write, the state was not updated for it either
+                    continue
+                _apply_delta(events, delta)
+                applied += 1
+
+    base.update(state["meta"])
+    base["events"] = list(events.values())
+    _write_json(base_path, dict(base, **{COMPACTED_KEY: {"generation": deltas_state["generation"], "offset": deltas_state["offset"]}}), indent=2)
+    state["deltas"] = {"generation": deltas_state["generation"] + 1, "offset": 0}
+    _write_json(state_path, state)
+    _truncate(deltas_path, 0)
+    print(f"Compacted {applied} deltas into {base_path} ({len(base['events'])} fixtures)")
+
+    if export:
+        return save_odds_data(base, base_dir=base_dir, type_game="upcoming")
+    return base_path
+
+
+def _deltas_state(state, deltas_path):
+    """Generation and committed size of the deltas file ({"generation", "offset"})."""
+    if "deltas" in state:
+        return dict(state["deltas"])
+    # state written before the offsets were kept: every delta of the file is committed
+    return {"generation": 0, "offset": os.path.getsize(deltas_path) if os.path.exists(deltas_path) else 0}
+
+
+def _truncate(path, size):
+    """Cuts the deltas appended after `size` bytes (not committed to the state)."""
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+
+
+def _last_values(points, last_timestamps):
+    """Values of each outcome at its last timestamp."""
+    return [sorted({value for ts, value in points[key] if ts == last}) for key, last in zip(ODDS_KEYS, last_timestamps)]
+
+
+def _apply_delta(events, delta):
+    url = delta["url"]
+    if delta["type"] == "add":
+        events[url] = dict(delta["event"], url=url)
+        return
+    event = events.get(url)
+    if event is None:
+        return
+    if delta["type"] == "update":
+        event.update(delta["fields"])
+    elif delta["type"] == "remove":
+        event["removed_at"] = delta["at"]
+    elif delta["type"] == "points":
+        for key, points in delta["odds"].items():
+            current = event["odds"].setdefault(key, [])
+            # keep the order of the tooltip (latest first) when the existing list is ordered that way
+            if len(current) < 2 or current[0]["date_time"] >= current[-1]["date_time"]:
+                event["odds"][key] = sorted(points, key=lambda point: point["date_time"], reverse=True) + current
+            else:
+                current.extend(sorted(points, key=lambda point: point["date_time"]))
+
+
+def _event_state(event):
+    """Returns (header fields, last timestamp per outcome, points per outcome) of an event."""
+    if isinstance(event, EventRecord):
+        header = {field: getattr(event, field) for field in HEADER_FIELDS}
+        header["date_time"] = format_timestamp(event.date_time)
+        points = {key: list(zip(*event.odds_series(key))) for key in ODDS_KEYS}
+    else:
+        header = {field: event.get(field) for field in HEADER_FIELDS}
+        points = {
+            key: [(datetime_to_timestamp(datetime.strptime(point["date_time"], "%Y-%m-%d %H:%M")), point["value"])
+                  for point in event.get("odds", {}).get(key, []) if point.get("date_time")]
+            for key in ODDS_KEYS
+        }
+    last = [max((ts for ts, _ in points[key]), default=-1) for key in ODDS_KEYS]
+    return header, last, points
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data, indent=None):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Manage the delta snapshots of upcoming scrapes')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact = subparsers.add_parser("compact", help="Fold the deltas into one consolidated dataset")
+    compact.add_argument("directories", nargs="*",
+                         help="Snapshot directories (default: every directory in scraped_data/snapshots)")
+    compact.add_argument("--base-dir", default="scraped_data")
+    compact.add_argument("--export", action="store_true",
+                         help="Also save the consolidated dataset in base-dir like a regular upcoming scrape")
+    compact.add_argument("--compression", default=None, choices=list(COMPRESSIONS),
+                         help="Compression of the exported dataset")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    configure_compression(args.compression)
+    directories = args.directories
+    if not directories:
+        root = os.path.join(args.base_dir, SNAPSHOTS_DIR)
+        directories = [os.path.join(root, name) for name in sorted(os.listdir(root))] if os.path.isdir(root) else []
+    for directory in directories:
+        compact_snapshot(directory, export=args.export, base_dir=args.base_dir)
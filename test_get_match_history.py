@@ -1,268 +1,303 @@
 import asyncio
 import re
 from playwright.async_api import TimeoutError
-import pytest
-from test_website_navigation import goto_with_retry, remove_overlays, handle_cookie_consent
-from manage_date import add_missing_year, parse_oddsportal_date_to_datetime
-from manage_links import get_team_links, get_competition_link
-from extract_data import extract_region_competition, extract_season
+from test_website_navigation import remove_overlays
+from manage_date import parse_oddsportal_date_to_datetime
+from manage_links import absolute_url
+from extract_data import extract_season
 from date_sorting import check_season_position, season_to_date
-import traceback
+from tracing import span, traced, span_attrs
+import metrics
+import job_log
+from listing_cache import cached_listing_pages, put_listing_page, mark_last_page
 
+async def get_history_matchs_urls(page, url, season):
+    """Retrieves match URLs for a given competition page and season."""
+    rows = await get_history_matchs_rows(page, url, season)
+    if rows is None:
+        return None
+    return [row["url"] for row in rows]
+
+
+# months of the season start (see season_boundary="08-01") and of its end in the listings without years
+SEASON_START_MONTH = 8
+SEASON_END_MONTH = 5
+YEAR_PATTERN = re.compile(r"\b\d{4}\b")
+
+LISTING_ROW_SELECTOR = "a.next-m\\:flex > div[data-testid='game-row']"
+
+# Extracts, in one round trip, the URL and the kickoff shown by the listing for every game row.
+# Rows are grouped under date headers ("16 Aug 2024", "Today, 19 Oct"), the last header seen
+# before a row gives its date.
+LISTING_ROWS_SCRIPT = """(rows) => {
+    let lastDate = null;
+    return rows.map(row => {
+        const link = row.parentElement;
+        const container = row.closest('[class*="eventRow"]') || link.parentElement;
+        if (container) {
+            const headerText = container.innerText.replace(link.innerText, '');
+            const date = headerText.match(/(\\d{1,2} [A-Za-z]{3}(?: \\d{4})?)/);
+            if (date) lastDate = date[1];
+        }
+        const timeItem = row.querySelector('[data-testid="time-item"]');
+        const time = timeItem ? timeItem.innerText.match(/(\\d{1,2}:\\d{2})/) : null;
+        return {href: link.getAttribute('href'), date: lastDate, time: time ? time[1] : null};
+    });
+}"""
 
-@pytest.mark.asyncio
-async def get_match_details(game_page, game_url, bookmaker_name, season): 
-    """
-    Asynchronously retrieves detailed information for a single match.
-    Handles odds extraction that appears on hover.
+
+def parse_listing_kickoff(date_str, time_str, url_season=None):
     """
+    Kickoff of a listing row as "YYYY-MM-DD HH:MM", or None if the listing does not show it.
 
-    try:
-        print(f"Navigating to match URL: {game_url}")
-        success = await goto_with_retry(game_page, game_url)
-        if not success:
-            await game_page.close()
-            print(f"Skipping match due to load failure: {game_url}")
+    The date headers of the listings mostly show no year. With the season in the URL of
+    the row (`url_season`, eg. "2018-2019", see extract_season), the year is the first one
+    of the season from August and the second one until May; a date of June or July may
+    belong to either, None is returned and the caller falls back on the season of the URL.
+    Without it (current season), the year closest to today is used.
+    """
+    if not date_str or not time_str:
+        return None
+    kickoff = parse_oddsportal_date_to_datetime(f"{date_str}, {time_str}")
+    if kickoff and url_season and not YEAR_PATTERN.search(date_str):
+        start_year = int(url_season.split("-")[0])
+        if kickoff.month >= SEASON_START_MONTH:
+            year = start_year
+        elif kickoff.month <= SEASON_END_MONTH:
+            year = start_year + 1
+        else:
             return None
-
-        # ✅ GESTION DES POPUPS BLOQUANTES
         try:
-            # Bannière cookies (OneTrust)
-            await handle_cookie_consent(game_page)
+            kickoff = kickoff.replace(year=year)
+        except ValueError:
+            # 29 Feb of another year
+            return None
+    return kickoff.strftime("%Y-%m-%d %H:%M") if kickoff else None
 
-            # Supprime les overlays bloquants
-            await remove_overlays(game_page) 
-        except Exception as e:
-            print(f"Popup handling failed: {e}")
 
-        # Attendre la fin du chargement
-        try:
-            await game_page.wait_for_selector("div[class*='Loader']", state="detached", timeout=15000)
-        except Exception:
-            print("Loader not detected or already gone.")
+def sort_rows_by_kickoff(rows):
+    """Orders the rows with a kickoff from the latest to the earliest, the rows without one keep their place."""
+    dated = iter(sorted((row for row in rows if row["date_time"]), key=lambda row: row["date_time"], reverse=True))
+    return [next(dated) if row["date_time"] else row for row in rows]
 
-        await remove_overlays(game_page)
-        await asyncio.sleep(2)
 
-        # Attendre les éléments principaux
-        for _ in range(3):
-            try:
-                await game_page.wait_for_selector("[data-testid='game-host']", timeout=10000)
-                break
-            except Exception as e:
-                print(f"Retrying to find main elements due to: {e}")
-                await goto_with_retry(game_page, game_url)
-                if _ == 2:
-                    print(f"Skipping match due to persistent load issues: {game_url}")
-                    await game_page.close()
-                    return None
-
-        # Extraction des infos du match
-        home_team = await game_page.text_content("[data-testid='game-host']")
-        home_point_element = await game_page.query_selector('[data-testid="game-host"] + div')
-        home_point = await home_point_element.text_content() if home_point_element else "N/A"
-
-        away_team = await game_page.text_content("[data-testid='game-guest']")
-        away_point_element = await game_page.query_selector('//div[@data-testid="game-guest"]/preceding-sibling::div[1]')
-        away_point = await away_point_element.text_content() if away_point_element else "N/A"
-
-        # Date du match
-        game_time = await game_page.text_content("[data-testid='game-time-item']")
-        game_datetime = parse_oddsportal_date_to_datetime(game_time).strftime("%Y-%m-%d %H:%M")
-
-        game_temporal_position = check_season_position(season, game_datetime, season_boundary="08-01")
+def unique_rows(rows):
+    """
+    Rows without the matches listed twice, the first one being kept: cached pages
+    and the pages read after them may overlap once newly finished matches shifted
+    the listing.
+    """
+    seen = set()
+    return [row for row in rows if not (row["url"] in seen or seen.add(row["url"]))]
+
+
+def listing_row_position(full_url, kickoff, season):
+    """
+    Returns (date used, position in the season: 1 before, 2 during, 3 after) of a listing row,
+    from its kickoff when known and from the season in its URL otherwise, or (None, None).
+    """
+    season_game = extract_season(full_url)
+    if kickoff:
+        game_datetime = kickoff
+    elif season_game:
+        game_datetime = season_to_date(season_game)
+    else:
+        return None, None
+    return game_datetime, check_season_position(season, game_datetime, season_boundary="08-01")
+
+
+def select_listing_rows(listed_rows, season):
+    """
+    Match rows of the listed rows of a listing (eg. from the listing cache), with the
+    same season rules as get_history_matchs_rows. Returns None if the first row is
+    already before the season start.
+    """
+    game_rows = []
+    for listed_row in listed_rows:
+        full_url = absolute_url(listed_row["href"])
+        kickoff = parse_listing_kickoff(listed_row["date"], listed_row["time"], extract_season(full_url))
+        game_datetime, game_temporal_position = listing_row_position(full_url, kickoff, season)
         if game_temporal_position == 1:
-            print(f"Skipping match before season start date: {game_datetime} for season {season}")
-            return 1
+            return sort_rows_by_kickoff(unique_rows(game_rows)) or None
         if game_temporal_position == 3:
-            print(f"Skipping match after season end date: {game_datetime} for season {season}")
-            return None
+            continue
+        game_rows.append({"url": full_url, "date_time": kickoff})
+    return sort_rows_by_kickoff(unique_rows(game_rows))
 
-        event_data = {
-            "home_team": home_team.strip() if home_team else "N/A",
-            "away_team": away_team.strip() if away_team else "N/A",
-            "date_time": game_datetime,
-            "score": f"{home_point}-{away_point}",
-            "odds": {"home_win_odds": [], "draw_odds": [], "away_win_odds": []}
-        }
 
-        # Trouver la section du bookmaker
-        pattern_bookmaker = rf"^{bookmaker_name}(?:\.[a-z]+)?$"
-        link_bookmaker = game_page.locator('a > p', has_text=re.compile(pattern_bookmaker, re.IGNORECASE))
+def reaches_season_start(listed_rows, season):
+    """True if a listed row is before the start of the season: the pages after it are not needed."""
+    for listed_row in listed_rows:
+        full_url = absolute_url(listed_row["href"])
+        kickoff = parse_listing_kickoff(listed_row["date"], listed_row["time"], extract_season(full_url))
+        if listing_row_position(full_url, kickoff, season)[1] == 1:
+            return True
+    return False
 
-        # Extraire région et compétition
-        competition_link = await get_competition_link(game_page)
-        region_name, competition_name = extract_region_competition(competition_link)
-        
-        if await link_bookmaker.count() > 0:
-            bookmaker_block = link_bookmaker.locator("xpath=../../..")
-            await bookmaker_block.wait_for(state="visible")
-            odds_cells = bookmaker_block.locator('[data-testid="odd-container"]')
-
-            for i in range(await odds_cells.count()):
-                for _ in range(3):
-                    try:
-                        await odds_cells.nth(i).wait_for(state="visible", timeout=10000)
-                        break
-                    except Exception as e:
-                        print(f"Retrying to find odds cell due to: {e}")
-                        await goto_with_retry(game_page, game_url)
-                        await game_page.mouse.move(0, 0)
-                        if _ == 2:
-                            print(f"Skipping odds extraction due to persistent load issues: {game_url}")
-                            break
-
-                # ✅ Survoler la cote
-                try:
-                    await remove_overlays(game_page)
-                    await odds_cells.nth(i).hover()
-                    await asyncio.sleep(1.5)
-                except Exception as e:
-                    print(f"Hover failed: {e}")
-                    continue
 
-                # Extraire les cotes affichées
-                try:
-                    odds_block = None
-                    odds_text = None
-                    for _ in range(3):
-                        try:
-                            await game_page.wait_for_selector("h3:has-text('Odds movement')", timeout=12000)
-                            odds_headers = game_page.locator("h3", has_text="Odds movement")
-                            if await odds_headers.count() > 0:
-                                odds_block = odds_headers.locator("..")
-                                await odds_block.wait_for(state="attached", timeout=10000)
-                                odds_text = await odds_block.text_content()
-                                break
-                        except Exception as e:
-                            print(f"Retry {_+1}/3: Error while trying to find odds movement: {e}")
-                            await remove_overlays(game_page) 
-                            await asyncio.sleep(2)
-                            await odds_cells.nth(i).hover()
-
-                    if not odds_block or not odds_text:
-                        print(f"No odds block found for {game_url}")
-                        continue
-
-                    pattern = r"(\d{1,2} \w{3,}, \d{2}:\d{2})([0-9]+\.[0-9]+)"
-                    matches_odds_datetime = re.findall(pattern, odds_text)
+def cached_listing_rows(url, season):
+    """
+    Returns (listed rows, number of pages) of the fresh pages of a listing in the
+    listing cache, and whether they cover the season: they reach its start or the last page.
+    """
+    listed_rows = []
+    pages = 0
+    for pages, entry in cached_listing_pages(url):
+        listed_rows += entry["rows"]
+        if not entry["has_next_page"] or reaches_season_start(entry["rows"], season):
+            return listed_rows, pages, True
+    return listed_rows, pages, False
 
-                    for date_odds_str, value in matches_odds_datetime:
-                        date_odds = add_missing_year(date_odds_str, game_datetime)
-                        key = ["home_win_odds", "draw_odds", "away_win_odds"][i]
-                        event_data["odds"][key].append({
-                            "value": float(value),
-                            "date_time": date_odds
-                        })
 
-                except Exception as e:
-                    print(f"Failed to extract odds: {e}")
+def listing_from_cache(url, season, cached=None):
+    """
+    Returns (True, match rows as get_history_matchs_rows) when the listing cache covers the season, (False, None) otherwise.
+    `cached` is the result of cached_listing_rows when the caller already read it.
+    """
+    listed_rows, pages, covered = cached or cached_listing_rows(url, season)
+    if not covered:
+        return False, None
+    metrics.inc("listing_cache_total", outcome="hit")
+    print(f"Listing served from cache ({pages} pages): {url}")
+    return True, select_listing_rows(listed_rows, season)
 
-                await game_page.mouse.move(0, 0)
 
-        return event_data, (region_name, competition_name)
-        
-    except Exception as e:
-        print(f"Failed to process match {game_url}: {e}")
-        traceback.print_exc()
-        return None
+async def load_listing_urls(page, url, season):
+    """
+    Match URLs of a listing: from the listing cache when its fresh pages cover the season,
+    otherwise by browsing `url` with `page` (see get_history_matchs_urls).
+    """
+    covered, rows = listing_from_cache(url, season)
+    if covered:
+        return None if rows is None else [row["url"] for row in rows]
+    await page.goto(url, wait_until='domcontentloaded')
+    return await get_history_matchs_urls(page, url, season)
 
 
-@pytest.mark.asyncio
-async def process_game(context, game_url, bookmaker_name, season, type_historical="competition"):
-    """Asynchronously processes a single game with pytest-asyncio."""
-    game_page = await context.new_page()
+async def jump_to_listing_page(page, page_number, first_page_hrefs):
+    """
+    Opens a page of the listing shown by `page` directly (#/page/N/), instead of clicking
+    "Next" through the pages already cached. Returns False if the site showed another page.
+    """
     try:
-        result = await get_match_details(game_page, game_url, bookmaker_name, season)
-        if not result:
-            print(f"Skipping match due to failed details extraction: {game_url}")
-            return None
-
-        event_data, region_competion_names = result
-        home_team_link, away_team_link = await get_team_links(game_page)
-        if event_data == 1 and type_historical == "competition":
-            print("Stop processing due to exceeded date limit for team historical data")
-            return None
-        return event_data, (home_team_link, away_team_link), game_page, region_competion_names
+        with span("listing_jump", url=page.url, page_number=page_number):
+            await page.goto(f"{page.url.split('#')[0]}#/page/{page_number}/", wait_until='domcontentloaded')
+            await page.wait_for_load_state("networkidle")
+            await page.wait_for_selector(LISTING_ROW_SELECTOR, state='visible', timeout=15000)
+            listed_rows = await page.eval_on_selector_all(LISTING_ROW_SELECTOR, LISTING_ROWS_SCRIPT)
     except Exception as e:
-        print(f"Failed to process match {game_url}: {e}")
-        return None
-    finally:
-        if not game_page.is_closed():
-            await game_page.close()
+        job_log.warning(f"Failed to open page {page_number} of the listing: {e}", stage="listing_jump", url=page.url)
+        return False
+    return bool(listed_rows) and [row["href"] for row in listed_rows] != first_page_hrefs
 
 
-async def limited_process_game(semaphore, ctx, url, bookmaker_name, season, type_historical="competition"):
-    """Processes a single game with concurrency control."""
-    async with semaphore:
-        return await process_game(ctx, url, bookmaker_name, season, type_historical)
-    
+@traced("listing", url=lambda args: args["url"])
+async def get_history_matchs_rows(page, url, season):
+    """
+    Retrieves the match rows ({"url", "date_time"}) of a given listing page and season.
 
-async def get_history_matchs_urls(page, url, season):
-    """Retrieves match URLs for a given competition page and season."""
-    game_urls = []
+    "date_time" is the kickoff shown by the listing, or None when it cannot be
+    read. Rows outside the season are skipped, using the kickoff when known and
+    the season in the match URL otherwise, and the pagination stops at the
+    first row before the season start. Returns None if that row is the first one.
+
+    The pages read are kept in the listing cache: the listing is not walked
+    again while its cached pages cover the season, and the browsing starts
+    after the cached pages otherwise.
+    """
+    listing_attrs = span_attrs()
+    # the cache is read once, for the whole listing or for the pages to skip
+    cached = cached_listing_rows(url, season)
+    covered, rows = listing_from_cache(url, season, cached)
+    if covered:
+        listing_attrs["outcome"] = "cached"
+        return rows
+    game_rows = []
+    page_number = 1
     #await asyncio.sleep(5)
     await remove_overlays(page)
+
+    cached_rows, cached_pages, _ = cached
+    if cached_pages:
+        metrics.inc("listing_cache_total", outcome="partial")
+        first_page_hrefs = [row["href"] for row in next(cached_listing_pages(url))[1]["rows"]]
+        if await jump_to_listing_page(page, cached_pages + 1, first_page_hrefs):
+            job_log.info(f"Skipped {cached_pages} cached pages of {url}")
+            game_rows = select_listing_rows(cached_rows, season) or []
+            page_number = cached_pages + 1
+        else:
+            await page.goto(page.url.split('#')[0], wait_until='domcontentloaded')
+    else:
+        metrics.inc("listing_cache_total", outcome="miss")
+
     while True:
         try:
             for _ in range(3):
                 try:
-                    await page.wait_for_selector("a.next-m\\:flex > div[data-testid='game-row']", state='visible', timeout=15000)
+                    with span("listing_wait", url=url, page_number=page_number, attempt=_ + 1):
+                        await page.wait_for_selector(LISTING_ROW_SELECTOR, state='visible', timeout=15000)
                     break
                 except Exception as e:
-                    print(f"Failed to load game list: {e}") 
+                    job_log.info(f"Failed to load game list: {e}")
                     #await goto_with_retry(page, url)
                     await asyncio.sleep(2)
                     if _ == 2:
-                        print("Skipping due to persistent load issues on game list")
+                        job_log.error(f"Skipping due to persistent load issues on game list: {url}")
         except Exception:
-            print("No game list found, ending URL retrieval.")
+            job_log.warning("No game list found, ending URL retrieval.")
             continue
-        
+    
         for _ in range(3):
             try:
-                game_elements = await page.query_selector_all("a.next-m\\:flex > div[data-testid='game-row']")
-                if game_elements:
+                listed_rows = await page.eval_on_selector_all(LISTING_ROW_SELECTOR, LISTING_ROWS_SCRIPT)
+                if listed_rows:
                     break
             except Exception as e:
-                print(f"Retrying to find game elements due to: {e}")
+                job_log.info(f"Retrying to find game elements due to: {e}")
                 await asyncio.sleep(2)
-                if _ == 2:
-                    print("No game elements found after 3 retries")
-                    return []
-
-        for element in game_elements:
-            parent_a = await element.evaluate_handle('el => el.parentElement')
-            href = await parent_a.get_attribute('href')
-            
+            if _ == 2:
+                job_log.warning(f"No game elements found after 3 retries: {url}")
+                listing_attrs["outcome"] = "no_game_elements"
+                return []
+
+        if all(row["href"] and not row["href"].startswith('javascript:') for row in listed_rows):
+            put_listing_page(url, page_number, listed_rows)
+
+        for index, listed_row in enumerate(listed_rows):
+            href = listed_row["href"]
+        
             if href and not href.startswith('javascript:'):
-                full_url = f"https://www.oddsportal.com{href}"
-                season_game = extract_season(full_url)
-                if season_game:
-                    game_datetime = season_to_date(season_game)
-                    game_temporal_position = check_season_position(season, game_datetime, season_boundary="08-01")
+                full_url = absolute_url(href)
+                kickoff = parse_listing_kickoff(listed_row["date"], listed_row["time"], extract_season(full_url))
+                game_datetime, game_temporal_position = listing_row_position(full_url, kickoff, season)
+                if game_datetime:
                     if game_temporal_position == 1:
-                        print(f"Skipping match before season start date: {game_datetime} for season {season}")
-                        return game_urls or None
+                        job_log.info(f"Skipping match before season start date: {game_datetime} for season {season}")
+                        listing_attrs["outcome"] = "season_boundary"
+                        listing_attrs["pages"] = page_number
+                        listing_attrs["matches"] = len(game_rows)
+                        return sort_rows_by_kickoff(unique_rows(game_rows)) or None
                     if game_temporal_position == 3:
-                        print(f"Skipping match after season end date: {game_datetime} for season {season}") 
+                        job_log.info(f"Skipping match after season end date: {game_datetime} for season {season}")
                         continue
-                game_urls.append(full_url)
-                print(f"Fetched match URL: {full_url}")
+                game_rows.append({"url": full_url, "date_time": kickoff})
+                job_log.info(f"Fetched match URL: {full_url}")
             else:
                 try:
+                    game_elements = await page.query_selector_all(LISTING_ROW_SELECTOR)
+                    parent_a = await game_elements[index].evaluate_handle('el => el.parentElement')
                     await parent_a.click()
                     await asyncio.sleep(1)
-                    current_url = await page.url
+                    current_url = page.url
                     if current_url and 'match' in current_url:
-                        game_urls.append(current_url)
-                        print(f"Fetched match URL via click: {current_url}")
+                        game_rows.append({"url": current_url, "date_time": None})
+                        job_log.info(f"Fetched match URL via click: {current_url}")
                     await page.go_back()
                     await asyncio.sleep(1)
                 except Exception as e:
-                    print(f"Failed to retrieve URL for an item: {e}")
+                    job_log.warning(f"Failed to retrieve URL for an item: {e}")
 
-        print(f"Number of match URLs retrieved: {len(game_urls)}")
+        job_log.info(f"Number of match URLs retrieved: {len(game_rows)}")
 
         next_page = page.locator('a.pagination-link', has_text="Next")
         try:
@@ -270,26 +305,35 @@ async def get_history_matchs_urls(page, url, season):
             await next_page.wait_for(state="attached", timeout=10000)
             await next_page.wait_for(state="visible", timeout=10000)
             #await next_page.wait_for(state="stable", timeout=10000)
-            
+        
             # Vérifier qu'il est cliquable
             if not await next_page.is_enabled():
-                print("No more pages to navigate.")
+                job_log.info("No more pages to navigate.")
+                mark_last_page(url, page_number)
                 break
-            
+        
             # Scroll pour éviter overlay
-            await next_page.scroll_into_view_if_needed() 
-            await next_page.click()
-            await page.wait_for_load_state("networkidle")
-            await asyncio.sleep(5)  # petite pause pour que les éléments se chargent
+            with span("next_page", url=url, page_number=page_number + 1):
+                await next_page.scroll_into_view_if_needed() 
+                await next_page.click()
+                await page.wait_for_load_state("networkidle")
+                await asyncio.sleep(5)  # petite pause pour que les éléments se chargent
+            page_number += 1
         except TimeoutError:
-            print("No more pages to navigate.")
+            job_log.info("No more pages to navigate.")
+            if not await next_page.count():
+                # no "Next" link at all, not a page that was slow to load
+                mark_last_page(url, page_number)
             break
         except Exception as e:
-            print(f"Error navigating to next page: {e}")
+            job_log.error(f"Error navigating to next page: {e}")
             break
-            
-    if not game_urls:
-        print("No match URLs found.")
+        
+    listing_attrs["pages"] = page_number
+    listing_attrs["matches"] = len(game_rows)
+    if not game_rows:
+        job_log.warning(f"No match URLs found: {url}")
+        listing_attrs["outcome"] = "empty"
         return []
     else:
-        return game_urls
+        return sort_rows_by_kickoff(unique_rows(game_rows))
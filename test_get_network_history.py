@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+from crawl_frontier import CrawlFrontier
+from match_scraper import process_game
+from test_get_match_history import get_history_matchs_urls, load_listing_urls
+from test_get_team_match_history import go_to_results_match, cached_team_game_urls
+from test_website_navigation import open_warm_context, WorkerPage
+from extract_data import extract_region_competition, extract_team_name_from_url, is_file_existing
+from manage_links import generate_links_game, generate_year_links
+from save_data import clean_filename, save_odds_data, serialize_event
+from event_model import intern_text
+from dead_letters import dataset_header
+from tracing import span
+import metrics
+import job_log
+
+
+def crawl_state_dir(odds_data, base_dir="scraped_data"):
+    """Directory holding the frontier and the partial datasets of a crawl, used to resume it."""
+    root_name = odds_data.get("competition") or odds_data.get("team") or "unknown"
+    name = "_".join(clean_filename(str(value)) for value in (
+        odds_data["sport"], odds_data.get("region") or "", root_name, odds_data["season"], odds_data["bookmaker"]
+    ))
+    return os.path.join(base_dir, ".crawl", name)
+
+
+def competition_key(region, competition):
+    return f"competition|{region.lower()}|{competition.lower()}"
+
+
+def team_key(team_link):
+    return f"team|{team_link}"
+
+
+class NetworkCrawl:
+    """
+    Crawls the team/competition graph of a season with a pool of workers.
+
+    Competitions and teams are listed, their matches are queued as nodes of
+    the frontier and scraped by whichever worker is free. Teams found in the
+    matches of a competition and competitions found in the matches of a team
+    are queued one level deeper, up to `max_depth`. Every dataset (one per
+    competition or team) is saved as soon as its last match is processed.
+    """
+
+    def __init__(self, browser, base_data, season, max_depth=2, workers=4, state_dir=None, matches_per_context=100):
+        self.browser = browser
+        self.base_data = base_data
+        self.season = season
+        self.workers = workers
+        self.matches_per_context = matches_per_context
+        self.state_dir = state_dir
+        frontier_path = os.path.join(state_dir, "frontier.json") if state_dir else None
+        self.frontier = CrawlFrontier(frontier_path, max_depth=max_depth)
+        self.active = 0
+        self.worker_pages = {}
+        self.changed = asyncio.Condition()
+
+    def add_competition(self, region, competition, depth, root=False):
+        key = competition_key(region, competition)
+        payload = {"region": region, "competition": competition, "root": root}
+        return self.frontier.push("competition", key, depth, payload)
+
+    def add_team(self, team_link, depth):
+        if not team_link:
+            return False
+        return self.frontier.push("team", team_key(team_link), depth, {"link": team_link})
+
+    async def run(self):
+        """Runs the workers until the frontier is empty and no node is being processed."""
+        await asyncio.gather(*[self.worker(worker_id) for worker_id in range(self.workers)])
+        self.frontier.save()
+        if self.state_dir and not self.frontier.owners:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    async def worker(self, worker_id):
+        context = await open_warm_context(self.browser)
+        # the matches of this worker are scraped in one long-lived page
+        self.worker_pages[worker_id] = WorkerPage(context)
+        processed = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: len(self.frontier) > 0 or self.active == 0)
+                    node = self.frontier.pop()
+                    if node is None:
+                        return
+                    self.active += 1
+                metrics.set_gauge("queue_depth", len(self.frontier))
+                try:
+                    with span(f"crawl_{node['kind']}", key=node["key"], depth=node["depth"], worker=worker_id):
+                        await self.process(context, node, self.worker_pages[worker_id])
+                except Exception as e:
+                    job_log.error(f"Failed to process crawl node {node['key']}: {e}", e)
+                finally:
+                    # no await between the dataset bookkeeping and done(), so a saved frontier is consistent
+                    self.frontier.done(node)
+                    async with self.changed:
+                        self.active -= 1
+                        self.changed.notify_all()
+
+                processed += 1
+                if processed % self.matches_per_context == 0:
+                    # recycle this worker's context only, the other workers keep going
+                    await self.worker_pages[worker_id].close()
+                    await context.close()
+                    context = await open_warm_context(self.browser)
+                    self.worker_pages[worker_id] = WorkerPage(context)
+                    metrics.inc("browser_restarts_total")
+        finally:
+            await self.worker_pages.pop(worker_id).close()
+            await context.close()
+
+    async def process(self, context, node, worker_page=None):
+        if node["kind"] == "competition":
+            await self.list_competition(context, node)
+        elif node["kind"] == "team":
+            await self.list_team(context, node)
+        else:
+            await self.scrape_match(context, node, worker_page)
+
+    async def list_competition(self, context, node):
+        payload = node["payload"]
+        if is_file_existing(region=payload["region"], competition=payload["competition"], season=self.season):
+            print(f"Competition '{payload['competition']}' data ({payload['region']}, {self.season}) already exists. Skipping this season.")
+            return
+
+        competition_link = generate_links_game([(payload["region"], payload["competition"])], self.season)[0]
+        page = await context.new_page()
+        try:
+            game_urls = None
+            for _ in range(2):
+                game_urls = await load_listing_urls(page, competition_link, self.season)
+                if game_urls is not None:
+                    break
+                _, competition_link = generate_year_links(competition_link, self.season)
+        finally:
+            await page.close()
+
+        if payload.get("root"):
+            region_name, competition_name = payload["region"], payload["competition"]
+        else:
+            region_name, competition_name = extract_region_competition(competition_link)
+        header = dict(self.base_data, region=intern_text(region_name), competition=intern_text(competition_name))
+        header.pop("team", None)
+        self.add_owner(node, "competition", header, game_urls or [])
+
+    async def list_team(self, context, node):
+        team_link = node["payload"]["link"]
+        team_name = extract_team_name_from_url(team_link)
+        if is_file_existing(type_historical="team", team=team_name, season=self.season):
+            print(f"Team '{team_name}' data ({self.season}) already exists. Skipping this season.")
+            return
+
+        game_urls = cached_team_game_urls(team_link, self.season)
+        if game_urls is None:
+            page = await context.new_page()
+            try:
+                url_team_complet, page = await go_to_results_match(page, context, team_link)
+                game_urls = await get_history_matchs_urls(page, url_team_complet, self.season)
+            finally:
+                await page.close()
+
+        header = {
+            "sport": self.base_data["sport"],
+            "team": intern_text(team_name),
+            "season": self.season,
+            "market": "1X2 and Fulltime result",
+            "bookmaker": self.base_data["bookmaker"],
+        }
+        self.add_owner(node, "team", header, game_urls or [])
+
+    def add_owner(self, node, type_historical, header, game_urls):
+        """Registers a dataset and queues its matches."""
+        owner = node["key"]
+        queued = [
+            url for url in dict.fromkeys(game_urls)
+            if self.frontier.push("match", f"{owner}|{url}", node["depth"], {"url": url, "owner": owner})
+        ]
+        print(f"{len(queued)} matches queued for {owner}")
+        if not queued:
+            return
+        self.frontier.owners[owner] = {
+            "type": type_historical,
+            "header": header,
+            "depth": node["depth"],
+            "remaining": len(queued),
+        }
+
+    async def scrape_match(self, context, node, worker_page=None):
+        url = node["payload"]["url"]
+        owner_key = node["payload"]["owner"]
+        owner = self.frontier.owners.get(owner_key)
+        if owner is None:
+            return
+
+        try:
+            result = await process_game(context, url, self.base_data["bookmaker"], self.season, type_historical=owner["type"],
+                                        dataset=dataset_header(owner["header"], owner["type"]), worker_page=worker_page)
+            if result and result != 1:
+                event_data, team_links, _, region_competion_names = result
+                if owner["type"] == "team":
+                    event_data.region = intern_text(region_competion_names[0])
+                    event_data.competition = intern_text(region_competion_names[1])
+                    self.add_competition(region_competion_names[0], region_competion_names[1], owner["depth"] + 1)
+                else:
+                    for team_link in team_links:
+                        self.add_team(team_link, owner["depth"] + 1)
+                self.append_event(owner_key, url, event_data)
+        finally:
+            owner["remaining"] -= 1
+            if owner["remaining"] <= 0:
+                self.save_owner(owner_key)
+
+    def events_path(self, owner_key):
+        name = hashlib.sha1(owner_key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.state_dir or ".crawl", "events", f"{name}.jsonl")
+
+    def append_event(self, owner_key, url, event_data):
+        """Events are kept on disk until their dataset is complete, which also lets the crawl resume."""
+        path = self.events_path(owner_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"url": url, "event": serialize_event(event_data)}, ensure_ascii=False) + "\n")
+
+    def save_owner(self, owner_key):
+        owner = self.frontier.owners.pop(owner_key)
+        path = self.events_path(owner_key)
+        events = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # a match replayed after a resume replaces its first version
+                    events[record["url"]] = record["event"]
+            os.remove(path)
+        if events:
+            save_odds_data(dict(owner["header"], events=list(events.values())), type_historical=owner["type"])
+        self.frontier.save()
+
+
+async def crawl_network_history(browser, base_data, season, competition=None, team_link=None, max_depth=2, workers=4):
+    """
+    Scrapes a competition and/or a team, the teams and competitions linked to
+    them up to `max_depth`, with a persistent frontier (see NetworkCrawl).
+
+    The crawl state is kept in scraped_data/.crawl/ and an interrupted crawl
+    with the same parameters resumes where it stopped.
+    """
+    state_dir = crawl_state_dir(base_data)
+    crawl = NetworkCrawl(browser, base_data, season, max_depth=max_depth, workers=workers, state_dir=state_dir)
+    if competition is not None:
+        crawl.add_competition(competition[0], competition[1], depth=0, root=True)
+    if team_link is not None:
+        crawl.add_team(team_link, depth=0)
+    await crawl.run()
@@ -1,9 +1,11 @@
 import asyncio
-import random
 from extract_data import extract_id_from_url, extract_team_name_from_url, is_file_existing
-from test_get_match_history import limited_process_game, get_history_matchs_urls
-from test_website_navigation import restart_browser_context
-import copy
+from manage_links import site_url
+from test_get_match_history import get_history_matchs_urls, listing_from_cache
+from worker_pool import MatchPool
+from event_model import intern_text
+from dead_letters import dataset_header
+import job_log
 
 async def go_to_results_match(page, context, team_link):
     """
@@ -11,7 +13,8 @@ async def go_to_results_match(page, context, team_link):
 
     The function constructs the URLs for the team's results page using the team link
     and attempts to load the page, retrying once if an exception occurs. A new page
-    is created in the context if navigation fails. 
+    is created in the context if navigation fails, the failed one being closed, so
+    that a team listing never holds more than one page.
 
     Returns a tuple containing:
     - the results page URL
@@ -20,27 +23,34 @@ async def go_to_results_match(page, context, team_link):
     if not team_link:
         return
     
-    link = "https://www.oddsportal.com" + team_link + "#results"
-    team_id = extract_id_from_url(team_link)
-    link_show_all_results = f"https://www.oddsportal.com/search/results/:{team_id}/"
+    link_show_all_results = team_results_url(team_link)
     for _ in range(2):
         try:
             await page.goto(link_show_all_results, wait_until='domcontentloaded')
             break
         except Exception as e:
             print(f"Warning while naviguate to {link_show_all_results}: {e}")
+            await page.close()
             page = await context.new_page() 
 
-    return link, page
+    return link_show_all_results, page
 
 
-async def get_team_match_history(context, browser, p, semaphore, links_teams, batch_size, odds_data_teams, list_data_teams, season):
+def team_results_url(team_link):
+    """Listing of every result of a team."""
+    return site_url(f"/search/results/:{extract_id_from_url(team_link)}/")
+
+
+async def get_team_match_history(context, browser, p, workers, links_teams, matches_per_context, odds_data_teams, list_data_teams, season, listing_concurrency=2):
     """
     Asynchronously retrieves match histories for multiple teams.
 
-    The function processes the provided list of team links in batches, using a semaphore
-    to limit concurrency. It updates odds_data_teams with match results and aggregates
-    all data into list_data_teams. 
+    The listings of the teams are walked concurrently (at most
+    `listing_concurrency` pages at a time, in `context`, no context being
+    opened per team) and every URL found is
+    submitted right away to one MatchPool shared by all teams, so that the
+    matches of the teams already listed are scraped while later teams are
+    still being listed, and no worker waits for the end of a team.
 
     Returns:
     - list_data_teams: collected match history data for all teams
@@ -48,67 +58,88 @@ async def get_team_match_history(context, browser, p, semaphore, links_teams, ba
     - browser: the browser instance
     - context: the browser context
     """
-    page = await context.new_page()
+    listing_semaphore = asyncio.Semaphore(listing_concurrency)
     list_regions_competitions = []
-    for url_team in links_teams:
-        url_team_complet, page = await go_to_results_match(page, context, url_team)
-        game_urls = await get_history_matchs_urls(page, url_team_complet, season)
-        team_name = extract_team_name_from_url(url_team) 
-        odds_data_teams = {
-            "sport": odds_data_teams["sport"],
-            "team": team_name,
-            "season": odds_data_teams["season"],
-            "market": "1X2 and Fulltime result",
-            "bookmaker": odds_data_teams["bookmaker"],
-            "events": []
-        }
-        if is_file_existing(type_historical= "team", team=odds_data_teams["team"], season= odds_data_teams["season"]):
-            print(f"Team '{odds_data_teams['team']}' data ({odds_data_teams['season']}) already exists. Skipping this season.")
-            continue
-        try: 
-            for i in range(0, len(game_urls), batch_size):
-                batch = game_urls[i:i+batch_size]
-                game_details = [
-                    limited_process_game(
-                        semaphore,
-                        context,
-                        url,
-                        odds_data_teams["bookmaker"],
-                        odds_data_teams["season"],
-                        type_historical="team"
-                    )
-                    for url in batch if url
-                ]
-
-                results = await asyncio.gather(*game_details)
-                for result in results:
-                    if result is None:
-                        continue
-                    if result == 1:
-                        raise ValueError("Stop processing due to exeded date limit for team historical data")
-                    event_data, _, page, region_competion_names = result
-                    if event_data is None:
-                        continue
-                    event_data["region"] = region_competion_names[0]
-                    event_data["competition"] = region_competion_names[1]
-                    odds_data_teams["events"].append(event_data)
-                    list_regions_competitions.append(region_competion_names)
-
-                # Close all pages in the context to free memory
-                for page in context.pages:
-                    try:
-                        await page.close()
-                    except:
-                        pass
-
-                # Random sleep between batches to mimic human behavior and avoid rate limiting
-                await asyncio.sleep(random.uniform(2, 5))
-
-                # Restart browser and context every batch to manage memory usage
-                browser, context = await restart_browser_context(batch_size, i, url_team, browser, context, p)
-            list_data_teams.append(copy.deepcopy(odds_data_teams))
-        except ValueError as ve:
-            print(ve)
+    teams_data = {}
+
+    async with MatchPool(browser, odds_data_teams["bookmaker"], season, workers, matches_per_context) as pool:
+        async def list_team(url_team):
+            team_data = new_team_data(odds_data_teams, url_team)
+            if is_file_existing(type_historical= "team", team=team_data["team"], season= team_data["season"]):
+                print(f"Team '{team_data['team']}' data ({team_data['season']}) already exists. Skipping this season.")
+                return
+            teams_data[url_team] = team_data
+            for url in await get_team_game_urls(context, listing_semaphore, url_team, season):
+                if url:
+                    pool.submit(url, tag=url_team, type_historical="team", dataset=dataset_header(team_data, "team"))
+
+        async def list_all_teams():
+            # the pool is closed once every listing has settled, a failed listing does not stop the others
+            try:
+                results = await asyncio.gather(*[list_team(url_team) for url_team in links_teams], return_exceptions=True)
+            finally:
+                pool.close()
+            for url_team, result in zip(links_teams, results):
+                if isinstance(result, Exception):
+                    job_log.error(f"Failed to list the matches of team {url_team}: {result}", result, stage="listing", url=url_team)
+                    # nothing was submitted for this team, no empty dataset is saved
+                    teams_data.pop(url_team, None)
 
+        listing_task = asyncio.create_task(list_all_teams())
+        try:
+            async for _, url_team, result in pool:
+                if result is None:
+                    continue
+                if result == 1:
+                    # the pool cancels the older matches of this team only
+                    print(f"Stop processing due to exeded date limit for team historical data: {url_team}")
+                    continue
+                event_data, _, _, region_competion_names = result
+                if event_data is None:
+                    continue
+                event_data.region = intern_text(region_competion_names[0])
+                event_data.competition = intern_text(region_competion_names[1])
+                teams_data[url_team]["events"].append(event_data)
+                list_regions_competitions.append(region_competion_names)
+            await listing_task
+        finally:
+            listing_task.cancel()
+            await asyncio.gather(listing_task, return_exceptions=True)
+
+    list_data_teams.extend(teams_data.values())
     list_regions_competitions = list(set(tuple(x) for x in list_regions_competitions))  # Remove duplicates
-    return list_data_teams, list_regions_competitions, browser, context
\ No newline at end of file
+    return list_data_teams, list_regions_competitions, browser, context
+
+
+def new_team_data(odds_data_teams, url_team):
+    """Returns the empty dataset of a team."""
+    return {
+        "sport": odds_data_teams["sport"],
+        "team": intern_text(extract_team_name_from_url(url_team)),
+        "season": odds_data_teams["season"],
+        "market": "1X2 and Fulltime result",
+        "bookmaker": odds_data_teams["bookmaker"],
+        "events": []
+    }
+
+
+async def get_team_game_urls(context, listing_semaphore, url_team, season):
+    """Walks the results listing of a team and returns its match URLs."""
+    game_urls = cached_team_game_urls(url_team, season)
+    if game_urls is not None:
+        return game_urls
+    async with listing_semaphore:
+        page = await context.new_page()
+        try:
+            url_team_complet, page = await go_to_results_match(page, context, url_team)
+            return await get_history_matchs_urls(page, url_team_complet, season) or []
+        finally:
+            await page.close()
+
+
+def cached_team_game_urls(team_link, season):
+    """Match URLs of a team from the listing cache, or None when its listing has to be browsed."""
+    covered, rows = listing_from_cache(team_results_url(team_link), season)
+    if not covered:
+        return None
+    return [row["url"] for row in rows or []]
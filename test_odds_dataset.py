@@ -0,0 +1,29 @@
+import json
+import pytest
+
+np = pytest.importorskip("numpy")
+from event_model import ODDS_KEYS
+from odds_dataset import OddsTable
+
+
+def write_dataset(directory, name, score, closing):
+    event = {
+        "url": "https://www.oddsportal.com/football/france/ligue-1/paris-lyon-AbCd1234/",
+        "home_team": "Paris", "away_team": "Lyon", "date_time": "2024-05-19 21:00", "score": score,
+        "odds": {key: [{"value": value, "date_time": "2024-05-19 20:00"}] for key, value in zip(ODDS_KEYS, closing)},
+    }
+    path = directory / name
+    path.write_text(json.dumps({"sport": "Football", "season": "2023/2024", "bookmaker": "Betclic", "events": [event]}), encoding="utf-8")
+    return path
+
+
+def test_newest_dataset_of_a_match_wins(tmp_path):
+    write_dataset(tmp_path, "20240518_100000_Football_France_Ligue_1_Betclic_upcoming.json", None, (1.5, 4.0, 6.0))
+    write_dataset(tmp_path, "20240520_100000_Football_France_Ligue_1_2023-2024_Betclic.json", "1:0", (1.8, 3.6, 4.5))
+    write_dataset(tmp_path, "20240601_100000_Football_France_Ligue_1_2023-2024_Betclic.json", "2:1", (1.9, 3.5, 4.2))
+
+    table = OddsTable.build(str(tmp_path))
+
+    assert len(table) == 1
+    assert table.matches["score"] == ["2:1"]
+    assert table.odds_at("closing").tolist() == [[1.9, 3.5, 4.2]]
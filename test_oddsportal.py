@@ -1,24 +1,29 @@
 import asyncio
 from playwright.async_api import async_playwright, Page
 import pytest
-from save_data import save_odds_data
+from save_data import save_odds_data, configure_compression
+from snapshot_store import save_upcoming_snapshot
 import random
-from test_get_competition_match_history import get_competition_match_history, get_several_competitions_match_history
+from test_get_competition_match_history import get_competition_match_history
+from test_get_network_history import crawl_network_history
 from test_get_team_match_history import get_team_match_history
-from test_get_match_history import get_history_matchs_urls 
-from manage_links import generate_links_game
+from test_get_match_history import load_listing_urls
+from test_website_navigation import USER_AGENTS, new_session_context
+from manage_links import generate_links_game, configure_base_url
 from extract_data import is_file_existing, build_team_url
 import copy
+from tracing import configure_tracing, close_tracing
+import metrics
+from event_model import intern_text
+from browser_server import configure_browser_server, launch_browser
+from dead_letters import configure_dead_letters
+from backfill import backfill_history
+from date_sorting import season_range
+from match_profiler import configure_profiling
+from listing_cache import configure_listing_cache, LISTING_CACHE_DIR
+from job_log import configure_job_log, close_job_log
 
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-    "(KHTML, like Gecko) Chrome/118.0.5993.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5) AppleWebKit/605.1.15 "
-    "(KHTML, like Gecko) Version/16.5 Safari/605.1.15",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-    "(KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-]
 
 @pytest.fixture
 def sport_name(request):
@@ -56,10 +61,98 @@ def spread(request):
 def type_game(request):
     return request.config.getoption("--typegame")
 
+@pytest.fixture 
+def seasons(request):
+    text = request.config.getoption("--seasons")
+    return season_range(text) if text else None
+
+@pytest.fixture 
+def crawl_depth(request):
+    return int(request.config.getoption("--crawl-depth"))
+
+@pytest.fixture(autouse=True)
+def trace_file(request):
+    path = request.config.getoption("--tracefile")
+    configure_tracing(path)
+    yield path
+    close_tracing()
+
+@pytest.fixture(autouse=True)
+def job_log(request):
+    path = request.config.getoption("--job-log")
+    configure_job_log(path, int(request.config.getoption("--job-log-max-bytes")))
+    yield path
+    close_job_log()
+
+@pytest.fixture(autouse=True)
+def metrics_exporter(request):
+    port = request.config.getoption("--metrics-port")
+    path = request.config.getoption("--metrics-file")
+    metrics.start_metrics(port=port, path=path)
+    yield
+    metrics.stop_metrics(path)
+
+@pytest.fixture(autouse=True)
+def compression(request):
+    name = request.config.getoption("--compression")
+    configure_compression(name)
+    yield name
+    configure_compression(None)
+
+@pytest.fixture(autouse=True)
+def dead_letter_store(type_game):
+    # upcoming matches are polled again by the next run, only historical failures are kept
+    configure_dead_letters(None if type_game == "upcoming" else "scraped_data")
+    yield
+    configure_dead_letters(None)
+
+@pytest.fixture(autouse=True)
+def browser_server(request):
+    url = request.config.getoption("--browser-server")
+    configure_browser_server(url)
+    yield url
+    configure_browser_server(None)
+
+@pytest.fixture(autouse=True)
+def base_url(request):
+    url = request.config.getoption("--base-url")
+    configure_base_url(url)
+    yield url
+    configure_base_url(None)
+
+@pytest.fixture(autouse=True)
+def match_profiling(request):
+    directory = request.config.getoption("--profile-dir")
+    configure_profiling(directory, float(request.config.getoption("--profile-rate")), float(request.config.getoption("--profile-slow")),
+                        request.config.getoption("--profile-snapshots"))
+    yield directory
+    configure_profiling(None)
+
+@pytest.fixture(autouse=True)
+def listing_cache(request, type_game):
+    # upcoming listings change with every fixture, only historical listings are cached
+    ttl = int(request.config.getoption("--listing-cache-ttl"))
+    configure_listing_cache(LISTING_CACHE_DIR if ttl > 0 and type_game != "upcoming" else None, ttl)
+    yield
+    configure_listing_cache(None)
+
+
+
+def crawl_base_data(sport_name, region_name, competition_name, team_name, season, bookmaker_name):
+    """Fields of the datasets of a network crawl (see crawl_network_history)."""
+    return {
+        "sport": sport_name,
+        "region": region_name,
+        "competition": competition_name,
+        "team": team_name,
+        "season": season,
+        "market": "1X2 and Fulltime result",
+        "bookmaker": intern_text(bookmaker_name),
+    }
 
 
 @pytest.mark.asyncio()
-async def test_get_historical_events(sport_name, season, bookmaker_name, region_name, competition_name, team_name, team_id, spread, type_game):
+async def test_get_historical_events(sport_name, season, bookmaker_name, region_name, competition_name, team_name, team_id, spread, type_game, crawl_depth, seasons):
     """
     Main asynchronous function that orchestrates the retrieval and storage of historical event data
     for both competitions and teams on OddsPortal.
@@ -77,10 +170,19 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
     - The resulting data for each team is saved individually using `save_odds_data`
         with the type set to `"team"`.
 
-    3. **Multiple competition processing**:
-    - If competitions exist in `list_regions_competitions`, it retrieves match histories
-        for several competitions concurrently via `get_several_competitions_match_history`.
-    - Each competition dataset with non-empty events is saved using `save_odds_data`.
+    3. **Network crawl** (`spread="completly"`):
+    - The competition and/or team, the teams and competitions linked to them (up to
+        `--crawl-depth`) and all their matches are queued in one persistent frontier and
+        processed continuously by a pool of workers via `crawl_network_history`.
+    - Each dataset is saved with `save_odds_data` as soon as its last match is scraped,
+        and an interrupted crawl resumes from `scraped_data/.crawl/`.
+
+    4. **Season range** (`--seasons`, historical only):
+    - Every missing season of the range is scraped in one run via `backfill_history`:
+        the history of each team is walked once for all the seasons and each match is
+        saved in the file of its season.
+    - With `spread="completly"`, each missing season of the range is crawled in turn,
+        with its own frontier.
 
     Returns:
         None — The function's main goal is to collect, process, and persist historical match data
@@ -88,12 +190,54 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
     """
 
     async with async_playwright() as p:
+        if seasons and type_game != "upcoming" and spread == "completly":
+            # a crawl frontier holds one season, the seasons of the range are crawled in turn
+            browser = await launch_browser(p)
+            for crawl_season in seasons:
+                if competition_name is not None and is_file_existing(region=region_name, competition=competition_name, season=crawl_season):
+                    print(f"Competition '{competition_name}' data ({region_name}, {crawl_season}) already exists. Skipping this season.")
+                    continue
+                print(f"Crawling season {crawl_season}")
+                await crawl_network_history(
+                    browser, crawl_base_data(sport_name, region_name, competition_name, team_name, crawl_season, bookmaker_name), crawl_season,
+                    competition=(region_name, competition_name) if competition_name is not None else None,
+                    team_link=build_team_url(sport_name, team_name, team_id) if team_name is not None else None,
+                    max_depth=crawl_depth, workers=4)
+            await browser.close()
+            return
+
+        if seasons and type_game != "upcoming":
+            browser = await launch_browser(p)
+            context = metrics.track_context(await new_session_context(browser, user_agent=random.choice(USER_AGENTS)))
+            page = await context.new_page()
+            base_data = {"sport": sport_name, "bookmaker": intern_text(bookmaker_name)}
+            browser, context = await backfill_history(
+                p, browser, context, page, base_data, seasons,
+                competition=(region_name, competition_name) if competition_name is not None else None,
+                team_link=build_team_url(sport_name, team_name, team_id) if team_name is not None else None,
+                spread=spread)
+            await context.close()
+            await browser.close()
+            return
+
         list_files = is_file_existing(region=region_name, competition=competition_name, season=season)
         if len(list_files) == 0:
-            browser = await p.chromium.launch()
-            context = await browser.new_context(user_agent=random.choice(USER_AGENTS))
+            browser = await launch_browser(p)
+            context = metrics.track_context(await new_session_context(browser, user_agent=random.choice(USER_AGENTS)))
             page = await context.new_page()
             print(type_game)
+            if spread == "completly" and type_game != "upcoming":
+                # competitions, teams and their matches are crawled from one persistent frontier
+                base_data = crawl_base_data(sport_name, region_name, competition_name, team_name, season, bookmaker_name)
+                await crawl_network_history(
+                    browser, base_data, season,
+                    competition=(region_name, competition_name) if competition_name is not None else None,
+                    team_link=build_team_url(sport_name, team_name, team_id) if team_name is not None else None,
+                    max_depth=crawl_depth, workers=4)
+                await context.close()
+                await browser.close()
+                return
+
             if competition_name is not None:
                 if type_game == "historcal":
                     list_links_season = generate_links_game([(region_name, competition_name)], season)
@@ -101,11 +245,8 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
                     list_links_season = generate_links_game([(region_name, competition_name)], type_game="upcoming")
 
                 season_url = list_links_season[0]
-                await page.goto(season_url, wait_until='domcontentloaded')
-                await asyncio.sleep(2)
-
                 #current_url = page.url
-                game_urls = await get_history_matchs_urls(page, season_url, season)
+                game_urls = await load_listing_urls(page, season_url, season)
                 #await Page.pause()
                 print(f"Found {len(game_urls)} game URLs for competition '{competition_name}' in season '{season}'.")
                 
@@ -115,7 +256,7 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
                     "competition": competition_name,
                     "season": season,
                     "market": "1X2 and Fulltime result",
-                    "bookmaker": bookmaker_name,
+                    "bookmaker": intern_text(bookmaker_name),
                     "events": []
                 }
 
@@ -127,22 +268,24 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
                     return
 
             # Limit the number of concurrent pages to avoid overwhelming the browser
-            semaphore = asyncio.Semaphore(4)  # 4 concurrent pages
+            workers = 4  # 4 concurrent pages
 
-            # Batch processing configuration
-            batch_size = 100  # reduced batch size to limit memory usage
+            # Context recycling configuration
+            matches_per_context = 100  # each worker recycles its context after 100 matches to limit memory usage
             links_teams = []
 
             if competition_name is not None:
                 odds_data["events"] = []
 
                 # First, get historical data for competitions
-                odds_data, links_teams, browser, context = await get_competition_match_history(context, browser, p, 
-                                                                                            semaphore, game_urls, batch_size, 
-                                                                                            copy.deepcopy(odds_data), links_teams)
+                odds_data, links_teams = await get_competition_match_history(browser, workers, game_urls, matches_per_context,
+                                                                             copy.deepcopy(odds_data), links_teams)
                 # Save competition data and free memory
                 if len(odds_data["events"]) > 0:
                     save_odds_data(odds_data, type_game=type_game)
+                    if type_game == "upcoming":
+                        # the changes since the previous upcoming run, game_urls being the whole listing
+                        save_upcoming_snapshot(odds_data, listed_urls=game_urls)
                     odds_data["events"] = []
                 
                 if spread is None:
@@ -156,7 +299,7 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
                 "competition": competition_name,
                 "season": season,
                 "market": "1X2 and Fulltime result",
-                "bookmaker": bookmaker_name,
+                "bookmaker": intern_text(bookmaker_name),
                 "events": []
             }
             list_data_teams = []
@@ -167,7 +310,7 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
                 links_teams = list(set(links_teams))  # Remove duplicates
                 list_data_teams, list_regions_competitions, browser, context = await get_team_match_history(
                     context, browser, p, 
-                    semaphore, links_teams, batch_size, 
+                    workers, links_teams, matches_per_context, 
                     copy.deepcopy(odds_data_teams), list_data_teams, season)
                 
                 # Save teams data
@@ -182,29 +325,6 @@ async def test_get_historical_events(sport_name, season, bookmaker_name, region_
             else:
                 print(f"None team finded beacause is already exists")   
 
-            if spread == "team":
-                return
-            # get historical data for secondary competitions
-            if competition_name is not None:
-                if len(list_regions_competitions) > 0:
-                    list_odds_data_competitions = await get_several_competitions_match_history(browser, context, p, page, 
-                                                                                        semaphore, batch_size, copy.deepcopy(odds_data), 
-                                                                                        list_regions_competitions, (region_name, competition_name), season)
-                    try:
-                        for data_competion in list_odds_data_competitions:
-                            if len(data_competion["events"]) > 0:
-                                save_odds_data(data_competion)
-                    except NameError as e:
-                        print(f"None competition saved beacaus is already exists: {e}")
-                else:
-                    print(f"None competitions finded beacause are already exists")
-                
-                
-                try:
-                    print(f"Number of successfully processed events: {len(odds_data['events'])}")
-                except TypeError as e:
-                    print(print(f"Successfully, events already exists"))
-            
             # Close the browser context and browser
             await context.close()
             await browser.close()
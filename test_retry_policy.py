@@ -0,0 +1,34 @@
+import asyncio
+from retry_policy import CircuitBreaker
+
+
+def test_cancelled_probe_releases_the_circuit():
+    async def scenario():
+        breaker = CircuitBreaker(min_samples=2, cooldown=0)
+        breaker.record(False)
+        breaker.record(False)
+        assert breaker.state == "open"
+
+        async def navigation():
+            probe = await breaker.wait()
+            try:
+                await asyncio.sleep(10)
+                breaker.record(True)
+            finally:
+                breaker.release(probe)
+
+        probe_task = asyncio.create_task(navigation())
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open" and breaker.probe is not None
+        probe_task.cancel()
+        await asyncio.gather(probe_task, return_exceptions=True)
+
+        # another worker gets the probe instead of waiting forever
+        probe = await asyncio.wait_for(breaker.wait(), timeout=2)
+        assert probe is not None
+        breaker.record(True)
+        assert breaker.state == "closed"
+        breaker.release(probe)
+        assert breaker.probe is None
+
+    asyncio.run(scenario())
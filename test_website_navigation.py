@@ -3,39 +3,130 @@ import pytest
 import re
 from playwright.async_api import expect, TimeoutError
 import random, asyncio
+from tracing import span
+import time
+import json
+import os
+import weakref
+import metrics
+import job_log
+from browser_server import new_context
+from retry_policy import backoff, breaker, current_budget
+from manage_links import site_url
+
+# HTTP statuses returned by block/rate limit pages
+BLOCK_STATUSES = (403, 429, 503)
+
+# Navigations after which the long-lived page of a worker is replaced (see WorkerPage)
+PAGE_NAVIGATION_LIMIT = 50
+
+# Cookies and local storage of a context that accepted the cookie consent, shared by the
+# new contexts of every job (see new_session_context), and how long it is reused
+SESSION_STATE_PATH = os.path.join("scraped_data", ".session", "storage_state.json")
+SESSION_STATE_TTL = 24 * 3600
+# Cookie set by the consent banner (OneTrust) once it was answered
+CONSENT_COOKIE = "OptanonAlertBoxClosed"
+
+# Contexts whose consent is stored: the consent probe is skipped on their pages
+_consented_contexts = weakref.WeakSet()
+
+# Overlays blocking hover or click (see remove_overlays)
+OVERLAY_SELECTORS = '#onetrust-policy, .overlay-bookie-modal, [class*="overlay"]'
+# Narrowest viewport keeping the desktop layout the selectors are written for
+VIEWPORT = {"width": 1024, "height": 600}
+
+# Installed in every context (see new_session_context), it runs in each document before the
+# page scripts: the overlays never render and, without transitions or animations, the odds
+# tooltips show up as soon as a cell is hovered. An overlay holding the tooltip title is kept.
+PAGE_BOOTSTRAP_SCRIPT = """(() => {
+    const css = `
+        :is(%s):not(:has(h3)) { display: none !important; }
+        *, *::before, *::after {
+            transition: none !important;
+            animation: none !important;
+            caret-color: transparent !important;
+            scroll-behavior: auto !important;
+        }
+    `;
+    const install = () => {
+        if (document.getElementById('scraper-bootstrap')) return;
+        const style = document.createElement('style');
+        style.id = 'scraper-bootstrap';
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) install();
+    document.addEventListener('DOMContentLoaded', install);
+})();""" % OVERLAY_SELECTORS
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/118.0.5993.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/16.5 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
+]
 
 @pytest.mark.asyncio
-async def goto_with_retry(page, url, retries=3, timeout=100000):
+async def goto_with_retry(page, url, retries=3, timeout=45000):
     """
     Asynchronously navigates to a URL with retry logic for pytest-asyncio.
 
     The function attempts to load the given page up to `retries` times, waiting for
-    the DOM content to be loaded. If a navigation attempt fails, it retries with
-    an exponential backoff (2, 4, 6 seconds, etc.).
+    the network to be idle. Retries take from the budget of the match being scraped
+    (see retry_policy.match_budget) and are spaced by a jittered exponential backoff;
+    timeouts never go past the deadline of the match. Every attempt first waits for
+    the circuit breaker, and reports its outcome to it.
 
     Parameters:
     - page: The Playwright page object to navigate.
     - url: The target URL to open.
     - retries: Maximum number of navigation attempts (default: 3).
-    - timeout: Page load timeout in milliseconds (default: 30000).
+    - timeout: Page load timeout in milliseconds (default: 45000).
+
+    A block status (see BLOCK_STATUSES) is a failed attempt: it is backed off
+    and retried, never returned as the page.
 
     Returns:
     - True if the page was successfully loaded.
-    - False if all attempts failed.
+    - False if all attempts failed or the budget of the match is exhausted.
     """
-
+    budget = current_budget()
     for attempt in range(1, retries+1):
-        try:
-            await page.goto(url, wait_until="networkidle", timeout=timeout)
-            await handle_cookie_consent(page)
-            return True
-        except Exception as e:
-            print(f"Attempt {attempt} failed for {url}: {e}")
-            if attempt < retries:
-                await asyncio.sleep(3 * attempt)  # Exponential backoff
-            else:
-                print(f"Failed to load page after {retries} attempts: {url}")
+        if attempt > 1:
+            if not budget.take(f"goto_{attrs['outcome']}"):
+                print(f"Retry budget exhausted, giving up on: {url}")
                 return False
+            await backoff(attempt - 1, url)
+        probe = await breaker.wait()
+        with span("goto", url=url, attempt=attempt) as attrs:
+            start = time.perf_counter()
+            try:
+                response = await page.goto(url, wait_until="networkidle", timeout=budget.timeout(timeout))
+                metrics.observe("navigation_seconds", time.perf_counter() - start)
+                if response is not None and response.status in BLOCK_STATUSES:
+                    # a block page is not the match, retried like a timeout
+                    print(f"Attempt {attempt} got a block page ({response.status}) for {url}")
+                    metrics.inc("blocked_pages_total", status=response.status)
+                    attrs["outcome"] = "blocked"
+                    attrs["status"] = response.status
+                    breaker.record(False)
+                    continue
+                breaker.record(True)
+                await handle_cookie_consent(page)
+                return True
+            except Exception as e:
+                print(f"Attempt {attempt} failed for {url}: {e}")
+                attrs["outcome"] = "timeout" if isinstance(e, TimeoutError) else "error"
+                attrs["error"] = str(e)[:300]
+                metrics.observe("navigation_seconds", time.perf_counter() - start)
+                breaker.record(False)
+            finally:
+                # a cancelled probe (eg. by MatchPool.cancel_after) records nothing
+                breaker.release(probe)
+    print(f"Failed to load page after {retries} attempts: {url}")
+    return False
 
 async def handle_cookie_consent(page):
     """
@@ -44,46 +135,160 @@ async def handle_cookie_consent(page):
     The function searches for a button with a name matching "Accept" (case-insensitive)
     and clicks it if it is visible within 5 seconds. A short delay is added after clicking
     to ensure the action is processed. Any exceptions are silently ignored.
+
+    Nothing is probed on the pages of a context whose consent is stored. Once
+    accepted, the session state is saved for the next contexts (see save_session_state).
     """
+    if page.context in _consented_contexts:
+        return
+    with span("cookie_consent", url=page.url) as attrs:
+        try:
+            accept_cookies = page.get_by_role("button", name=re.compile("Accept", re.IGNORECASE))
+            if await accept_cookies.is_visible(timeout=5000):
+                await accept_cookies.click()
+                await asyncio.sleep(1)
+                attrs["outcome"] = "accepted"
+                await save_session_state(page.context)
+            else:
+                attrs["outcome"] = "absent"
+        except:
+            attrs["outcome"] = "error"
+
+
+def load_session_state(path=SESSION_STATE_PATH, ttl=SESSION_STATE_TTL):
+    """Storage state saved after a consent, or None if missing, older than `ttl` or without the consent cookie."""
     try:
-        accept_cookies = page.get_by_role("button", name=re.compile("Accept", re.IGNORECASE))
-        if await accept_cookies.is_visible(timeout=5000):
-            await accept_cookies.click()
-            await asyncio.sleep(1)
-    except:
-        pass
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not any(cookie.get("name") == CONSENT_COOKIE for cookie in state.get("cookies", [])):
+        return None
+    return state
+
+
+async def save_session_state(context, path=SESSION_STATE_PATH):
+    """Saves the cookies and local storage of a context that answered the consent banner."""
+    try:
+        state = await context.storage_state()
+    except Exception as e:
+        job_log.warning(f"Failed to read the session state: {e}")
+        return
+    if not any(cookie.get("name") == CONSENT_COOKIE for cookie in state.get("cookies", [])):
+        return
+    _consented_contexts.add(context)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        job_log.warning(f"Failed to save the session state: {e}")
 
-async def restart_browser_context(batch_size, i, game_urls, browser, context, p):  
+
+async def new_session_context(browser, **kwargs):
+    """
+    Creates a browser context from the saved session state when there is one: it
+    starts with the consent given, and the consent probe is skipped on its pages.
+    Its pages use a small viewport and the bootstrap script (see PAGE_BOOTSTRAP_SCRIPT).
     """
-    Restarts the browser context after processing a batch of pages.
+    state = load_session_state()
+    if state is not None:
+        kwargs.setdefault("storage_state", state)
+    kwargs.setdefault("viewport", VIEWPORT)
+    context = await new_context(browser, **kwargs)
+    await context.add_init_script(PAGE_BOOTSTRAP_SCRIPT)
+    if state is not None:
+        _consented_contexts.add(context)
+        metrics.inc("session_state_total", outcome="reused")
+    return context
 
-    This function is intended to refresh or reset the browser context to prevent
-    memory leaks or stale sessions when handling large numbers of game URLs.
-    It returns the updated browser and context objects.
+
+def session_is_warm(context):
+    """True if the context was created with the consent given."""
+    return context in _consented_contexts
+
+async def open_warm_context(browser):
+    """
+    Creates a new browser context from an existing browser, opens the
+    oddsportal.com homepage once and accepts cookies, so that workers owning
+    their own context start with the consent given.
+    When the session state was saved, the context is created from it and
+    the homepage is not opened.
     """
-    if i + batch_size < len(game_urls):
-        print("Restarting browser and context to avoid memory/leak issues...")
-        await context.close()
-        await browser.close()
-        browser = await p.chromium.launch()
-        context = await browser.new_context()
-        page = await context.new_page()
-        for _ in range(3):
+    context = metrics.track_context(await new_session_context(browser, user_agent=random.choice(USER_AGENTS)))
+    if session_is_warm(context):
+        return context
+    page = await context.new_page()
+    with span("warm_context") as attrs:
+        try:
+            await page.goto(site_url(), wait_until="domcontentloaded", timeout=30000)
+            await handle_cookie_consent(page)
+        except Exception as e:
+            print(f"Warning while opening oddsportal.com: {e}")
+            attrs["outcome"] = "error"
+        finally:
+            await page.close()
+    return context
+
+class WorkerPage:
+    """
+    Long-lived tab of one worker, navigated from match to match instead of
+    opening and closing a tab for each of them.
+
+    `acquire()` returns the page for the next match and `reset()` blanks it
+    once the match is done. The tab is replaced when it crashed or was closed,
+    and after `max_navigations` matches, to bound the memory its renderer keeps.
+    """
+
+    def __init__(self, context, max_navigations=PAGE_NAVIGATION_LIMIT):
+        self.context = context
+        self.max_navigations = max_navigations
+        self.page = None
+        self.navigations = 0
+        self.crashed = False
+
+    async def acquire(self):
+        if self.page is not None and (self.crashed or self.page.is_closed() or self.navigations >= self.max_navigations):
+            await self.discard()
+        if self.page is None:
+            self.page = await self.context.new_page()
+            self.page.on("crash", self._on_crash)
+            metrics.inc("pages_opened_total")
+        self.navigations += 1
+        return self.page
+
+    def _on_crash(self, page):
+        print("Worker page crashed, it will be replaced")
+        self.crashed = True
+        metrics.inc("page_crashes_total")
+
+    async def reset(self):
+        """Unloads the last match (its timers, requests and hover state) before the next one."""
+        if self.page is None or self.crashed or self.page.is_closed():
+            return
+        try:
+            await self.page.goto("about:blank", timeout=5000)
+        except Exception as e:
+            print(f"Failed to reset the worker page, it will be replaced: {e}")
+            await self.discard()
+
+    async def discard(self):
+        page, self.page = self.page, None
+        self.navigations = 0
+        self.crashed = False
+        if page is not None and not page.is_closed():
             try:
-                await page.goto("https://www.oddsportal.com", wait_until="domcontentloaded", timeout=30000)
-                break
-            except TimeoutError:
-                print("Retrying navigation...")
-                if _ > 1:
-                    await context.close()
-                    await browser.close()
-                    browser = await p.chromium.launch(headless=True)
-                    context = await browser.new_context()
-                    page = await context.new_page()
-            await asyncio.sleep(random.uniform(3, 6))
-        await handle_cookie_consent(page)
-        await page.close()
-    return browser, context 
+                await page.close()
+            except Exception:
+                pass
+
+    async def close(self):
+        await self.discard()
+
 
 async def wait_for_locator(locator, retries=3, timeout=5000):
     for _ in range(retries):
@@ -96,12 +301,12 @@ async def wait_for_locator(locator, retries=3, timeout=5000):
 
 
 async def remove_overlays(page):
-    """Supprime les overlays connus qui bloquent hover ou clic."""
-    await page.evaluate("""() => {
-        const overlays = document.querySelectorAll(
-            '#onetrust-policy, .overlay-bookie-modal, [class*="overlay"]'
-        );
-        overlays.forEach(el => el.remove());
-    }""")
-    await page.evaluate("window.scrollTo(0, 0);")
-    await asyncio.sleep(0.5)
+    """
+    Supprime les overlays connus qui bloquent hover ou clic, en un seul aller-retour.
+    Dans les contextes créés par new_session_context, le script de démarrage les masque déjà.
+    """
+    with span("remove_overlays"):
+        await page.evaluate("""(selectors) => {
+            document.querySelectorAll(selectors).forEach(el => el.remove());
+            window.scrollTo(0, 0);
+        }""", OVERLAY_SELECTORS)
@@ -0,0 +1,121 @@
+import argparse
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Summarize tracing spans written with --tracefile')
+    parser.add_argument('paths', nargs='*', default=["logs/traces"],
+                       help='Trace files or directories containing *.jsonl trace files (default: logs/traces)')
+    parser.add_argument('--top', type=int, default=10,
+                       help='Number of slowest matches to display')
+    return parser.parse_args()
+
+
+def load_spans(paths):
+    """Load every span of the given trace files or directories"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.jsonl")))
+        elif path.exists():
+            files.append(path)
+
+    spans = []
+    for trace_file in files:
+        with open(trace_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # last line of a trace still being written
+                    continue
+    return spans
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(spans):
+    """
+    Aggregate spans per stage name.
+
+    The self time of a span is its duration minus the duration of its direct
+    children, so that nested stages (eg. goto inside match_details) are not
+    counted twice. Children running concurrently (matches inside a batch) can
+    exceed their parent, in which case the self time is 0.
+    """
+    children_time = defaultdict(float)
+    for record in spans:
+        if record.get("parent"):
+            children_time[record["parent"]] += record["duration"]
+
+    stages = defaultdict(lambda: {"durations": [], "self": 0.0, "outcomes": Counter()})
+    for record in spans:
+        stage = stages[record["name"]]
+        stage["durations"].append(record["duration"])
+        stage["self"] += max(0.0, record["duration"] - children_time.get(record["id"], 0.0))
+        stage["outcomes"][record.get("outcome", "ok")] += 1
+
+    for stage in stages.values():
+        stage["durations"].sort()
+    return stages
+
+
+def print_summary(spans, top=10):
+    """Print where the time went during the traced runs"""
+    if not spans:
+        print("No spans found.")
+        return
+
+    starts = [record["start"] for record in spans]
+    ends = [record["start"] + record["duration"] for record in spans]
+    wall_time = max(ends) - min(starts)
+    stages = summarize(spans)
+    total_self = sum(stage["self"] for stage in stages.values()) or 1.0
+
+    print(f"Spans: {len(spans)} - wall time: {wall_time:.1f}s")
+    print()
+    print(f"{'stage':<22}{'count':>8}{'total s':>11}{'self s':>11}{'self %':>8}{'mean s':>9}{'p95 s':>9}{'max s':>9}  outcomes")
+    print("-" * 110)
+    for name, stage in sorted(stages.items(), key=lambda item: item[1]["self"], reverse=True):
+        durations = stage["durations"]
+        outcomes = ", ".join(f"{outcome}={count}" for outcome, count in stage["outcomes"].most_common())
+        print(
+            f"{name:<22}{len(durations):>8}{sum(durations):>11.1f}{stage['self']:>11.1f}"
+            f"{100 * stage['self'] / total_self:>7.1f}%{sum(durations) / len(durations):>9.2f}"
+            f"{percentile(durations, 0.95):>9.2f}{durations[-1]:>9.2f}  {outcomes}"
+        )
+
+    matches = sorted(
+        (record for record in spans if record["name"] == "match_details"),
+        key=lambda record: record["duration"],
+        reverse=True
+    )
+    if matches and top > 0:
+        print()
+        print("Slowest matches:")
+        for record in matches[:top]:
+            print(f"  {record['duration']:>8.1f}s  {record.get('outcome', 'ok'):<22} {record.get('url')}")
+
+    retried = Counter(
+        record.get("url") for record in spans
+        if record["name"] == "goto" and record.get("attempt", 1) > 1
+    )
+    if retried:
+        print()
+        print(f"Navigation retries: {sum(retried.values())} on {len(retried)} URLs")
+        for url, count in retried.most_common(top):
+            print(f"  {count:>4}  {url}")
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    print_summary(load_spans(args.paths), top=args.top)
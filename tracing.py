@@ -0,0 +1,126 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+from inspect import signature
+from job_log import log_context
+
+_trace_file = None
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_traced_attrs = contextvars.ContextVar("traced_attrs", default=None)
+
+
+def configure_tracing(path):
+    """
+    Enables tracing for the current process.
+
+    Every span is appended as one JSON line to `path`. When tracing is not
+    configured, `span` only yields its attributes and writes nothing.
+    """
+    global _trace_file
+    close_tracing()
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _trace_file = open(path, "a", encoding="utf-8", buffering=1)
+
+
+def close_tracing():
+    """Closes the trace file if one is open."""
+    global _trace_file
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times a stage of the scraping and writes it to the trace file.
+
+    The yielded dict holds the span attributes (url, attempt, ...). The caller
+    can set `attrs["outcome"]` to describe how the stage ended, otherwise it is
+    "ok", "error" or "cancelled" depending on how the block exits.
+
+    Example:
+        with span("goto", url=url, attempt=attempt) as attrs:
+            ...
+            attrs["outcome"] = "timeout"
+    """
+    # the lines printed in the stage are logged with its name and URL (see job_log)
+    with log_context(stage=name, url=attrs.get("url")):
+        if _trace_file is None:
+            yield attrs
+            return
+        yield from _traced_span(name, attrs)
+
+
+def traced(name, url=None):
+    """
+    Runs every call of a coroutine function in a span, like a `with span(...)`
+    around its whole body without indenting it. `url` gives the URL of the span
+    from the arguments of the call, eg. `url=lambda args: args["game_url"]`, and
+    the body reads the attributes of its span with span_attrs().
+
+    Example:
+        @traced("listing", url=lambda args: args["url"])
+        async def get_history_matchs_rows(page, url, season):
+            listing_attrs = span_attrs()
+            ...
+    """
+    def decorator(func):
+        parameters = signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            attrs = {}
+            if url is not None:
+                attrs["url"] = url(parameters.bind(*args, **kwargs).arguments)
+            with span(name, **attrs) as attrs:
+                token = _traced_attrs.set(attrs)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _traced_attrs.reset(token)
+        return wrapper
+    return decorator
+
+
+def span_attrs():
+    """Attributes of the span of the running traced function (see traced)."""
+    return _traced_attrs.get()
+
+
+def _traced_span(name, attrs):
+    span_id = f"{os.getpid()}-{next(_span_ids)}"
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.time()
+    start_perf = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        if "outcome" not in attrs:
+            attrs["outcome"] = "cancelled" if type(e).__name__ == "CancelledError" else "error"
+            attrs["error"] = repr(e)[:300]
+        raise
+    finally:
+        _current_span.reset(token)
+        record = {
+            "name": name,
+            "id": span_id,
+            "parent": parent_id,
+            "start": round(start, 3),
+            "duration": round(time.perf_counter() - start_perf, 4),
+            "outcome": attrs.pop("outcome", "ok"),
+        }
+        record.update(attrs)
+        try:
+            _trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except (ValueError, AttributeError):
+            # trace file closed while the span was running
+            pass
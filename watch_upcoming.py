@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import heapq
+from datetime import datetime
+from playwright.async_api import async_playwright
+from match_scraper import limited_process_game
+from test_get_match_history import load_listing_urls
+from test_website_navigation import open_warm_context, WorkerPage
+from browser_server import configure_browser_server, launch_browser
+from manage_links import generate_links_game
+from manage_date import datetime_to_timestamp
+from snapshot_store import save_upcoming_snapshot
+from save_data import save_odds_data
+from event_model import intern_text
+import metrics
+
+# (seconds before kickoff, seconds between two polls), the closer the kickoff the more frequent the polls
+POLL_INTERVALS = [
+    (30 * 60, 5 * 60),
+    (2 * 3600, 10 * 60),
+    (6 * 3600, 20 * 60),
+    (24 * 3600, 60 * 60),
+    (3 * 86400, 3 * 3600),
+    (7 * 86400, 6 * 3600),
+]
+FAR_POLL_INTERVAL = 12 * 3600
+FAILED_POLL_INTERVAL = 10 * 60
+CONTEXT_RECYCLE_POLLS = 100
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Watch the upcoming matches of a competition, polling matches more often as kickoff approaches')
+    parser.add_argument('--sport', default="Football")
+    parser.add_argument('--region', required=True, help='region name (eg. France)')
+    parser.add_argument('--competition', required=True, help='competition name (eg. "Ligue 1")')
+    parser.add_argument('--season', required=True, help='current season (eg. 2025/2026)')
+    parser.add_argument('--bookmaker', default="Betclic")
+    parser.add_argument('--listing-interval', type=int, default=3600,
+                       help='Seconds between two refreshes of the fixtures list (default: 3600)')
+    parser.add_argument('--max-pages', type=int, default=2,
+                       help='Number of match pages polled at the same time (default: 2)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                       help='Expose live metrics on 127.0.0.1:<port>/metrics')
+    parser.add_argument('--browser-server', default=None,
+                       help='Connect to the shared browser server (eg. http://127.0.0.1:9222, see browser_server.py)')
+    return parser.parse_args()
+
+
+def now_timestamp():
+    """Current local time in the unit of EventRecord.date_time."""
+    return datetime_to_timestamp(datetime.now())
+
+
+def poll_interval(seconds_to_kickoff):
+    """Returns the number of seconds to wait before polling a match again."""
+    for threshold, interval in POLL_INTERVALS:
+        if seconds_to_kickoff <= threshold:
+            return interval
+    return FAR_POLL_INTERVAL
+
+
+class WatchSchedule:
+    """
+    Schedule of the upcoming matches being watched.
+
+    Matches are kept in a heap ordered by their next poll time. A match is
+    polled immediately when it is first seen, then at `poll_interval` of its
+    kickoff, and dropped once the kickoff has passed.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.matches = {}
+
+    def add(self, url, when):
+        """Adds a fixture found in the listing, returns False if it was already watched."""
+        if url in self.matches:
+            return False
+        self.matches[url] = {"kickoff": None, "next_poll": when, "event": None}
+        heapq.heappush(self.heap, (when, url))
+        return True
+
+    def due(self, now, limit):
+        """Pops up to `limit` matches whose next poll time has come."""
+        urls = []
+        while self.heap and self.heap[0][0] <= now and len(urls) < limit:
+            when, url = heapq.heappop(self.heap)
+            match = self.matches.get(url)
+            # stale heap entry, the match was rescheduled or dropped
+            if match is None or match["next_poll"] != when:
+                continue
+            if match["kickoff"] is not None and match["kickoff"] <= now:
+                print(f"Match started, stop watching: {url}")
+                del self.matches[url]
+                continue
+            urls.append(url)
+        return urls
+
+    def polled(self, url, event, now):
+        """Stores the polled event and reschedules the match, or drops it once started."""
+        match = self.matches[url]
+        if event is not None:
+            match["event"] = event
+            match["kickoff"] = event.date_time
+        if match["kickoff"] is not None and match["kickoff"] <= now:
+            print(f"Match started, stop watching: {url}")
+            del self.matches[url]
+            return
+        if event is None:
+            delay = FAILED_POLL_INTERVAL
+        else:
+            delay = poll_interval(match["kickoff"] - now)
+        if match["kickoff"] is not None:
+            # never poll later than the kickoff itself
+            delay = max(60, min(delay, match["kickoff"] - now - 60))
+        match["next_poll"] = now + delay
+        heapq.heappush(self.heap, (match["next_poll"], url))
+
+    def next_poll_time(self):
+        """Earliest next poll time, or None if nothing is watched."""
+        while self.heap:
+            when, url = self.heap[0]
+            match = self.matches.get(url)
+            if match is not None and match["next_poll"] == when:
+                return when
+            heapq.heappop(self.heap)
+        return None
+
+    def events(self):
+        """Latest event of every watched match."""
+        return [match["event"] for match in self.matches.values() if match["event"] is not None]
+
+
+def worker_pages(context, count):
+    """Long-lived pages the polls borrow (see limited_process_game), one per page polled at the same time."""
+    idle_pages = asyncio.Queue()
+    for _ in range(count):
+        idle_pages.put_nowait(WorkerPage(context))
+    return idle_pages
+
+
+async def close_worker_pages(idle_pages):
+    while not idle_pages.empty():
+        await idle_pages.get_nowait().close()
+
+
+async def refresh_listing(context, listing_url, season, schedule):
+    """Adds the fixtures currently listed on the competition page to the schedule, returns their URLs (None if it failed)."""
+    page = await context.new_page()
+    try:
+        game_urls = await load_listing_urls(page, listing_url, season) or []
+    except Exception as e:
+        print(f"Failed to refresh listing {listing_url}: {e}")
+        return None
+    finally:
+        await page.close()
+
+    new_fixtures = sum(schedule.add(url, now_timestamp()) for url in game_urls)
+    print(f"Listing refreshed: {len(game_urls)} fixtures listed, {new_fixtures} new, {len(schedule.matches)} watched")
+    return game_urls
+
+
+async def watch_upcoming(sport, region, competition, season, bookmaker, listing_interval=3600, max_pages=2):
+    """
+    Long-running watch mode for the upcoming matches of a competition.
+
+    Each match is polled at a rate that increases as its kickoff approaches and
+    is no longer polled once started. The competition listing is refreshed every
+    `listing_interval` seconds to pick up new fixtures. After every poll round
+    the changes of the watched matches are appended to the upcoming snapshot
+    of the competition (see snapshot_store), fixtures being only removed from it
+    when a refreshed listing no longer lists them. The watched matches are also
+    saved as a regular upcoming dataset after every listing refresh.
+    """
+    listing_url = generate_links_game([(region, competition)], type_game="upcoming")[0]
+    odds_data = {
+        "sport": sport,
+        "region": intern_text(region),
+        "competition": intern_text(competition),
+        "season": season,
+        "market": "1X2 and Fulltime result",
+        "bookmaker": intern_text(bookmaker),
+        "events": []
+    }
+    schedule = WatchSchedule()
+    semaphore = asyncio.Semaphore(max_pages)
+
+    async with async_playwright() as p:
+        browser = await launch_browser(p)
+        context = await open_warm_context(browser)
+        idle_pages = worker_pages(context, max_pages)
+        next_listing = 0
+        polls_since_recycle = 0
+        try:
+            while True:
+                now = now_timestamp()
+                listed_urls = None
+                if now >= next_listing:
+                    listed_urls = await refresh_listing(context, listing_url, season, schedule)
+                    next_listing = now + listing_interval
+
+                urls = schedule.due(now, limit=max_pages * 10)
+                metrics.set_gauge("queue_depth", len(urls))
+                if urls:
+                    results = await asyncio.gather(*[
+                        limited_process_game(semaphore, context, url, bookmaker, season, idle_pages=idle_pages) for url in urls
+                    ])
+                    now = now_timestamp()
+                    for url, result in zip(urls, results):
+                        schedule.polled(url, result[0] if result and result != 1 else None, now)
+
+                if urls or listed_urls is not None:
+                    odds_data["events"] = schedule.events()
+                    save_upcoming_snapshot(odds_data, listed_urls=listed_urls)
+                    if listed_urls is not None and odds_data["events"]:
+                        save_odds_data(odds_data, type_game="upcoming")
+
+                if urls:
+                    polls_since_recycle += len(urls)
+                    if polls_since_recycle >= CONTEXT_RECYCLE_POLLS:
+                        await close_worker_pages(idle_pages)
+                        await context.close()
+                        context = await open_warm_context(browser)
+                        idle_pages = worker_pages(context, max_pages)
+                        metrics.inc("browser_restarts_total")
+                        polls_since_recycle = 0
+
+                next_poll = schedule.next_poll_time()
+                wake_up = next_listing if next_poll is None else min(next_poll, next_listing)
+                await asyncio.sleep(max(1, min(wake_up - now_timestamp(), 300)))
+        finally:
+            await close_worker_pages(idle_pages)
+            await context.close()
+            await browser.close()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    metrics.start_metrics(port=args.metrics_port)
+    configure_browser_server(args.browser_server)
+    try:
+        asyncio.run(watch_upcoming(args.sport, args.region, args.competition, args.season,
+                                   args.bookmaker, args.listing_interval, args.max_pages))
+    except KeyboardInterrupt:
+        print("Watch stopped.")
+    finally:
+        metrics.stop_metrics()
@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+import math
+import random
+from match_scraper import process_game
+from test_website_navigation import open_warm_context, WorkerPage
+from tracing import span
+import metrics
+import job_log
+
+
+class MatchPool:
+    """
+    Sliding-window pool of match workers.
+
+    `workers` matches are always in flight: as soon as one finishes, its
+    worker takes the next submitted URL, and results are yielded in the order
+    they finish (`async for url, tag, result in pool`). Each worker owns a
+    browser context that it recycles after `matches_per_context` matches, with
+    a short random pause, without waiting for the other workers, and scrapes
+    its matches in one long-lived page of that context (see WorkerPage).
+
+    URLs can be submitted while results are consumed; iteration ends once
+    `close()` was called and every submitted URL has produced a result.
+    The `tag` of a submission (eg. the team it belongs to) is returned with
+    its result.
+
+    Submissions are taken by increasing `order` (the submission order by
+    default, listings give the most recent matches first). Once a match is
+    found before the season start (result 1), the queued matches of the same
+    tag with a larger order are dropped and the ones in flight are cancelled
+    (see `cancel_after`), they produce no result.
+
+    Example:
+        async with MatchPool(browser, "Betclic", "2024/2025") as pool:
+            for url in game_urls:
+                pool.submit(url)
+            pool.close()
+            async for url, _, result in pool:
+                ...
+    """
+
+    def __init__(self, browser, bookmaker_name, season, workers=4, matches_per_context=100):
+        self.browser = browser
+        self.bookmaker_name = bookmaker_name
+        self.season = season
+        self.workers = workers
+        self.matches_per_context = matches_per_context
+        self.queue = asyncio.PriorityQueue()
+        self.results = asyncio.Queue()
+        self.pending = 0
+        self.closed = False
+        self.tasks = []
+        self.sequence = itertools.count()
+        self.cutoffs = {}
+        self.running = {}
+
+    async def __aenter__(self):
+        self.tasks = [asyncio.create_task(self._worker(worker_id)) for worker_id in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        metrics.set_gauge("queue_depth", 0)
+
+    def submit(self, url, tag=None, type_historical="competition", order=None, dataset=None):
+        """Queues a match URL, `dataset` is recorded with it if it fails (see dead_letters)."""
+        if self.closed:
+            # the workers already took their end markers, the URL would never be scraped
+            raise RuntimeError(f"Match submitted to a closed pool: {url}")
+        sequence = next(self.sequence)
+        if order is None:
+            order = sequence
+        if order > self.cutoffs.get(tag, math.inf):
+            return
+        self.pending += 1
+        self.queue.put_nowait((order, sequence, (url, tag, type_historical, dataset)))
+        metrics.set_gauge("queue_depth", self.queue.qsize())
+
+    def close(self):
+        """No more URLs will be submitted, `submit` raises from now on."""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.tasks:
+            self.queue.put_nowait((math.inf, next(self.sequence), None))
+        # wakes up an iteration waiting for results that will never come
+        self.results.put_nowait(None)
+
+    def cancel_after(self, tag, order):
+        """Drops the matches of `tag` coming after `order`, queued or in flight."""
+        if order >= self.cutoffs.get(tag, math.inf):
+            return
+        self.cutoffs[tag] = order
+        for running_tag, running_order, task in self.running.values():
+            if running_tag == tag and running_order > order:
+                task.cancel()
+
+    def _drop(self):
+        """A submitted match will produce no result."""
+        metrics.inc("matches_cancelled_total")
+        self.pending -= 1
+        # wakes up an iteration that may now be over
+        self.results.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self.closed and self.pending == 0:
+                raise StopAsyncIteration
+            item = await self.results.get()
+            if item is None:
+                continue
+            self.pending -= 1
+            url, tag, result, order = item
+            if order > self.cutoffs.get(tag, math.inf):
+                # finished while an earlier match was crossing the season start
+                metrics.inc("matches_cancelled_total")
+                continue
+            return url, tag, result
+
+    async def _worker(self, worker_id):
+        context = None
+        worker_page = None
+        processed = 0
+        try:
+            while True:
+                order, _, item = await self.queue.get()
+                if item is None:
+                    return
+                metrics.set_gauge("queue_depth", self.queue.qsize())
+                url, tag, type_historical, dataset = item
+                if order > self.cutoffs.get(tag, math.inf):
+                    self._drop()
+                    continue
+
+                if context is None:
+                    context = await open_warm_context(self.browser)
+                    worker_page = WorkerPage(context)
+                task = asyncio.create_task(process_game(context, url, self.bookmaker_name, self.season, type_historical, dataset, worker_page))
+                self.running[worker_id] = (tag, order, task)
+                try:
+                    await asyncio.wait({task})
+                finally:
+                    del self.running[worker_id]
+                    if not task.done():
+                        task.cancel()
+                if task.cancelled():
+                    print(f"Cancelled match after the season start: {url}")
+                    self._drop()
+                    continue
+                try:
+                    result = task.result()
+                except Exception as e:
+                    job_log.error(f"Failed to process match {url}: {e}", e, url=url)
+                    result = None
+                if result == 1:
+                    self.cancel_after(tag, order)
+                await self.results.put((url, tag, result, order))
+
+                processed += 1
+                if processed % self.matches_per_context == 0:
+                    # Recycle this worker's context to manage memory usage, the other workers keep going
+                    with span("worker_recycle", worker=worker_id):
+                        await worker_page.close()
+                        await context.close()
+                        context = None
+                        worker_page = None
+                        # Random sleep to mimic human behavior and avoid rate limiting
+                        await asyncio.sleep(random.uniform(2, 5))
+                    metrics.inc("browser_restarts_total")
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass